@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from instrumentation import increment, observe
+
+# Nombre de tâches de calcul exécutées en même temps par un serveur socket : chaque tâche
+# occupe déjà plusieurs cœurs (bandes de poids, pool de séquences)
+MAX_RUNNING_JOBS = max(1, (os.cpu_count() or 1) // 4)
+
+# Nombre maximal de tâches en attente : au-delà, les nouvelles tâches sont refusées
+MAX_QUEUED_JOBS = 8
+
+# Nombre maximal de tâches exécutées en même temps pour un même client, et de tâches de ce
+# client en attente derrière elles (au-delà, ses nouvelles tâches sont refusées)
+MAX_SESSION_JOBS = 1
+MAX_SESSION_QUEUED = 1
+
+# Niveaux de qualité dégradée, du plus dégradé au moins dégradé :
+# (tâches en attente à partir desquelles le niveau s'applique, pixels de travail maximaux,
+# itérations maximales de la simplification de palette)
+QUALITY_LEVELS = (
+    (6, 512 * 512, 100),
+    (3, 1024 * 1024, 250),
+)
+
+
+class AdmissionRefused(Exception):
+    """
+    Tâche refusée par le contrôle d'admission (file pleine, client déjà occupé).
+    """
+
+
+class Quality:
+    """
+    Paramètres de qualité d'une tâche admise.
+
+    Attributs:
+      - max_pixels: nombre maximal de pixels de travail (None pour ne pas réduire l'image)
+      - max_iterations: nombre maximal d'itérations de la simplification de palette
+      - reason: explication destinée au client si la qualité est dégradée, None sinon
+    """
+
+    def __init__(self, max_pixels=None, max_iterations=500, reason=None):
+        self.max_pixels = max_pixels
+        self.max_iterations = max_iterations
+        self.reason = reason
+
+    def limit_pixels(self, max_pixels):
+        # Combine la limite de qualité avec une limite fixe (None pour aucune limite)
+        if max_pixels is None or self.max_pixels is None:
+            return self.max_pixels if max_pixels is None else max_pixels
+        return min(max_pixels, self.max_pixels)
+
+
+class AdmissionController:
+    """
+    Contrôle d'admission des tâches de calcul d'un serveur socket.
+
+    Au plus max_running tâches s'exécutent à la fois, dont au plus max_session par client ;
+    les suivantes attendent dans une file bornée à max_queued tâches (max_session_queued
+    par client), au-delà de laquelle elles sont refusées. Plus la file
+    est longue à l'admission d'une tâche, plus sa qualité est dégradée (voir QUALITY_LEVELS) :
+    la latence reste bornée et la mémoire consommée diminue quand la charge augmente.
+    """
+
+    def __init__(self, max_running=MAX_RUNNING_JOBS, max_queued=MAX_QUEUED_JOBS, max_session=MAX_SESSION_JOBS,
+                 max_session_queued=MAX_SESSION_QUEUED, quality_levels=QUALITY_LEVELS):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.max_session = max_session
+        self.max_session_queued = max_session_queued
+        self.quality_levels = quality_levels
+        self._condition = threading.Condition()
+        self._running = 0
+        self._queued = 0
+        # Tâches (en cours, en attente) de chaque client
+        self._sessions = {}
+
+    def quality(self, queued):
+        """
+        Retourne la qualité (Quality) d'une tâche admise alors que queued tâches attendent.
+        """
+        for min_queued, max_pixels, max_iterations in self.quality_levels:
+            if queued >= min_queued:
+                return Quality(max_pixels, max_iterations,
+                               f"Serveur chargé ({queued} tâches en attente) : image réduite à "
+                               f"{max_pixels / 1e6:.2f} Mpx et simplification limitée à {max_iterations} itérations")
+        return Quality()
+
+    @contextmanager
+    def job(self, session_id, name='job'):
+        """
+        Admet une tâche et attend qu'une place d'exécution se libère.
+
+        Utilisation :
+            with admission.job(request.sid, 'upload_image') as quality:
+                ...
+
+        Paramètres:
+          - session_id: identifiant du client
+          - name: nom de la tâche (étiquette des métriques)
+
+        Retourne:
+          - Un gestionnaire de contexte qui fournit la qualité (Quality) de la tâche
+
+        Lève:
+          - AdmissionRefused si la file est pleine ou si le client a trop de tâches
+        """
+        with self._condition:
+            running, queued = self._sessions.get(session_id, (0, 0))
+            waiting = self._running >= self.max_running or running >= self.max_session
+            if waiting and queued >= self.max_session_queued:
+                increment('admission_refused', (('request', name), ('reason', 'session')))
+                raise AdmissionRefused("Une tâche est déjà en attente pour ce client, veuillez patienter.")
+            if waiting and self._queued >= self.max_queued:
+                increment('admission_refused', (('request', name), ('reason', 'queue')))
+                raise AdmissionRefused("Serveur surchargé, veuillez réessayer dans quelques instants.")
+            quality = self.quality(self._queued)
+            self._sessions[session_id] = (running, queued + 1)
+            self._queued += 1
+
+            t0 = time.perf_counter()
+            while self._running >= self.max_running or self._sessions[session_id][0] >= self.max_session:
+                self._condition.wait()
+            running, queued = self._sessions[session_id]
+            self._sessions[session_id] = (running + 1, queued - 1)
+            self._queued -= 1
+            self._running += 1
+        observe('admission_wait_seconds', (('request', name),), time.perf_counter() - t0)
+
+        try:
+            yield quality
+        finally:
+            with self._condition:
+                self._running -= 1
+                running, queued = self._sessions[session_id]
+                if running == 1 and not queued:
+                    del self._sessions[session_id]
+                else:
+                    self._sessions[session_id] = (running - 1, queued)
+                # Les tâches en attente n'attendent pas toutes la même condition (place globale ou du client)
+                self._condition.notify_all()
@@ -0,0 +1,477 @@
+"""
+Décomposition d'images par lots, sans navigateur : palette simplifiée, couches
+de mélange RGBXY, harmonisations et images recolorées.
+
+Les images sont réparties sur un pool de processus (une image par processus,
+calculée par un seul thread). Pour chaque image, nommée par son chemin relatif
+extension comprise (ex: vacances/a.jpg), le dossier de sortie contient :
+  - <nom>/palette.json : palette (RGB dans [0, 255]), palettes de la hiérarchie,
+    harmonisations et temps par étape
+  - <nom>/layers/layer_<i>.png : couche i (couleur de la palette, poids en transparence)
+  - <nom>/recolored/<harmonie>.<format> : image recolorée avec chaque harmonisation
+
+Chaque image terminée (ou en échec) est ajoutée au journal progress.jsonl du
+dossier de sortie : relancer la même commande reprend le lot là où il s'était
+arrêté. Le débit (images/s, Mpx/s) est affiché au fil du calcul.
+
+Exemples :
+    python batch_processing.py photos/ resultats/ --processes 8
+    find photos -name '*.jpg' | python batch_processing.py - resultats/
+    python batch_processing.py photos/ resultats/ --harmonies complementary-harmony triadic-harmony --no-layers
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from image_decomposition import extract_rgbxy_weights
+from image_preprocessing import normalize_input_image
+from image_recoloring import EXPORT_FORMATS, quantize_weights, recolor_stream
+from instrumentation import request_profile
+from palette_harmonization import TEMPLATES, harmonize_palette
+from palette_simplification import simplify_convex_palette
+from progress import CollectingSink
+
+# Extensions des images lues dans un dossier
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff')
+
+# Journal des images traitées, dans le dossier de sortie (une ligne JSON par image)
+PROGRESS_FILE = 'progress.jsonl'
+
+# Dossier des lots lancés par l'API HTTP des serveurs socket (un sous-dossier par lot)
+BATCH_ROOT = 'batch_jobs'
+
+PALETTE_SIZE = 6
+MAX_ITERATIONS = 500
+
+# Intervalle minimal (en secondes) entre deux affichages du débit
+REPORT_INTERVAL = 10
+
+
+def unique_name(name, seen):
+    # Ajoute un suffixe (_1, _2...) avant l'extension d'un nom déjà vu, et l'enregistre dans seen
+    stem, extension = os.path.splitext(name)
+    unique, index = name, 1
+    while unique in seen:
+        unique, index = f"{stem}_{index}{extension}", index + 1
+    seen.add(unique)
+    return unique
+
+
+def image_sources(source):
+    """
+    Énumère les images d'un lot.
+
+    Paramètres:
+      - source: dossier (parcouru récursivement, dans l'ordre alphabétique), fichier image,
+        ou '-' pour lire les chemins des images sur l'entrée standard (un par ligne, au fil de l'eau)
+
+    Retourne:
+      - Une liste de (nom, chemin), ou un générateur pour l'entrée standard. Le nom (chemin relatif
+        au dossier, ou nom du fichier, extension comprise) identifie l'image dans le dossier de sortie
+        et dans le journal : il est unique dans le lot (a.png et a.jpg sont deux images distinctes, et
+        un nom de fichier déjà lu sur l'entrée standard reçoit un suffixe, voir unique_name).
+    """
+    if source == '-':
+        seen = set()
+        return ((unique_name(os.path.basename(line.strip()), seen), line.strip())
+                for line in sys.stdin if line.strip())
+    if os.path.isfile(source):
+        return [(os.path.basename(source), source)]
+
+    sources = []
+    for directory, subdirectories, names in os.walk(source):
+        subdirectories.sort()
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(directory, name)
+                sources.append((os.path.relpath(path, source).replace(os.sep, '/'), path))
+    return sources
+
+
+def read_progress(output_dir):
+    """
+    Relit le journal d'un lot.
+
+    Retourne:
+      - Un dictionnaire {nom: dernier enregistrement de l'image} (vide si le lot n'a jamais été lancé)
+    """
+    records = {}
+    path = os.path.join(output_dir, PROGRESS_FILE)
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Dernière ligne tronquée par un arrêt brutal : l'image sera recalculée
+                continue
+            records[record['name']] = record
+    return records
+
+
+def write_png(path, image):
+    # imencode + écriture Python plutôt que imwrite, qui échoue silencieusement sur les chemins non ASCII
+    ok, encoded = cv2.imencode('.png', image)
+    if not ok:
+        raise ValueError(f"Échec de l'encodage PNG : {path}")
+    with open(path, 'wb') as f:
+        f.write(encoded.tobytes())
+
+
+def write_outputs(directory, vertices, weights, harmonies, layers, image_format):
+    """
+    Écrit les couches et les images recolorées d'une image décomposée.
+
+    Paramètres:
+      - directory: dossier de l'image
+      - vertices: palette (N, 3) RGB dans [0, 255]
+      - weights: poids de mélange (H, W, N) en uint8
+      - harmonies: {nom: {'palette', 'rate'}} (voir harmonize_palette)
+      - layers: écrit aussi les couches
+      - image_format: format des images recolorées (voir image_recoloring.EXPORT_FORMATS)
+
+    Retourne:
+      - La liste des fichiers écrits, relatifs à directory
+    """
+    files = []
+    if layers:
+        os.makedirs(os.path.join(directory, 'layers'))
+        for index, (r, g, b) in enumerate(vertices):
+            # Couche en BGRA : couleur unie de la palette, poids du pixel en transparence
+            layer = np.empty(weights.shape[:2] + (4,), dtype=np.uint8)
+            layer[..., :3] = (b, g, r)
+            layer[..., 3] = weights[..., index]
+            files.append(f"layers/layer_{index}.png")
+            write_png(os.path.join(directory, files[-1]), layer)
+
+    os.makedirs(os.path.join(directory, 'recolored'))
+    for name, harmony in harmonies.items():
+        _, stream = recolor_stream(weights, harmony['palette'], image_format)
+        files.append(f"recolored/{name}.{image_format}")
+        with open(os.path.join(directory, files[-1]), 'wb') as f:
+            for chunk in stream:
+                f.write(chunk)
+    return files
+
+
+def process_image(task):
+    """
+    Décompose une image du lot et écrit ses résultats (tâche exécutée dans un processus du pool).
+
+    Les résultats sont d'abord écrits dans un dossier temporaire, renommé une fois
+    complet : un lot interrompu ne laisse jamais de dossier d'image incomplet.
+
+    Paramètres:
+      - task: (nom, chemin de l'image, dossier de sortie, options (voir run_batch))
+
+    Retourne:
+      - L'enregistrement de l'image pour le journal : nom, source, statut ('done' ou 'failed'),
+        durée, pixels de travail, palette et fichiers écrits (ou message d'erreur)
+    """
+    name, path, output_dir, options = task
+    record = {'name': name, 'source': path}
+    t0 = time.perf_counter()
+    directory = os.path.join(output_dir, name)
+    partial = directory + '.partial'
+    try:
+        with open(path, 'rb') as f:
+            img_bytes = f.read()
+        with request_profile('batch_image') as profile:
+            pixels, error = normalize_input_image(img_bytes, max_pixels=options['max_pixels'])
+            if pixels is None:
+                raise ValueError(error)
+
+            sink = CollectingSink()
+            palette = simplify_convex_palette(pixels, options['palette_size'], options['max_iterations'], sink=sink)
+            if palette is None:
+                raise ValueError("; ".join(sink.errors) or "Échec de la simplification de la palette")
+            # Le pool occupe déjà tous les cœurs : chaque image est calculée par un seul thread
+            mix_weights = extract_rgbxy_weights(palette['vertices'], pixels, sink=sink, workers=1)
+            if mix_weights is None:
+                raise ValueError("; ".join(sink.errors) or "Échec de la décomposition")
+
+            vertices = np.rint(palette['vertices'] * 255).astype(int).tolist()
+            harmonies = harmonize_palette(vertices)
+            if options['harmonies'] is not None:
+                harmonies = {key: harmonies[key] for key in options['harmonies']}
+
+            shutil.rmtree(partial, ignore_errors=True)
+            os.makedirs(partial)
+            files = write_outputs(partial, vertices, quantize_weights(mix_weights), harmonies, options['layers'],
+                                  options['format'])
+
+        height, width = pixels.shape[:2]
+        summary = {
+            'source': path,
+            'width': width,
+            'height': height,
+            'palette': vertices,
+            'hierarchy': {size: np.rint(snapshot['vertices'] * 255).astype(int).tolist()
+                          for size, snapshot in sorted(palette['hierarchy'].items())},
+            'harmonies': harmonies,
+            'stages': {stage: entry['seconds'] for stage, entry in profile.stages.items()},
+        }
+        with open(os.path.join(partial, 'palette.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        files.insert(0, 'palette.json')
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(partial, directory)
+        record.update(status='done', pixels=height * width, palette=vertices, files=files)
+    except Exception as e:
+        shutil.rmtree(partial, ignore_errors=True)
+        record.update(status='failed', error=str(e) or type(e).__name__)
+    record['seconds'] = time.perf_counter() - t0
+    return record
+
+
+class BatchProgress:
+    """
+    Avancement et débit d'un lot.
+
+    Attributs:
+      - total: nombre d'images du lot (None si inconnu, entrée standard)
+      - skipped: images déjà traitées lors d'un lancement précédent
+      - done, failed: images traitées pendant ce lancement, avec succès ou en échec
+      - pixels: pixels de travail des images traitées avec succès
+    """
+
+    def __init__(self, total=None, skipped=0):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.pixels = 0
+        self.t0 = time.perf_counter()
+
+    def update(self, record):
+        if record['status'] == 'done':
+            self.done += 1
+            self.pixels += record['pixels']
+        else:
+            self.failed += 1
+
+    def summary(self):
+        seconds = time.perf_counter() - self.t0
+        processed = self.done + self.failed
+        images_per_second = processed / seconds if seconds > 0 else 0.0
+        remaining = None if self.total is None else self.total - self.skipped - processed
+        return {
+            'total': self.total,
+            'skipped': self.skipped,
+            'done': self.done,
+            'failed': self.failed,
+            'seconds': seconds,
+            'images_per_second': images_per_second,
+            'megapixels_per_second': self.pixels / 1e6 / seconds if seconds > 0 else 0.0,
+            'eta_seconds': remaining / images_per_second if remaining and images_per_second else None,
+        }
+
+    def format(self):
+        summary = self.summary()
+        processed = summary['done'] + summary['failed']
+        line = f"{processed + summary['skipped']}" + (f"/{summary['total']}" if summary['total'] is not None else '')
+        line += (f" images ({summary['failed']} en échec), {summary['images_per_second']:.2f} images/s, "
+                 f"{summary['megapixels_per_second']:.2f} Mpx/s")
+        if summary['eta_seconds'] is not None:
+            line += f", fin estimée dans {summary['eta_seconds'] / 60:.1f} min"
+        return line
+
+
+def check_options(harmonies, image_format):
+    # Lève ValueError si une harmonisation ou le format d'export est inconnu
+    if harmonies is not None and any(name not in TEMPLATES for name in harmonies):
+        raise ValueError(f"Harmonisations inconnues : {', '.join(sorted(set(harmonies) - set(TEMPLATES)))}")
+    if image_format not in EXPORT_FORMATS:
+        raise ValueError(f"Format d'export inconnu : {image_format}")
+
+
+def batch_options(form):
+    """
+    Lit les options d'un lot envoyées à l'API HTTP (champs de formulaire).
+
+    Paramètres:
+      - form: dictionnaire de chaînes (palette_size, harmonies séparées par des virgules,
+        layers '0' ou '1', format)
+
+    Retourne:
+      - Les paramètres correspondants de run_batch
+
+    Lève:
+      - ValueError si une option est invalide
+    """
+    options = {}
+    if form.get('palette_size'):
+        options['palette_size'] = int(form['palette_size'])
+        if options['palette_size'] < 4:
+            raise ValueError("La palette doit contenir au moins 4 couleurs")
+    if form.get('harmonies'):
+        options['harmonies'] = [name.strip() for name in form['harmonies'].split(',')]
+    if form.get('layers'):
+        options['layers'] = form['layers'] not in ('0', 'false')
+    if form.get('format'):
+        options['image_format'] = form['format']
+    check_options(options.get('harmonies'), options.get('image_format', 'png'))
+    return options
+
+
+def run_batch(sources, output_dir, processes=None, palette_size=PALETTE_SIZE, max_pixels=None,
+              max_iterations=MAX_ITERATIONS, harmonies=None, layers=True, image_format='png', retry_failed=False,
+              progress=None, report=print, report_interval=REPORT_INTERVAL):
+    """
+    Décompose un lot d'images sur un pool de processus.
+
+    Les images déjà présentes dans le journal du dossier de sortie (voir read_progress) sont
+    ignorées ; celles en échec ne sont recalculées qu'avec retry_failed. Chaque image terminée
+    est ajoutée au journal dès que son processus la rend.
+
+    Paramètres:
+      - sources: itérable de (nom, chemin) (voir image_sources)
+      - output_dir: dossier de sortie
+      - processes: nombre de processus (None pour un par cœur)
+      - palette_size: nombre de couleurs visé
+      - max_pixels: nombre maximal de pixels de travail par image (None pour la pleine résolution)
+      - max_iterations: nombre maximal de fusions de la simplification de palette
+      - harmonies: noms des harmonisations appliquées (voir palette_harmonization.TEMPLATES), None pour toutes
+      - layers: écrit aussi les couches de chaque image
+      - image_format: format des images recolorées ('png' ou 'webp')
+      - retry_failed: recalcule les images en échec lors d'un lancement précédent
+      - progress: BatchProgress à mettre à jour (suivi depuis un autre thread), créé si None
+      - report: fonction appelée avec une ligne d'avancement, au plus toutes les report_interval secondes
+        et à la fin du lot (None pour ne rien afficher)
+
+    Retourne:
+      - Le BatchProgress du lot
+    """
+    check_options(harmonies, image_format)
+    options = {'palette_size': palette_size, 'max_pixels': max_pixels, 'max_iterations': max_iterations,
+               'harmonies': harmonies, 'layers': layers, 'format': image_format}
+
+    os.makedirs(output_dir, exist_ok=True)
+    previous = read_progress(output_dir)
+    finished = {name for name, record in previous.items() if record['status'] == 'done' or not retry_failed}
+    total = len(sources) if hasattr(sources, '__len__') else None
+    progress = progress if progress is not None else BatchProgress()
+    progress.total = total
+    progress.skipped = 0
+
+    def tasks():
+        seen = set()
+        for name, path in sources:
+            # Deux images de même nom écriraient dans le même dossier : la seconde est renommée
+            name = unique_name(name, seen)
+            if name in finished:
+                progress.skipped += 1
+                continue
+            yield name, path, output_dir, options
+
+    # Processus issus du fork server quand il existe (voir sequence_decomposition.decompose_sequence)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    processes = processes or os.cpu_count() or 1
+    last_report, reported = time.perf_counter(), False
+    with open(os.path.join(output_dir, PROGRESS_FILE), 'a', encoding='utf-8') as journal:
+        with context.Pool(processes) as pool:
+            for record in pool.imap_unordered(process_image, tasks()):
+                journal.write(json.dumps(record) + '\n')
+                journal.flush()
+                progress.update(record)
+                reported = False
+                if record['status'] == 'failed' and report is not None:
+                    report(f"Échec de {record['name']} : {record['error']}")
+                if report is not None and time.perf_counter() - last_report >= report_interval:
+                    report(progress.format())
+                    last_report, reported = time.perf_counter(), True
+    if report is not None and not reported:
+        report(progress.format())
+    return progress
+
+
+class BatchJob:
+    """
+    Lot lancé par l'API HTTP d'un serveur socket : images envoyées, résultats et avancement.
+
+    Les images sont enregistrées dans <root>/<id>/inputs et les résultats écrits dans
+    <root>/<id>/outputs (voir run_batch). L'état passe de 'queued' à 'running', puis
+    à 'done' ou 'failed'.
+    """
+
+    def __init__(self, job_id, options, root=BATCH_ROOT):
+        self.id = job_id
+        self.options = options
+        self.directory = os.path.join(root, job_id)
+        self.inputs = os.path.join(self.directory, 'inputs')
+        self.outputs = os.path.join(self.directory, 'outputs')
+        self.state = 'queued'
+        self.error = None
+        self.progress = BatchProgress()
+        self.finished = threading.Event()
+        os.makedirs(self.inputs)
+
+    def add_image(self, filename, image):
+        # image : fichier reçu (werkzeug FileStorage) ; les noms en double reçoivent un suffixe (voir unique_name),
+        # le nom du fichier enregistré, extension comprise, est celui de l'image dans les résultats
+        image.save(os.path.join(self.inputs, unique_name(filename, set(os.listdir(self.inputs)))))
+
+    def run(self):
+        self.state = 'running'
+        try:
+            run_batch(image_sources(self.inputs), self.outputs, progress=self.progress, report=None, **self.options)
+            self.state = 'done'
+        except Exception as e:
+            self.fail(str(e))
+        finally:
+            self.finished.set()
+
+    def fail(self, message):
+        self.state = 'failed'
+        self.error = message
+        self.finished.set()
+
+    def status(self):
+        """
+        Retourne l'état du lot, son avancement (voir BatchProgress.summary) et l'enregistrement
+        de chaque image traitée (voir process_image).
+        """
+        return dict(self.progress.summary(), id=self.id, state=self.state, error=self.error,
+                    results=list(read_progress(self.outputs).values()))
+
+    def delete(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Décomposition et harmonisation d'images par lots")
+    parser.add_argument('input', help="dossier d'images, fichier image, ou '-' pour lire les chemins sur l'entrée standard")
+    parser.add_argument('output', help="dossier de sortie (le lot reprend là où il s'était arrêté)")
+    parser.add_argument('--processes', type=int, help="nombre de processus (un par cœur par défaut)")
+    parser.add_argument('--palette-size', type=int, default=PALETTE_SIZE)
+    parser.add_argument('--max-pixels', type=int, help="pixels de travail maximaux par image (pleine résolution par défaut)")
+    parser.add_argument('--max-iterations', type=int, default=MAX_ITERATIONS)
+    parser.add_argument('--harmonies', nargs='+', choices=list(TEMPLATES), help="harmonisations appliquées (toutes par défaut)")
+    parser.add_argument('--format', default='png', choices=list(EXPORT_FORMATS), help="format des images recolorées")
+    parser.add_argument('--no-layers', action='store_true', help="n'écrit pas les couches")
+    parser.add_argument('--retry-failed', action='store_true', help="recalcule les images en échec lors d'un lancement précédent")
+    parser.add_argument('--report-interval', type=float, default=REPORT_INTERVAL, help="secondes entre deux affichages du débit")
+    args = parser.parse_args(argv)
+
+    if args.input != '-' and not os.path.exists(args.input):
+        parser.error(f"entrée introuvable : {args.input}")
+    progress = run_batch(image_sources(args.input), args.output, args.processes, args.palette_size, args.max_pixels,
+                         args.max_iterations, args.harmonies, not args.no_layers, args.format, args.retry_failed,
+                         report=lambda line: print(line, flush=True), report_interval=args.report_interval)
+    print(f"Résultats écrits dans {args.output}")
+    return 1 if progress.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,496 @@
+"""
+Banc d'essai reproductible du pipeline (simplification, décomposition, harmonisation).
+
+Chaque cas (image synthétique ou image de la galerie ids.json, à une résolution
+donnée) est exécuté dans un processus neuf pour que le pic de mémoire mesuré
+lui soit propre. Les résultats sont écrits en JSON et comparés à une référence
+enregistrée pour signaler les régressions.
+
+Exemples :
+    python benchmark.py --resolutions 0.25 1 --gallery 2
+    python benchmark.py --update-baseline
+    python benchmark.py --point-location --resolutions 0.25 1
+    python benchmark.py --kernels --resolutions 0.25 1
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+
+RESOLUTIONS = [0.25, 1, 4, 12]  # en mégapixels
+SYNTHETIC_IMAGES = ['gradient', 'blobs', 'noise']
+GALLERY_URL = "https://jhune.dev/form/harmony/{id}/{id}.png"
+GALLERY_CACHE = '.benchmark_cache'
+OUTPUT_PATH = 'benchmark_results.json'
+BASELINE_PATH = 'benchmark_baseline.json'
+PALETTE_SIZE = 6
+SEED = 42
+
+# Écart relatif toléré avant de signaler une régression
+TOLERANCE = 0.2
+
+
+# -------------------------------
+# IMAGES
+# -------------------------------
+def image_size(megapixels, aspect=4 / 3):
+    # On calcule (hauteur, largeur) pour un nombre de mégapixels et un ratio donnés.
+    width = int(round(np.sqrt(megapixels * 1e6 * aspect)))
+    height = int(round(megapixels * 1e6 / width))
+    return height, width
+
+
+def synthetic_image(name, height, width, seed=SEED):
+    """
+    Génère une image RGB déterministe (valeurs quantifiées sur 8 bits, dans [0, 1]).
+
+    Paramètres:
+      - name: "gradient" (dégradé lisse), "blobs" (taches de couleurs franches) ou "noise" (bruit fort)
+      - height, width: dimensions de l'image
+      - seed: graine du générateur aléatoire
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    u, v = xx / float(width), yy / float(height)
+
+    if name == 'gradient':
+        img = np.dstack((u, v, 0.5 + 0.5 * np.sin(6 * u) * np.cos(4 * v)))
+        img += rng.normal(0, 0.01, img.shape)
+    elif name == 'blobs':
+        img = np.full((height, width, 3), 0.1)
+        for _ in range(8):
+            center = rng.random(2)
+            radius = 0.05 + 0.2 * rng.random()
+            color = rng.random(3)
+            mask = np.exp(-((u - center[0]) ** 2 + (v - center[1]) ** 2) / (2 * radius ** 2))
+            img = img * (1 - mask[..., None]) + color * mask[..., None]
+    elif name == 'noise':
+        img = 0.5 + 0.25 * rng.standard_normal((height, width, 3))
+    else:
+        raise ValueError(f"Image synthétique inconnue : {name}")
+
+    return np.round(np.clip(img, 0, 1) * 255) / 255
+
+
+def gallery_path(img_id, cache_dir=GALLERY_CACHE):
+    return os.path.join(cache_dir, f"{img_id}.png")
+
+
+def download_gallery(count, cache_dir=GALLERY_CACHE):
+    """
+    Télécharge (une seule fois) les count premières images de ids.json dans le cache.
+
+    Retourne:
+      - La liste des identifiants disponibles localement
+    """
+    img_ids = json.load(open('./ids.json'))[:count]
+    os.makedirs(cache_dir, exist_ok=True)
+    available = []
+    for img_id in img_ids:
+        path = gallery_path(img_id, cache_dir)
+        if not os.path.exists(path):
+            try:
+                # On télécharge dans un fichier temporaire pour ne jamais garder d'image tronquée
+                urllib.request.urlretrieve(GALLERY_URL.format(id=img_id), path + '.part')
+                os.replace(path + '.part', path)
+            except OSError as e:
+                print(f"Image de galerie indisponible ({img_id}) : {e}")
+                continue
+        available.append(img_id)
+    return available
+
+
+def gallery_image(img_id, height, width, cache_dir=GALLERY_CACHE):
+    # On charge une image de la galerie et on la redimensionne à la résolution demandée.
+    import cv2
+
+    img = cv2.imread(gallery_path(img_id, cache_dir), cv2.IMREAD_COLOR)
+    interpolation = cv2.INTER_AREA if img.shape[0] * img.shape[1] > height * width else cv2.INTER_CUBIC
+    img = cv2.resize(img, (width, height), interpolation=interpolation)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB) / 255.0
+
+
+# -------------------------------
+# EXÉCUTION D'UN CAS
+# -------------------------------
+def run_case(case):
+    """
+    Exécute les étapes du pipeline sur un cas, dans le processus courant.
+
+    Paramètres:
+      - case: dictionnaire (source, image, megapixels, palette_size, cache_dir)
+
+    Retourne:
+      - Un dictionnaire de mesures (temps par étape, pic mémoire, sommets, LP, RMSE)
+    """
+    from image_decomposition import extract_rgbxy_weights, reconstruction_rmse
+    from image_recoloring import TopKWeights, quantize_weights, recolored_rmse
+    from instrumentation import peak_rss, request_profile
+    from palette_harmonization import harmonize_palette
+    from palette_simplification import simplify_convex_palette
+    from progress import CollectingSink
+
+    height, width = image_size(case['megapixels'])
+    if case['source'] == 'synthetic':
+        pixels = synthetic_image(case['image'], height, width)
+    else:
+        pixels = gallery_image(case['image'], height, width, case['cache_dir'])
+
+    sink = CollectingSink()
+    result = dict(case, width=width, height=height, stages={})
+    with request_profile('benchmark') as profile:
+        t0 = time.perf_counter()
+        palette = simplify_convex_palette(pixels, case['palette_size'], sink=sink)
+        result['stages']['simplify_convex_palette'] = time.perf_counter() - t0
+        if palette is None:
+            result['error'] = "; ".join(sink.errors)
+            return result
+
+        t0 = time.perf_counter()
+        mix_weights = extract_rgbxy_weights(palette['vertices'], pixels, sink=sink)
+        result['stages']['extract_rgbxy_weights'] = time.perf_counter() - t0
+        if mix_weights is None:
+            result['error'] = "; ".join(sink.errors)
+            return result
+
+        t0 = time.perf_counter()
+        harmonize_palette(np.round(palette['vertices'] * 255).astype(int).tolist())
+        result['stages']['harmonize_palette'] = time.perf_counter() - t0
+
+    stages = profile.stages
+    result.update({
+        'substages': {name: entry['seconds'] for name, entry in stages.items()},
+        'peak_rss': peak_rss(),
+        'initial_hull_vertices': stages['initial_hull']['counts']['vertices'],
+        'palette_vertices': len(palette['vertices']),
+        'rgbxy_hull_vertices': stages['rgbxy_hull']['counts']['vertices'],
+        'lp_solves': stages.get('lp_solve', {}).get('count', 0),
+        'simplify_iterations': stages.get('simplify_iteration', {}).get('count', 0),
+        'rmse': reconstruction_rmse(mix_weights, palette['vertices'], pixels),
+        # Erreur de l'image rendue avec les poids quantifiés en uint8, denses ou au format creux (top-k)
+        'uint8_rmse': recolored_rmse(quantize_weights(mix_weights), palette['vertices'], pixels),
+        'topk_rmse': recolored_rmse(TopKWeights.from_dense(mix_weights), palette['vertices'], pixels),
+    })
+    return result
+
+
+def run_isolated(case):
+    # Un processus neuf par cas : le pic RSS (ru_maxrss) ne concerne alors que ce cas.
+    with multiprocessing.get_context('spawn').Pool(processes=1, maxtasksperchild=1) as pool:
+        return pool.apply(run_case, (case,))
+
+
+# -------------------------------
+# COMPARAISON À LA RÉFÉRENCE
+# -------------------------------
+def case_key(result):
+    return f"{result['source']}:{result['image']}@{result['megapixels']}MP"
+
+
+def compare_to_baseline(results, baseline, tolerance=TOLERANCE):
+    """
+    Compare les mesures à une référence et retourne la liste des régressions.
+
+    Une régression est signalée lorsqu'un temps d'étape, le pic mémoire ou la
+    RMSE dépasse la référence de plus de `tolerance` (relatif), ou lorsque le
+    nombre de sommets de la palette change.
+    """
+    reference = {case_key(r): r for r in baseline.get('cases', [])}
+    regressions = []
+    for result in results:
+        base = reference.get(case_key(result))
+        if base is None or 'error' in result or 'error' in base:
+            continue
+
+        metrics = [(f"temps {name}", value, base['stages'].get(name)) for name, value in result['stages'].items()]
+        metrics += [("pic mémoire", result['peak_rss'], base['peak_rss']), ("RMSE", result['rmse'], base['rmse'])]
+        for label, value, reference_value in metrics:
+            if reference_value and value > reference_value * (1 + tolerance):
+                regressions.append(f"{case_key(result)} : {label} {reference_value:.3f} -> {value:.3f} "
+                                   f"(+{100 * (value / reference_value - 1):.0f}%)")
+        if result['palette_vertices'] != base['palette_vertices']:
+            regressions.append(f"{case_key(result)} : palette de {base['palette_vertices']} -> "
+                               f"{result['palette_vertices']} sommets")
+    return regressions
+
+
+# -------------------------------
+# DÉMARRAGE À FROID
+# -------------------------------
+# Code exécuté par chaque type de processus avant de pouvoir servir une requête
+STARTUP_PROFILES = {
+    'web': "import main",
+    'socket': "import main; main.load_worker_modules()",
+}
+
+
+def measure_startup(process_type, repeat=3):
+    """
+    Mesure le démarrage à froid d'un type de processus dans un interpréteur neuf.
+
+    Retourne:
+      - Un dictionnaire {'seconds', 'rss'} (médiane des durées, RSS de la dernière mesure)
+    """
+    code = ("import json, time; t0 = time.perf_counter(); " + STARTUP_PROFILES[process_type] + "; "
+            "from instrumentation import current_rss; "
+            "print(json.dumps({'seconds': time.perf_counter() - t0, 'rss': current_rss()}))")
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return {'seconds': float(np.median([run['seconds'] for run in runs])), 'rss': runs[-1]['rss']}
+
+
+# -------------------------------
+# LOCALISATION DES POINTS
+# -------------------------------
+# Nombre de pixels localisés par la recherche exhaustive (extrapolé à l'image entière)
+BRUTEFORCE_SAMPLE = 2000
+
+
+def measure_point_location(name, megapixels, seed=SEED):
+    """
+    Compare les stratégies de localisation des pixels dans la triangulation RGBXY :
+      - 'scanline' : marche orientée de Qhull (find_simplex), pixels dans l'ordre de l'image ;
+        chaque recherche part du simplexe du pixel précédent
+      - 'shuffled' : même marche, pixels mélangés (aucune cohérence entre points successifs)
+      - 'bruteforce' : test de tous les simplexes, mesuré sur un échantillon et extrapolé
+
+    Retourne:
+      - Un dictionnaire {stratégie: secondes} et la taille de la triangulation
+    """
+    from scipy.spatial import ConvexHull, Delaunay
+
+    from image_decomposition import rgbxy_points
+
+    height, width = image_size(megapixels)
+    points = rgbxy_points(synthetic_image(name, height, width, seed)).reshape(-1, 5)
+    hull = ConvexHull(points)
+    tri = Delaunay(points[hull.vertices])
+    tri.transform  # calculé à la première localisation, exclu des mesures
+
+    result = {'pixels': len(points), 'simplices': len(tri.simplices)}
+    t0 = time.perf_counter()
+    tri.find_simplex(points, tol=1e-6)
+    result['scanline'] = time.perf_counter() - t0
+
+    shuffled = points[np.random.default_rng(seed).permutation(len(points))]
+    t0 = time.perf_counter()
+    tri.find_simplex(shuffled, tol=1e-6)
+    result['shuffled'] = time.perf_counter() - t0
+
+    sample = points[:BRUTEFORCE_SAMPLE]
+    t0 = time.perf_counter()
+    tri.find_simplex(sample, bruteforce=True, tol=1e-6)
+    result['bruteforce'] = (time.perf_counter() - t0) * len(points) / len(sample)
+    return result
+
+
+# -------------------------------
+# NOYAUX GÉOMÉTRIQUES
+# -------------------------------
+# Nombre d'appels mesurés pour les noyaux appelés sur de petits tableaux (une arête à la fois)
+KERNEL_CALLS = 2000
+
+# Écart absolu toléré entre les implémentations des noyaux
+KERNEL_TOLERANCE = 1e-9
+
+
+def kernel_inputs(name, megapixels, seed=SEED):
+    """
+    Prépare les entrées de chaque noyau géométrique à partir d'une image synthétique.
+
+    Retourne:
+      - Un dictionnaire {noyau: (arguments, nombre d'appels)}
+    """
+    from scipy.spatial import ConvexHull
+
+    from palette_simplification import convert_convex_hull_faces
+
+    height, width = image_size(megapixels)
+    pixels = synthetic_image(name, height, width, seed).reshape(-1, 3)
+    hull = ConvexHull(pixels)
+    vertices = hull.points[hull.vertices]
+    faces = np.array(convert_convex_hull_faces(hull))
+    new_indices = np.full(len(hull.points), -1, dtype=np.int32)
+    new_indices[hull.vertices] = np.arange(len(hull.vertices))
+
+    # Faces voisines d'une arête (volume ajouté par une fusion) et pixels projetés sur une palette
+    neighbours = faces[np.isin(faces, faces[0, :2]).any(axis=1)]
+    palette = ConvexHull(vertices[np.random.default_rng(seed).choice(len(vertices), 8, replace=False)])
+    return {
+        'orient_faces': ((vertices, new_indices[hull.simplices], hull.equations[:, :3]), 1),
+        'face_planes': ((vertices, faces), 1),
+        'tetrahedron_volume_sum': ((vertices, neighbours, pixels.mean(axis=0)), KERNEL_CALLS),
+        'closest_points_on_triangles': ((pixels, palette.points[palette.simplices]), 1),
+    }
+
+
+def kernel_error(reference, value):
+    # Écart absolu maximal entre deux résultats (tableaux, scalaires ou tuples de tableaux)
+    if isinstance(reference, tuple):
+        return max(kernel_error(r, v) for r, v in zip(reference, value))
+    return float(np.max(np.abs(np.asarray(reference, dtype=float) - np.asarray(value, dtype=float)), initial=0))
+
+
+def time_kernel(kernel, args, calls, repeat=3):
+    # Meilleur temps (par appel) de repeat séries de calls appels
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(calls):
+            kernel(*args)
+        best = min(best, (time.perf_counter() - t0) / calls)
+    return best
+
+
+def measure_kernels(name, megapixels, seed=SEED):
+    """
+    Compare les implémentations des noyaux géométriques (voir geometry_kernels) :
+    écart des résultats à l'implémentation numpy (parité) et temps par appel.
+    Le premier appel de chaque noyau numba, qui le compile (ou le charge du cache), est mesuré à part.
+
+    Retourne:
+      - Un dictionnaire {noyau: {'numpy', 'numba', 'numba_first_call', 'error'}} (sans les clés numba
+        si numba n'est pas installé)
+    """
+    import geometry_kernels
+
+    backends = {'numpy': geometry_kernels.load_backend('numpy')}
+    try:
+        backends['numba'] = geometry_kernels.load_backend('numba')
+    except ImportError:
+        pass
+
+    results = {}
+    for kernel, (args, calls) in kernel_inputs(name, megapixels, seed).items():
+        reference = backends['numpy'][kernel](*args)
+        result = {'numpy': time_kernel(backends['numpy'][kernel], args, calls)}
+        if 'numba' in backends:
+            t0 = time.perf_counter()
+            value = backends['numba'][kernel](*args)
+            result['numba_first_call'] = time.perf_counter() - t0
+            result['error'] = kernel_error(reference, value)
+            result['numba'] = time_kernel(backends['numba'][kernel], args, calls)
+        results[kernel] = result
+    return results
+
+
+def environment():
+    import scipy
+
+    import geometry_kernels
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'kernels': geometry_kernels.backend(),
+        'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai du pipeline d'harmonisation")
+    parser.add_argument('--resolutions', type=float, nargs='+', default=RESOLUTIONS, help="résolutions en mégapixels")
+    parser.add_argument('--synthetic', nargs='*', default=SYNTHETIC_IMAGES, help="images synthétiques à utiliser")
+    parser.add_argument('--gallery', type=int, default=2, help="nombre d'images de la galerie (ids.json)")
+    parser.add_argument('--cache-dir', default=GALLERY_CACHE, help="dossier de cache des images de la galerie")
+    parser.add_argument('--palette-size', type=int, default=PALETTE_SIZE)
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true', help="enregistre les résultats comme référence")
+    parser.add_argument('--startup', action='store_true', help="mesure uniquement le démarrage à froid des processus")
+    parser.add_argument('--point-location', action='store_true',
+                        help="compare uniquement les stratégies de localisation des pixels (images synthétiques)")
+    parser.add_argument('--kernels', action='store_true',
+                        help="vérifie la parité et mesure uniquement les noyaux géométriques numpy/numba")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        for process_type in STARTUP_PROFILES:
+            startup = measure_startup(process_type)
+            print(f"{process_type} : {startup['seconds']:.2f} s, RSS {startup['rss'] / 1e6:.0f} Mo")
+        return 0
+
+    if args.point_location:
+        for megapixels in args.resolutions:
+            for name in args.synthetic:
+                location = measure_point_location(name, megapixels)
+                print(f"synthetic:{name}@{megapixels}MP ({location['pixels']} pixels, {location['simplices']} simplexes) : "
+                      f"ordre de l'image {location['scanline']:.2f} s, mélangés {location['shuffled']:.2f} s, "
+                      f"exhaustive ~{location['bruteforce']:.0f} s")
+        return 0
+
+    if args.kernels:
+        mismatches = 0
+        for megapixels in args.resolutions:
+            for name in args.synthetic:
+                print(f"synthetic:{name}@{megapixels}MP")
+                for kernel, result in measure_kernels(name, megapixels).items():
+                    line = f"  {kernel} : numpy {result['numpy'] * 1e3:.3f} ms"
+                    if 'numba' in result:
+                        parity = "parité OK" if result['error'] <= KERNEL_TOLERANCE else "ÉCART"
+                        mismatches += result['error'] > KERNEL_TOLERANCE
+                        line += (f", numba {result['numba'] * 1e3:.3f} ms (x{result['numpy'] / result['numba']:.1f}, "
+                                 f"1er appel {result['numba_first_call']:.2f} s), {parity} ({result['error']:.1e})")
+                    print(line)
+        if mismatches:
+            print(f"{mismatches} noyau(x) numba en désaccord avec numpy")
+        return 1 if mismatches else 0
+
+    cases = [{'source': 'synthetic', 'image': name} for name in args.synthetic]
+    cases += [{'source': 'gallery', 'image': img_id} for img_id in download_gallery(args.gallery, args.cache_dir)]
+
+    results = []
+    for megapixels in args.resolutions:
+        for case in cases:
+            case = dict(case, megapixels=megapixels, palette_size=args.palette_size, cache_dir=args.cache_dir)
+            print(f"{case_key(case)} ...", flush=True)
+            result = run_isolated(case)
+            if 'error' in result:
+                print(f"  erreur : {result['error']}")
+            else:
+                print(f"  {sum(result['stages'].values()):.2f} s, pic {result['peak_rss'] / 1e6:.0f} Mo, "
+                      f"{result['initial_hull_vertices']} -> {result['palette_vertices']} sommets, "
+                      f"{result['lp_solves']} LP, RMSE {result['rmse']:.2f} "
+                      f"(uint8 {result['uint8_rmse']:.2f}, top-k {result['topk_rmse']:.2f})")
+            results.append(result)
+
+    startup = {process_type: measure_startup(process_type) for process_type in STARTUP_PROFILES}
+    report = {'environment': environment(), 'startup': startup, 'cases': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Référence mise à jour : {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Aucune référence ({args.baseline}), lancez avec --update-baseline pour en créer une.")
+        return 0
+
+    regressions = compare_to_baseline(results, json.load(open(args.baseline)), args.tolerance)
+    for regression in regressions:
+        print(f"RÉGRESSION {regression}")
+    if not regressions:
+        print("Aucune régression par rapport à la référence.")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
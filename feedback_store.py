@@ -0,0 +1,176 @@
+import atexit
+import csv
+import logging
+import os
+import queue
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Fichier de la base des feedbacks et ancien fichier CSV importé à sa création
+FEEDBACK_DB_PATH = 'feedback.db'
+LEGACY_CSV_PATH = 'feedback.csv'
+
+# Les feedbacks sont écrits par lots : au plus FLUSH_INTERVAL secondes d'attente, au plus BATCH_SIZE lignes
+FLUSH_INTERVAL = 1.0
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    img_id TEXT NOT NULL,
+    harmony1 TEXT NOT NULL,
+    harmony2 TEXT NOT NULL,
+    choice TEXT NOT NULL
+);
+-- Agrégats mis à jour à chaque lot : nombre de présentations et de victoires par harmonie
+CREATE TABLE IF NOT EXISTS harmony_stats (
+    harmony TEXT PRIMARY KEY,
+    shown INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0
+);
+-- Duels : nombre de fois où winner a été préférée à loser
+CREATE TABLE IF NOT EXISTS harmony_duels (
+    winner TEXT NOT NULL,
+    loser TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (winner, loser)
+);
+"""
+
+
+def is_valid_duel(harmony1, harmony2, choice):
+    """
+    Vérifie qu'un feedback décrit un duel cohérent : deux harmonies différentes, dont l'une
+    est celle choisie. Sinon, les agrégats (victoires, duels) divergeraient des lignes brutes.
+    """
+    return harmony1 != harmony2 and choice in (harmony1, harmony2)
+
+
+class FeedbackStore:
+    """
+    Stockage des feedbacks du formulaire dans une base SQLite en mode WAL.
+
+    Les requêtes HTTP ne font que déposer le feedback dans une file en mémoire ;
+    un thread d'écriture unique vide la file par lots, dans une transaction qui
+    ajoute les lignes et met à jour les agrégats (taux de victoire par harmonie
+    et par duel). Les statistiques sont donc lues sans jamais parcourir
+    l'historique, et aucune écriture concurrente ne peut entrelacer deux lignes.
+    """
+
+    def __init__(self, path=FEEDBACK_DB_PATH, legacy_csv=LEGACY_CSV_PATH,
+                 flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+
+        created = not os.path.exists(path)
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        if created and legacy_csv and os.path.exists(legacy_csv):
+            self._import_csv(connection, legacy_csv)
+        connection.close()
+
+        self._thread = threading.Thread(target=self._run, name='feedback-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def submit(self, timestamp, user_id, img_id, harmony1, harmony2, choice):
+        # Appelée depuis les requêtes HTTP : ne bloque jamais sur le disque
+        self._queue.put((timestamp, user_id, str(img_id), harmony1, harmony2, choice))
+
+    def _run(self):
+        connection = self._connect()
+        while not (self._stopped.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._write(connection, batch)
+                except sqlite3.Error:
+                    logger.exception("Échec de l'écriture de %d feedbacks", len(batch))
+        connection.close()
+
+    def _next_batch(self):
+        # On attend le premier feedback, puis on prend tous ceux déjà en file (dans la limite d'un lot)
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _write(connection, batch):
+        shown, wins, duels = {}, {}, {}
+        for _, _, _, harmony1, harmony2, choice in batch:
+            for harmony in (harmony1, harmony2):
+                shown[harmony] = shown.get(harmony, 0) + 1
+            wins[choice] = wins.get(choice, 0) + 1
+            loser = harmony2 if choice == harmony1 else harmony1
+            duels[(choice, loser)] = duels.get((choice, loser), 0) + 1
+
+        with connection:
+            connection.executemany(
+                "INSERT INTO feedback (timestamp, user_id, img_id, harmony1, harmony2, choice) "
+                "VALUES (?, ?, ?, ?, ?, ?)", batch)
+            connection.executemany(
+                "INSERT INTO harmony_stats (harmony, shown, wins) VALUES (?, ?, ?) "
+                "ON CONFLICT(harmony) DO UPDATE SET shown = shown + excluded.shown, wins = wins + excluded.wins",
+                [(harmony, count, wins.get(harmony, 0)) for harmony, count in shown.items()])
+            connection.executemany(
+                "INSERT INTO harmony_duels (winner, loser, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(winner, loser) DO UPDATE SET count = count + excluded.count",
+                [(winner, loser, count) for (winner, loser), count in duels.items()])
+
+    def _import_csv(self, connection, csv_path):
+        # Reprise de l'ancien fichier CSV (timestamp, user_id, img_id, harmony1, harmony2, choice)
+        with open(csv_path, newline='') as f:
+            rows = [tuple(row) for row in csv.reader(f) if len(row) == 6]
+        valid = [row for row in rows if is_valid_duel(*row[3:])]
+        for start in range(0, len(valid), self.batch_size):
+            self._write(connection, valid[start:start + self.batch_size])
+        logger.info("%d feedbacks importés depuis %s (%d lignes incohérentes ignorées)", len(valid), csv_path,
+                    len(rows) - len(valid))
+
+    def stats(self):
+        """
+        Retourne les taux de victoire agrégés.
+
+        Retourne:
+          - Un dictionnaire {'total', 'harmonies': {harmonie: {'shown', 'wins', 'win_rate'}},
+            'duels': [{'winner', 'loser', 'count'}]}
+        """
+        # Connexion de lecture dédiée : en mode WAL, elle ne bloque pas le thread d'écriture
+        connection = self._connect()
+        try:
+            # Chaque feedback compte exactement une victoire
+            total = connection.execute("SELECT COALESCE(SUM(wins), 0) FROM harmony_stats").fetchone()[0]
+            harmonies = {harmony: {'shown': shown, 'wins': wins, 'win_rate': wins / shown if shown else 0.0}
+                         for harmony, shown, wins in connection.execute(
+                             "SELECT harmony, shown, wins FROM harmony_stats ORDER BY harmony")}
+            duels = [{'winner': winner, 'loser': loser, 'count': count}
+                     for winner, loser, count in connection.execute(
+                         "SELECT winner, loser, count FROM harmony_duels ORDER BY winner, loser")]
+        finally:
+            connection.close()
+        return {'total': total, 'harmonies': harmonies, 'duels': duels}
+
+    def close(self):
+        # On écrit les feedbacks encore en file avant de s'arrêter
+        self._stopped.set()
+        self._thread.join()
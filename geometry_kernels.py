@@ -0,0 +1,364 @@
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Implémentation des noyaux géométriques : "numpy" (toujours disponible), "numba" (compilée,
+# nécessite le paquet numba) ou "auto" (numba s'il est installé, numpy sinon). Les noyaux de la
+# simplification calculent leurs produits scalaires avec np.dot, comme le code face par face d'origine :
+# la simplification, sensible aux arrondis, suit les mêmes fusions quelle que soit l'implémentation.
+# numba n'est pas sélectionné par défaut : il allonge le démarrage des serveurs socket (compilation ou
+# chargement du cache) et augmente leur mémoire résidente.
+KERNEL_BACKEND = os.environ.get('HARMONY_KERNELS', 'numpy')
+
+# Nombre de points traités à la fois par la projection vectorisée (numpy) sur des triangles
+PROJECTION_CHUNK = 64 * 1024
+
+
+# -------------------------------------------------------------------------
+# 1. Implémentations NumPy (référence)
+# -------------------------------------------------------------------------
+def _face_normals(vertices, faces):
+    # Normales non normalisées (p1 - p0) x (p2 - p0) de chaque face
+    triangles = vertices[faces]
+    return np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), triangles
+
+
+def orient_faces_numpy(vertices, faces, expected_normals):
+    normals, _ = _face_normals(vertices, faces)
+    flip = np.vecdot(normals, expected_normals) < 0
+    oriented = faces.copy()
+    oriented[flip, 0], oriented[flip, 1] = faces[flip, 1], faces[flip, 0]
+    return oriented
+
+
+def face_planes_numpy(vertices, faces):
+    normals, triangles = _face_normals(vertices, faces)
+    norms = np.sqrt(np.vecdot(normals, normals))[:, None]
+    normals = np.divide(normals, norms, out=np.zeros_like(normals), where=norms != 0)
+    return normals, np.vecdot(normals, triangles[:, 0])
+
+
+def tetrahedron_volume_sum_numpy(vertices, faces, point):
+    normals, triangles = _face_normals(vertices, faces)
+    volumes = np.abs(np.vecdot(normals, point - triangles[:, 0])) / 6.0
+    # Somme dans l'ordre des faces (np.sum regroupe les termes par blocs)
+    return float(volumes.cumsum()[-1]) if len(volumes) else 0.0
+
+
+def point_triangle_distances(points, triangles):
+    """
+    Version vectorisée de point_triangle_distance (image_decomposition) : distances entre des points et des triangles.
+
+    Paramètres:
+      - points: np.array de forme (N, 3)
+      - triangles: np.array de forme (F, 3, 3)
+
+    Retourne:
+      - (points les plus proches (N, F, 3), distances au carré (N, F))
+    """
+    V0, V1, V2 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    E0, E1 = V1 - V0, V2 - V0
+    D = V0[None] - points[:, None]  # (N, F, 3)
+
+    a, b, c = (E0 * E0).sum(-1), (E0 * E1).sum(-1), (E1 * E1).sum(-1)
+    d, e = (D * E0).sum(-1), (D * E1).sum(-1)
+    det = a * c - b * b
+
+    s = b * e - c * d
+    t = b * d - a * e
+
+    # Mêmes régions que point_triangle_distance, évaluées pour tous les couples (point, triangle)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inner = (s + t) <= det
+        tmp0, tmp1 = b + d, c + e
+        edge12 = ~inner & (tmp1 > tmp0)
+        s_edge = np.clip((tmp1 - tmp0) / (a - 2 * b + c), 0, 1)
+        t_edge = np.clip(-e / c, 0, 1)
+        s = np.where(inner, np.clip(s / det, 0, 1), np.where(edge12, s_edge, 0))
+        t = np.where(inner, np.clip(t / det, 0, 1), np.where(edge12, 1 - s_edge, t_edge))
+
+    u = 1 - s - t
+    closest = u[..., None] * V0 + s[..., None] * V1 + t[..., None] * V2
+    diff = points[:, None] - closest
+    return closest, (diff * diff).sum(-1)
+
+
+def closest_points_on_triangles_numpy(points, triangles, chunk_size=PROJECTION_CHUNK):
+    projected = np.empty_like(points)
+    sqr_distances = np.empty(len(points))
+    for start in range(0, len(points), chunk_size):
+        closest, chunk_distances = point_triangle_distances(points[start:start + chunk_size], triangles)
+        nearest = np.argmin(chunk_distances, axis=1)
+        rows = np.arange(len(nearest))
+        projected[start:start + chunk_size] = closest[rows, nearest]
+        sqr_distances[start:start + chunk_size] = chunk_distances[rows, nearest]
+    return projected, sqr_distances
+
+
+NUMPY_KERNELS = {
+    'orient_faces': orient_faces_numpy,
+    'face_planes': face_planes_numpy,
+    'tetrahedron_volume_sum': tetrahedron_volume_sum_numpy,
+    'closest_points_on_triangles': closest_points_on_triangles_numpy,
+}
+
+
+# -------------------------------------------------------------------------
+# 2. Implémentations Numba (optionnelles)
+# -------------------------------------------------------------------------
+def build_numba_kernels():
+    """
+    Compile les noyaux avec Numba (boucles explicites, sans tableaux intermédiaires).
+
+    La compilation a lieu au premier appel de chaque noyau ; avec cache=True, le code
+    compilé est conservé sur disque et réutilisé par les processus suivants.
+
+    Retourne:
+      - Un dictionnaire {nom: noyau}, mêmes signatures que NUMPY_KERNELS
+
+    Lève:
+      - ImportError si numba n'est pas installé
+    """
+    import numba
+
+    njit = numba.njit(cache=True, error_model='numpy')
+
+    @njit
+    def face_normal(vertices, i0, i1, i2):
+        ux, uy, uz = vertices[i1, 0] - vertices[i0, 0], vertices[i1, 1] - vertices[i0, 1], vertices[i1, 2] - vertices[i0, 2]
+        vx, vy, vz = vertices[i2, 0] - vertices[i0, 0], vertices[i2, 1] - vertices[i0, 1], vertices[i2, 2] - vertices[i0, 2]
+        return uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx
+
+    @njit
+    def orient_faces(vertices, faces, expected_normals):
+        oriented = faces.copy()
+        for i in range(faces.shape[0]):
+            nx, ny, nz = face_normal(vertices, faces[i, 0], faces[i, 1], faces[i, 2])
+            if nx * expected_normals[i, 0] + ny * expected_normals[i, 1] + nz * expected_normals[i, 2] < 0:
+                oriented[i, 0], oriented[i, 1] = faces[i, 1], faces[i, 0]
+        return oriented
+
+    # Produits scalaires par np.dot (BLAS, comme l'implémentation numpy) : les plans et les volumes
+    # sont identiques au bit près, et la simplification suit les mêmes fusions
+    @njit
+    def face_planes(vertices, faces):
+        normals = np.zeros((faces.shape[0], 3))
+        offsets = np.zeros(faces.shape[0])
+        normal = np.empty(3)
+        for i in range(faces.shape[0]):
+            normal[0], normal[1], normal[2] = face_normal(vertices, faces[i, 0], faces[i, 1], faces[i, 2])
+            norm = np.sqrt(np.dot(normal, normal))
+            if norm != 0:
+                normals[i] = normal / norm
+                offsets[i] = np.dot(normals[i], vertices[faces[i, 0]])
+        return normals, offsets
+
+    @njit
+    def tetrahedron_volume_sum(vertices, faces, point):
+        total = 0.0
+        normal = np.empty(3)
+        for i in range(faces.shape[0]):
+            normal[0], normal[1], normal[2] = face_normal(vertices, faces[i, 0], faces[i, 1], faces[i, 2])
+            total += abs(np.dot(normal, point - vertices[faces[i, 0]])) / 6.0
+        return total
+
+    @njit
+    def closest_points(points, triangles):
+        # Grandeurs propres à chaque triangle, calculées une seule fois pour tous les points
+        V0 = triangles[:, 0].copy()
+        E0 = triangles[:, 1] - V0
+        E1 = triangles[:, 2] - V0
+        A = (E0 * E0).sum(axis=1)
+        B = (E0 * E1).sum(axis=1)
+        C = (E1 * E1).sum(axis=1)
+
+        projected = np.empty_like(points)
+        sqr_distances = np.empty(points.shape[0])
+        for n in range(points.shape[0]):
+            best, best_face, best_s, best_t = np.inf, 0, 0.0, 0.0
+            for f in range(triangles.shape[0]):
+                a, b, c = A[f], B[f], C[f]
+                d = e = 0.0
+                for k in range(3):
+                    D = V0[f, k] - points[n, k]
+                    d += E0[f, k] * D
+                    e += E1[f, k] * D
+                det = a * c - b * b
+                s = b * e - c * d
+                t = b * d - a * e
+
+                # Mêmes régions que point_triangle_distance
+                if (s + t) <= det:
+                    s = min(max(s / det, 0.0), 1.0)
+                    t = min(max(t / det, 0.0), 1.0)
+                elif c + e > b + d:
+                    s = min(max((c + e - b - d) / (a - 2 * b + c), 0.0), 1.0)
+                    t = 1 - s
+                else:
+                    t = min(max(-e / c, 0.0), 1.0)
+                    s = 0.0
+
+                distance = 0.0
+                for k in range(3):
+                    diff = points[n, k] - (V0[f, k] + s * E0[f, k] + t * E1[f, k])
+                    distance += diff * diff
+                if distance < best:
+                    best = distance
+                    best_face, best_s, best_t = f, s, t
+            sqr_distances[n] = best
+            for k in range(3):
+                projected[n, k] = V0[best_face, k] + best_s * E0[best_face, k] + best_t * E1[best_face, k]
+        return projected, sqr_distances
+
+    def closest_points_on_triangles(points, triangles, chunk_size=PROJECTION_CHUNK):
+        # Aucun tableau (N, F) n'est alloué : chunk_size est sans objet
+        return closest_points(np.ascontiguousarray(points, dtype=np.float64),
+                              np.ascontiguousarray(triangles, dtype=np.float64))
+
+    return {
+        'orient_faces': orient_faces,
+        'face_planes': face_planes,
+        'tetrahedron_volume_sum': tetrahedron_volume_sum,
+        'closest_points_on_triangles': closest_points_on_triangles,
+    }
+
+
+# -------------------------------------------------------------------------
+# 3. Sélection de l'implémentation
+# -------------------------------------------------------------------------
+_kernels = dict(NUMPY_KERNELS)
+_backend = 'numpy'
+
+
+def load_backend(name):
+    """
+    Retourne les noyaux d'une implémentation, sans la sélectionner.
+
+    Paramètres:
+      - name: "numpy" ou "numba"
+
+    Lève:
+      - ValueError si l'implémentation est inconnue, ImportError si numba n'est pas installé
+    """
+    if name == 'numpy':
+        return NUMPY_KERNELS
+    if name == 'numba':
+        return build_numba_kernels()
+    raise ValueError(f"Implémentation de noyaux inconnue : {name}")
+
+
+def set_backend(name):
+    """
+    Sélectionne l'implémentation des noyaux géométriques pour tout le processus.
+
+    Paramètres:
+      - name: "numpy", "numba" ou "auto" (numba s'il est installé, numpy sinon)
+
+    Retourne:
+      - Le nom de l'implémentation sélectionnée
+
+    Lève:
+      - ValueError si l'implémentation est inconnue, ImportError si numba est demandé mais absent
+    """
+    global _backend
+    if name == 'auto':
+        try:
+            return set_backend('numba')
+        except ImportError:
+            return set_backend('numpy')
+    _kernels.update(load_backend(name))
+    _backend = name
+    return name
+
+
+def backend():
+    """
+    Retourne le nom de l'implémentation sélectionnée ("numpy" ou "numba").
+    """
+    return _backend
+
+
+def orient_faces(vertices, faces, expected_normals):
+    """
+    Oriente les faces d'une enveloppe : les deux premiers sommets d'une face sont échangés
+    lorsque sa normale (p1 - p0) x (p2 - p0) est opposée à la normale attendue.
+
+    Paramètres:
+      - vertices: sommets (N, 3)
+      - faces: indices des faces (M, 3)
+      - expected_normals: normales sortantes attendues (M, 3)
+
+    Retourne:
+      - Les faces orientées (M, 3)
+    """
+    return _kernels['orient_faces'](vertices, faces, expected_normals)
+
+
+def face_planes(vertices, faces):
+    """
+    Calcule le plan de chaque face : normale unitaire (nulle pour une face dégénérée)
+    et offset (produit scalaire de la normale et du premier sommet).
+
+    Paramètres:
+      - vertices: sommets (N, 3)
+      - faces: indices des faces (M, 3)
+
+    Retourne:
+      - (normales (M, 3), offsets (M,))
+    """
+    return _kernels['face_planes'](vertices, faces)
+
+
+def tetrahedron_volume_sum(vertices, faces, point):
+    """
+    Somme des volumes absolus des tétraèdres formés par chaque face et un point
+    (voir compute_tetrahedron_volume dans palette_simplification).
+
+    Paramètres:
+      - vertices: sommets (N, 3)
+      - faces: indices des faces (M, 3)
+      - point: np.array de forme (3,)
+
+    Retourne:
+      - Le volume total (float)
+    """
+    return _kernels['tetrahedron_volume_sum'](vertices, faces, point)
+
+
+def closest_points_on_triangles(points, triangles, chunk_size=PROJECTION_CHUNK):
+    """
+    Projette chaque point sur le plus proche d'un ensemble de triangles.
+
+    Paramètres:
+      - points: np.array de forme (N, 3)
+      - triangles: np.array de forme (F, 3, 3)
+      - chunk_size: nombre de points traités à la fois (implémentation numpy)
+
+    Retourne:
+      - (points projetés (N, 3), distances au carré (N,))
+    """
+    return _kernels['closest_points_on_triangles'](points, triangles, chunk_size)
+
+
+def warm_up():
+    """
+    Appelle chaque noyau sur un tétraèdre, avec les types de tableaux du pipeline : les noyaux
+    numba sont compilés (ou chargés du cache) au démarrage du processus plutôt qu'à sa première requête.
+    """
+    vertices = np.vstack((np.zeros(3), np.eye(3)))
+    faces = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]])
+    # Normales attendues non contiguës, comme hull.equations[:, :3]
+    orient_faces(vertices, faces.astype(np.int32), np.ones((4, 4))[:, :3])
+    face_planes(vertices, faces)
+    tetrahedron_volume_sum(vertices, faces, vertices[0].copy())
+    closest_points_on_triangles(vertices, vertices[faces])
+
+
+try:
+    set_backend(KERNEL_BACKEND)
+except ImportError:
+    logger.warning("numba n'est pas installé : noyaux géométriques en numpy")
+    set_backend('numpy')
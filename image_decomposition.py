@@ -1,11 +1,35 @@
-import time
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import scipy
-from flask_socketio import emit
 from numpy import median
 from scipy.spatial import ConvexHull, Delaunay
 from scipy import sparse
 
+from geometry_kernels import PROJECTION_CHUNK, closest_points_on_triangles
+from instrumentation import in_profile, stage
+from progress import NULL_SINK
+
+# Nombre maximal de pixels de l'aperçu des couches envoyé avant les poids définitifs
+PREVIEW_MAX_PIXELS = 128 * 128
+
+# Nombre maximal de pixels par bande de poids définitifs envoyée au client
+TILE_PIXELS = 256 * 1024
+
+# Nombre de threads calculant les bandes de poids en parallèle (find_simplex, le produit creux et
+# einsum libèrent le GIL) et nombre minimal de bandes par thread pour répartir la charge
+WEIGHT_WORKERS = os.cpu_count() or 1
+TILES_PER_WORKER = 4
+
+# Nombre maximal de pixels pour lesquels la matrice barycentrique RGBXY est conservée dans la
+# géométrie (environ 48 octets par pixel : 6 poids float32 et leurs indices)
+RGBXY_MATRIX_MAX_PIXELS = 4 * 1024 * 1024
+
+# Nombre de valeurs par canal de la table de poids ASAP (voir build_asap_lut)
+ASAP_LUT_RESOLUTION = 64
+
 # -------------------------------------------------------------------------
 # 1. Fonction de projection point-triangle
 # -------------------------------------------------------------------------
@@ -51,54 +75,242 @@ def point_triangle_distance(P, triangle):
     return {'parameter': [u, s, t], 'closest': closest, 'sqrDistance': sqrDistance, 'distance': distance}
 
 
-def extract_rgbxy_weights(palette_rgb, image_orig):
+def project_to_hull(points, hull_obj, chunk_size=PROJECTION_CHUNK, return_distances=False):
+    """
+    Projette des points sur la surface d'une enveloppe convexe (point le plus proche de toutes ses faces).
+
+    Args:
+        points (np.array): Points (N, 3).
+        hull_obj (ConvexHull): Enveloppe convexe.
+        chunk_size (int): Nombre de points traités à la fois (noyaux numpy).
+        return_distances (bool): Retourne aussi les distances au carré à la surface.
+
+    Returns:
+        np.array: Points projetés (N, 3), et distances au carré (N,) si return_distances.
+    """
+    projected, sqr_distances = closest_points_on_triangles(points, hull_obj.points[hull_obj.simplices], chunk_size)
+    return (projected, sqr_distances) if return_distances else projected
+
+
+def build_rgbxy_geometry(image):
+    """
+    Construit la géométrie RGBXY d'une image : enveloppe convexe 5D et triangulation
+    Delaunay de ses sommets.
+
+    Elle ne dépend que de l'image, pas de la palette : on la conserve pour recalculer
+    les poids avec une autre palette (autre nombre de couleurs, sommet déplacé) sans la
+    reconstruire. Au premier calcul des poids, extract_rgbxy_weights y ajoute la matrice
+    barycentrique des pixels ('delaunay_weights', si l'image a au plus
+    RGBXY_MATRIX_MAX_PIXELS pixels) : les calculs suivants se réduisent alors aux poids
+    ASAP des sommets de l'enveloppe et à un produit de matrice creuse, et les points RGBXY
+    et la triangulation sont libérés.
+
+    Args:
+        image (np.array): Image (H, W, 3) dans [0, 1].
+
+    Returns:
+        dict: {'rgbxy' (H, W, 5), 'hull_rgb' (V, 1, 3) couleurs des sommets de l'enveloppe, 'tri' (Delaunay),
+            'shape' (H, W)}.
+    """
+    combined_data = rgbxy_points(image)  # (H, W, 5)
+
+    with stage('rgbxy_hull', points=combined_data) as record:
+        hull_combined = ConvexHull(combined_data.reshape(-1, 5))
+        record.add_arrays(vertices=hull_combined.vertices)
+        record.add_counts(vertices=len(hull_combined.vertices))
+    hull_rgb = image.reshape(-1, 3)[hull_combined.vertices].reshape(-1, 1, 3)
+
+    # Triangulation Delaunay des sommets de l'enveloppe RGBXY, partagée par l'aperçu et les bandes
+    hull_pts = hull_combined.points[hull_combined.vertices]
+    with stage('rgbxy_delaunay', hull_points=hull_pts):
+        tri = Delaunay(hull_pts)
+
+    return {'rgbxy': combined_data, 'hull_rgb': hull_rgb, 'tri': tri, 'shape': image.shape[:2]}
+
+
+def extract_rgbxy_weights(palette_rgb, image_orig, sink=NULL_SINK, asap_lut=None, workers=None, geometry=None):
     """
     Extrait les poids de mélange RGBXY à partir d'une image.
 
+    Les poids sont transmis au sink au fur et à mesure : d'abord un aperçu
+    calculé sur une grille de pixels sous-échantillonnée (layer_preview), puis
+    les poids définitifs par bandes de lignes (layer_tile).
+
     Args:
         palette_rgb (np.array): Couleurs de la palette (N, 3).
-        image_orig (np.array): Image originale (H, W, 3).
+        image_orig (np.array): Image originale (H, W, 3) ; inutile (None) si la géométrie est fournie.
+        sink (ProgressSink): Destination des messages de progression.
+        asap_lut (np.array): Table de poids ASAP de la palette (voir build_asap_lut), optionnelle.
+        workers (int): Nombre de threads de calcul des poids (WEIGHT_WORKERS par défaut).
+        geometry (dict): Géométrie RGBXY déjà calculée pour cette image (voir build_rgbxy_geometry) ;
+            seuls les poids ASAP et le mélange sont alors recalculés. La matrice barycentrique
+            des pixels y est conservée pour les appels suivants, à la place des points RGBXY.
+
+    Returns:
+        np.array: Poids de mélange (H, W, N), ou None en cas d'échec.
     """
     n_colors = len(palette_rgb)
-    img = image_orig.copy()
-    height, width = img.shape[:2]
+    height, width = geometry['shape'] if geometry is not None else image_orig.shape[:2]
+    # La matrice barycentrique n'est conservée que si l'appelant garde la géométrie
+    keep_matrix = geometry is not None and height * width <= RGBXY_MATRIX_MAX_PIXELS
+
+    with stage('weights') as weights_record:
+        if geometry is None:
+            geometry = build_rgbxy_geometry(image_orig)
+        hull_rgb = geometry['hull_rgb']
+
+        # Poids ASAP en RGB via la méthode Tan 2016
+        with stage('asap_weights', colors=hull_rgb):
+            if asap_lut is not None:
+                asap_weights = asap_weights_from_lut(asap_lut, hull_rgb)
+            else:
+                asap_weights = compute_asap_weights_tan2016(hull_rgb, palette_rgb, sink)
+        if asap_weights is None:
+            return
+        asap_weights = asap_weights.reshape(-1, n_colors)
+
+        delaunay_weights = geometry.get('delaunay_weights')
+        if delaunay_weights is not None:
+            # Matrice barycentrique déjà connue : un seul produit creux, sans localisation des pixels
+            with stage('mixing', delaunay_weights=delaunay_weights) as record:
+                mix_weights = delaunay_weights.dot(asap_weights).reshape((height, width, n_colors)).clip(0, 1)
+                record.add_arrays(tile=mix_weights)
+            tile_rows = max(1, TILE_PIXELS // width)
+            for start in range(0, height, tile_rows):
+                sink.layer_tile(start, mix_weights[start:start + tile_rows], height)
+        else:
+            combined_data, tri = geometry['rgbxy'], geometry['tri']
+            # Aperçu : mêmes poids, calculés sur une grille de pixels sous-échantillonnée
+            step = max(1, int(np.ceil(np.sqrt(height * width / PREVIEW_MAX_PIXELS))))
+            preview_data = combined_data[::step, ::step]
+            with stage('preview', points=preview_data):
+                preview = mix_rgbxy_weights(tri, preview_data, asap_weights)
+            sink.layer_preview(preview, height, width)
+
+            # Poids définitifs, par bandes calculées en parallèle et transmises dans l'ordre
+            mix_weights = np.empty((height, width, n_colors))
+            matrices = [] if keep_matrix else None
+            for start, tile in mix_rgbxy_tiles(tri, combined_data, asap_weights, workers, matrices):
+                mix_weights[start:start + len(tile)] = tile
+                sink.layer_tile(start, tile, height)
+            if keep_matrix:
+                with stage('rgbxy_matrix') as record:
+                    geometry['delaunay_weights'] = sparse.vstack(matrices, format='csr')
+                    record.add_arrays(delaunay_weights=geometry['delaunay_weights'])
+                # Les poids suivants ne dépendent plus que de la matrice : points RGBXY et triangulation libérés
+                del geometry['rgbxy'], geometry['tri']
+    sink.log(f"Le calcul des poids a pris {weights_record.seconds:.2f} secondes")
+
+    return mix_weights
+
+
+def mix_rgbxy_tiles(tri, rgbxy_data, asap_weights, workers=None, matrices=None):
+    """
+    Calcule les poids de mélange d'une image par bandes de lignes, sur un pool de threads.
+
+    Les threads partagent la triangulation (aucune copie) ; chaque bande produit son
+    propre bloc de poids. Au plus deux bandes par thread sont en cours à la fois et
+    les bandes sont rendues dans l'ordre de l'image.
+
+    Args:
+        tri (Delaunay): Triangulation des sommets de l'enveloppe RGBXY.
+        rgbxy_data (np.array): Pixels RGBXY (H, W, 5).
+        asap_weights (np.array): Poids ASAP des sommets de l'enveloppe (M, N).
+        workers (int): Nombre de threads (WEIGHT_WORKERS par défaut).
+        matrices (list): Si fournie, reçoit dans l'ordre des lignes la matrice barycentrique
+            (float32) de chaque bande.
 
-    # Création de la grille normalisée (XY)
+    Returns:
+        generator: (première ligne, poids de la bande (lignes, W, N)) dans l'ordre des lignes.
+    """
+    workers = workers or WEIGHT_WORKERS
+    height, width = rgbxy_data.shape[:2]
+    # Assez de bandes pour occuper tous les threads, sans dépasser TILE_PIXELS pixels par bande
+    tile_pixels = min(TILE_PIXELS, -(-height * width // (workers * TILES_PER_WORKER)))
+    tile_rows = max(1, tile_pixels // width)
+
+    # La transformation barycentrique est calculée à la première utilisation : on la calcule
+    # avant de lancer les threads pour qu'ils ne la calculent pas chacun de leur côté
+    tri.transform
+
+    @in_profile
+    def mix_tile(start):
+        with stage('mixing') as record:
+            tile_data = rgbxy_data[start:start + tile_rows]
+            delaunay_weights = delaunay_barycentric_weights(tri, tile_data.reshape(-1, 5))
+            tile = delaunay_weights.dot(asap_weights).reshape(tile_data.shape[:2] + (-1,)).clip(0, 1)
+            record.add_arrays(tile=tile)
+        return start, tile, delaunay_weights.astype(np.float32) if matrices is not None else None
+
+    def collect(result):
+        start, tile, delaunay_weights = result
+        if matrices is not None:
+            matrices.append(delaunay_weights)
+        return start, tile
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start in range(0, height, tile_rows):
+            pending.append(executor.submit(mix_tile, start))
+            if len(pending) >= 2 * workers:
+                yield collect(pending.popleft().result())
+        while pending:
+            yield collect(pending.popleft().result())
+
+
+def rgbxy_points(image):
+    """
+    Associe à chaque pixel sa couleur et sa position normalisée (XY).
+
+    Args:
+        image (np.array): Image (H, W, 3).
+
+    Returns:
+        np.array: Points RGBXY (H, W, 5).
+    """
+    height, width = image.shape[:2]
     grid_x, grid_y = np.mgrid[0:height, 0:width]
     norm_grid = np.dstack((grid_x / float(height), grid_y / float(width)))
-    combined_data = np.dstack((img, norm_grid))  # (H, W, 5)
+    return np.dstack((image, norm_grid))
 
-    t0 = time.time()
-    hull_combined = ConvexHull(combined_data.reshape(-1, 5))
 
-    # Poids ASAP en RGB via la méthode Tan 2016
-    hull_rgb = img.reshape(-1, 3)[hull_combined.vertices].reshape(-1, 1, 3)
-    asap_weights = compute_asap_weights_tan2016(hull_rgb, palette_rgb)
-    if asap_weights is None:
-        return
+def mix_rgbxy_weights(tri, rgbxy_points, asap_weights):
+    """
+    Calcule les poids de mélange d'un bloc de pixels RGBXY.
 
-    # Poids RGBXY via triangulation Delaunay
-    hull_pts = hull_combined.points[hull_combined.vertices]
-    delaunay_weights = compute_delaunay_barycentric_weights(hull_pts, hull_combined.points, option=3)
-    emit("server_log", {"data": f"Le calcul des poids a pris {time.time() - t0:.2f} secondes"})
+    Args:
+        tri (Delaunay): Triangulation des sommets de l'enveloppe RGBXY.
+        rgbxy_points (np.array): Pixels (h, w, 5).
+        asap_weights (np.array): Poids ASAP des sommets de l'enveloppe (M, N).
 
-    # Combinaison des poids et reconstruction de l'image
-    mix_weights = delaunay_weights.dot(asap_weights.reshape(-1, n_colors))
-    mix_weights = mix_weights.reshape((height, width, -1)).clip(0, 1)
+    Returns:
+        np.array: Poids de mélange (h, w, N) dans [0, 1].
+    """
+    rows, cols = rgbxy_points.shape[:2]
+    delaunay_weights = delaunay_barycentric_weights(tri, rgbxy_points.reshape(-1, 5))
+    return delaunay_weights.dot(asap_weights).reshape((rows, cols, -1)).clip(0, 1)
 
-    recon_img = (mix_weights[..., None] * palette_rgb.reshape((1, 1, -1, 3))).sum(axis=2)
-    err = recon_img * 255 - image_orig * 255
-    rmse = np.sqrt(np.square(err.reshape(-1, 3)).sum(axis=-1).mean())
-    emit("server_log", {"data": f"RMSE de reconstruction : {rmse:.2f}"})
 
-    # Envoi des poids par couche via socket
-    for layer in range(mix_weights.shape[-1]):
-        emit("layer_weights", {
-            "id": layer,
-            "width": width,
-            "height": height,
-            "weights": mix_weights[:, :, layer].flatten().tolist()
-        })
+def reconstruction_rmse(mix_weights, palette_rgb, image_orig, block_rows=64):
+    """
+    Calcule l'erreur de reconstruction (RMSE, en niveaux 0-255) d'une décomposition.
+
+    Le calcul se fait par blocs de lignes pour ne pas allouer l'image reconstruite entière.
+
+    Args:
+        mix_weights (np.array): Poids de mélange (H, W, N).
+        palette_rgb (np.array): Couleurs de la palette (N, 3).
+        image_orig (np.array): Image originale (H, W, 3).
+        block_rows (int): Nombre de lignes traitées à la fois.
+
+    Returns:
+        float: RMSE de reconstruction.
+    """
+    total = 0.0
+    for start in range(0, mix_weights.shape[0], block_rows):
+        err = (mix_weights[start:start + block_rows] @ palette_rgb - image_orig[start:start + block_rows]) * 255
+        total += np.square(err).sum()
+    return float(np.sqrt(total / (mix_weights.shape[0] * mix_weights.shape[1])))
 
 
 def compute_delaunay_barycentric_weights(hull_points, query_points, option=3):
@@ -113,40 +325,54 @@ def compute_delaunay_barycentric_weights(hull_points, query_points, option=3):
     Returns:
         scipy.sparse.csr_matrix: Matrice des poids barycentriques.
     """
-    tri = Delaunay(hull_points)
-    simplices = tri.find_simplex(query_points, tol=1e-6)
+    if option != 3:
+        raise NotImplementedError("Seule l'option 3 est implémentée.")
+    return delaunay_barycentric_weights(Delaunay(hull_points), query_points)
+
+
+def delaunay_barycentric_weights(tri, query_points):
+    """
+    Calcule les poids barycentriques de points dans une triangulation Delaunay existante.
+
+    Args:
+        tri (Delaunay): Triangulation des points de l'enveloppe (M sommets).
+        query_points (np.array): Points à évaluer (N, dim).
+
+    Returns:
+        scipy.sparse.csr_matrix: Matrice des poids barycentriques (N, M).
+    """
+    # find_simplex part du simplexe trouvé pour le point précédent et marche vers le point suivant :
+    # les pixels voisins tombant dans le même simplexe ou un simplexe adjacent, les points doivent
+    # rester dans l'ordre de l'image (voir benchmark.py --point-location)
+    with stage('delaunay_location', query_points=query_points):
+        simplices = tri.find_simplex(query_points, tol=1e-6)
     X = tri.transform[simplices, :query_points.shape[1]]
     Y = query_points - tri.transform[simplices, query_points.shape[1]]
     bary = np.einsum('...jk,...k->...j', X, Y)
     bary = np.c_[bary, 1 - bary.sum(axis=1)]
 
-    if option == 3:
-        n_query = len(query_points)
-        d = tri.simplices.shape[1]
-        rows = np.repeat(np.arange(n_query).reshape(-1, 1), d, axis=1).ravel()
-        cols = tri.simplices[simplices].ravel()
-        vals = bary.ravel()
-        weights = sparse.coo_matrix((vals, (rows, cols)), shape=(n_query, len(hull_points))).tocsr()
-    else:
-        raise NotImplementedError("Seule l'option 3 est implémentée.")
-
-    return weights
+    n_query = len(query_points)
+    d = tri.simplices.shape[1]
+    rows = np.repeat(np.arange(n_query).reshape(-1, 1), d, axis=1).ravel()
+    cols = tri.simplices[simplices].ravel()
+    vals = bary.ravel()
+    return sparse.coo_matrix((vals, (rows, cols)), shape=(n_query, tri.npoints)).tocsr()
 
 
-def compute_asap_weights_tan2016(img_labels, tetra_palette):
+def compute_asap_weights_tan2016(img_labels, tetra_palette, sink=NULL_SINK):
     """
     Calcule les poids ASAP via triangulation et coordonnées barycentriques (méthode Tan 2016).
 
     Args:
         img_labels (np.array): Labels de l'image (peut être (H, W, 3) ou (N, 3)).
         tetra_palette (np.array): Palette de couleurs (sommets du tétraèdre, (N, 3)).
+        sink (ProgressSink): Destination des messages de progression.
 
     Returns:
         np.array: Poids de mélange sous forme (H, W, N) ou (N, N) selon la forme d'entrée.
     """
     # Reordonnancement des sommets par distance à [0,0,0]
-    dist = np.abs(tetra_palette - np.array([[0, 0, 0]])).sum(axis=-1)
-    order = np.argsort(dist)
+    order = palette_order(tetra_palette)
     ordered_palette = tetra_palette[order]
 
     # Préparation des labels
@@ -163,7 +389,7 @@ def compute_asap_weights_tan2016(img_labels, tetra_palette):
     color_map, uniq_labels = build_color_map(labels_inside)
 
     # Attribution des pixels aux faces du tétraèdre et calcul local des poids
-    uniq_weights = assign_face_weights(uniq_labels, ordered_palette, hull, delaunay_test)
+    uniq_weights = assign_face_weights(uniq_labels, ordered_palette, hull, delaunay_test, sink)
     if uniq_weights is None:
         return
 
@@ -181,13 +407,94 @@ def compute_asap_weights_tan2016(img_labels, tetra_palette):
     diff_val = np.sqrt(np.square(diff.reshape(-1, 3)).sum(axis=-1))
     rmse = np.sqrt(np.square(diff.reshape(-1, 3)).sum() / diff.reshape(-1, 3).shape[0])
 
-    emit('server_log', {'data': f"Erreur maximale : {diff_val.max():.2f} (distance euclidienne)"})
-    emit('server_log', {'data': f"Erreur médiane : {median(diff_val):.2f} (distance euclidienne)"})
-    emit('server_log', {'data': f"RMSE : {rmse:.2f}"})
+    sink.log(f"Erreur maximale : {diff_val.max():.2f} (distance euclidienne)")
+    sink.log(f"Erreur médiane : {median(diff_val):.2f} (distance euclidienne)")
+    sink.log(f"RMSE : {rmse:.2f}")
 
     return reordered_weights
 
 
+def palette_order(tetra_palette):
+    """
+    Ordre des sommets de la palette utilisé par la méthode ASAP : le premier sommet
+    (le plus proche du noir) est commun à tous les tétraèdres.
+
+    Args:
+        tetra_palette (np.array): Palette de couleurs (N, 3).
+
+    Returns:
+        np.array: Indices des sommets triés par distance à [0,0,0].
+    """
+    dist = np.abs(tetra_palette - np.array([[0, 0, 0]])).sum(axis=-1)
+    return np.argsort(dist)
+
+
+def build_asap_lut(tetra_palette, resolution=ASAP_LUT_RESOLUTION, sink=NULL_SINK):
+    """
+    Précalcule les poids ASAP d'une palette sur une grille régulière du cube RGB.
+
+    Les poids ASAP ne dépendent que de la couleur : une fois la table construite,
+    les poids de n'importe quelle couleur s'obtiennent par interpolation trilinéaire
+    (voir asap_weights_from_lut), sans enveloppe, projection ni triangulation. La
+    table est utile dès qu'une même palette sert à plusieurs images (séquences).
+
+    Args:
+        tetra_palette (np.array): Palette de couleurs (N, 3) dans [0, 1].
+        resolution (int): Nombre de valeurs par canal.
+        sink (ProgressSink): Destination des messages de progression.
+
+    Returns:
+        np.array: Table (resolution, resolution, resolution, N) en float16, ou None en cas d'échec.
+    """
+    order = palette_order(tetra_palette)
+    ordered_palette = tetra_palette[order]
+    axis = np.linspace(0, 1, resolution)
+    grid = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1).reshape(-1, 3)
+
+    with stage('asap_lut', grid=grid) as record:
+        hull = ConvexHull(ordered_palette)
+        delaunay_test = Delaunay(ordered_palette)
+        # Les couleurs de la grille sont toutes distinctes : pas de table couleur -> indices
+        grid_inside = enforce_inside_hull(grid, hull, delaunay_test)
+        grid_weights = assign_face_weights(grid_inside, ordered_palette, hull, delaunay_test, sink)
+        if grid_weights is None:
+            return
+        lut = np.empty_like(grid_weights, dtype=np.float16)
+        lut[:, order] = grid_weights
+        record.add_arrays(lut=lut)
+    return lut.reshape((resolution, resolution, resolution, -1))
+
+
+def asap_weights_from_lut(lut, colors, chunk_size=PROJECTION_CHUNK):
+    """
+    Poids ASAP de couleurs quelconques, par interpolation trilinéaire dans une table précalculée.
+
+    Args:
+        lut (np.array): Table (R, R, R, N) construite par build_asap_lut.
+        colors (np.array): Couleurs (..., 3) dans [0, 1].
+        chunk_size (int): Nombre de couleurs traitées à la fois.
+
+    Returns:
+        np.array: Poids (..., N).
+    """
+    resolution, n_colors = lut.shape[0], lut.shape[-1]
+    flat_colors = colors.reshape(-1, 3)
+    weights = np.empty((len(flat_colors), n_colors))
+    for start in range(0, len(flat_colors), chunk_size):
+        coords = np.clip(flat_colors[start:start + chunk_size], 0, 1) * (resolution - 1)
+        base = np.minimum(coords.astype(np.intp), resolution - 2)
+        frac = coords - base
+        block = np.zeros((len(coords), n_colors))
+        # Somme des huit coins de la cellule, pondérés par leur coefficient trilinéaire
+        for corner in np.ndindex(2, 2, 2):
+            offset = np.array(corner)
+            coefficient = np.prod(np.where(offset, frac, 1 - frac), axis=1)
+            index = base + offset
+            block += coefficient[:, None] * lut[index[:, 0], index[:, 1], index[:, 2]]
+        weights[start:start + chunk_size] = block
+    return weights.reshape(colors.shape[:-1] + (n_colors,))
+
+
 def prepare_labels(image_array):
     """
     Aplati les labels d'une image et retourne leur forme originale.
@@ -215,15 +522,9 @@ def enforce_inside_hull(labels, hull_obj, delaunay_obj):
     """
     inside = delaunay_obj.find_simplex(labels, tol=1e-8)
     corrected = labels.copy()
-    for idx in range(labels.shape[0]):
-        if inside[idx] < 0:
-            dists = []
-            close_pts = []
-            for simplex in hull_obj.simplices:
-                res = point_triangle_distance(labels[idx], hull_obj.points[simplex])
-                dists.append(res['distance'])
-                close_pts.append(res['closest'])
-            corrected[idx] = close_pts[np.argmin(np.asarray(dists))]
+    outside = inside < 0
+    if outside.any():
+        corrected[outside] = project_to_hull(labels[outside], hull_obj)
     new_inside = delaunay_obj.find_simplex(corrected, tol=1e-8)
     assert np.all(new_inside >= 0), "Certains points sont toujours hors de l'enveloppe"
     return corrected
@@ -245,7 +546,7 @@ def build_color_map(labels):
     return col_map, uniq_labels
 
 
-def assign_face_weights(uniq_labels, palette, hull_obj, delaunay_obj):
+def assign_face_weights(uniq_labels, palette, hull_obj, delaunay_obj, sink=NULL_SINK):
     """
     Associe les pixels uniques aux faces du tétraèdre et calcule leurs poids barycentriques.
 
@@ -254,9 +555,10 @@ def assign_face_weights(uniq_labels, palette, hull_obj, delaunay_obj):
         palette (np.array): Palette (N, 3).
         hull_obj (ConvexHull): Enveloppe convexe de la palette.
         delaunay_obj (Delaunay): Triangulation de la palette.
+        sink (ProgressSink): Destination des messages de progression.
 
     Returns:
-        np.array: Poids locaux (K, N).
+        np.array: Poids locaux (K, N), ou None si des pixels n'ont pas pu être assignés.
     """
     face_pixel_map = {}
     n_vertices = palette.shape[0]
@@ -281,7 +583,7 @@ def assign_face_weights(uniq_labels, palette, hull_obj, delaunay_obj):
             except Exception:
                 continue
     if len(remaining) > 0:
-        emit('server_response', {'error': f"Erreur : {len(remaining)} pixels n'ont pas pu être assignés", 'reset': True})
+        sink.error(f"Erreur : {len(remaining)} pixels n'ont pas pu être assignés")
         return
 
     uniq_weights = np.zeros((len(uniq_labels), n_vertices))
@@ -0,0 +1,140 @@
+import logging
+import math
+
+import cv2
+import numpy as np
+
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# Type utilisé pour les calculs (les pixels sont normalisés dans [0, 1])
+COMPUTE_DTYPE = np.float64
+
+# Nombre de lignes testées à la fois lors de la détection des images en niveaux de gris
+GRAYSCALE_BLOCK_ROWS = 64
+
+
+def decode_image(img_bytes):
+    """
+    Décode une image encodée (PNG, JPEG, WebP...) en tableau BGR uint8.
+
+    OpenCV applique l'orientation EXIF lors du décodage avec IMREAD_COLOR,
+    l'image retournée est donc déjà dans le bon sens.
+
+    Paramètres:
+      - img_bytes: octets de l'image encodée
+
+    Retourne:
+      - np.array de forme (H, W, 3) en uint8, ou None si le décodage échoue
+    """
+    # frombuffer ne copie pas les octets, seul imdecode alloue l'image
+    nparr = np.frombuffer(img_bytes, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def is_grayscale(img, block_rows=GRAYSCALE_BLOCK_ROWS):
+    """
+    Vérifie si une image BGR est en niveaux de gris (trois canaux égaux).
+
+    On compare les canaux par blocs de lignes et on s'arrête dès qu'un bloc
+    contient un pixel coloré : une image en couleur est généralement rejetée
+    dès le premier bloc, sans allouer de copie de l'image entière.
+
+    Paramètres:
+      - img: np.array de forme (H, W, 3)
+      - block_rows: nombre de lignes comparées à chaque étape
+
+    Retourne:
+      - True si tous les pixels ont trois canaux égaux, False sinon
+    """
+    for start in range(0, img.shape[0], block_rows):
+        block = img[start:start + block_rows]
+        if not np.array_equal(block[..., 0], block[..., 1]) or not np.array_equal(block[..., 1], block[..., 2]):
+            return False
+    return True
+
+
+def resize_to_working_resolution(img, max_pixels):
+    """
+    Réduit l'image pour qu'elle contienne au plus max_pixels pixels.
+
+    Paramètres:
+      - img: np.array de forme (H, W, 3)
+      - max_pixels: nombre maximal de pixels, None pour conserver la résolution d'origine
+
+    Retourne:
+      - L'image redimensionnée (ou l'image d'origine si aucun redimensionnement n'est nécessaire)
+    """
+    height, width = img.shape[:2]
+    if max_pixels is None or height * width <= max_pixels:
+        return img
+
+    scale = math.sqrt(max_pixels / float(height * width))
+    new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    # INTER_AREA donne le meilleur résultat pour une réduction
+    return cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+
+
+def to_compute_pixels(img, dtype=COMPUTE_DTYPE):
+    """
+    Convertit une image BGR uint8 en RGB normalisé dans [0, 1].
+
+    Le passage BGR -> RGB se fait par une vue et la normalisation directement
+    dans le tableau de sortie : la conversion n'alloue qu'un seul tableau.
+
+    Paramètres:
+      - img: np.array de forme (H, W, 3) en BGR uint8
+      - dtype: type des pixels retournés
+
+    Retourne:
+      - np.array de forme (H, W, 3) en RGB dans [0, 1]
+    """
+    pixels = np.empty(img.shape, dtype=dtype)
+    np.divide(img[..., ::-1], 255.0, out=pixels, casting='unsafe')
+    return pixels
+
+
+def normalize_input_image(img_bytes, max_pixels=None, dtype=COMPUTE_DTYPE):
+    """
+    Étape unique de préparation d'une image reçue : décodage, rejet des images
+    en niveaux de gris, réduction à la résolution de travail et conversion au
+    type de calcul.
+
+    Paramètres:
+      - img_bytes: octets de l'image encodée
+      - max_pixels: nombre maximal de pixels de travail (None pour ne pas redimensionner)
+      - dtype: type des pixels retournés
+
+    Retourne:
+      - (pixels, None) avec pixels de forme (H, W, 3) en RGB dans [0, 1],
+        ou (None, message d'erreur) si l'image est invalide
+    """
+    # Tableaux de la taille de l'image alloués par chaque étape
+    allocations = {}
+
+    with stage('decode') as record:
+        img = decode_image(img_bytes)
+    if img is None:
+        return None, "Données image invalides"
+    record.add_arrays(image=img)
+    allocations['decode'] = [img]
+
+    with stage('grayscale_check', image=img):
+        grayscale = is_grayscale(img)
+    allocations['grayscale'] = []
+    if grayscale:
+        return None, "L'image doit être en couleur"
+
+    with stage('normalization') as record:
+        resized = resize_to_working_resolution(img, max_pixels)
+        allocations['resize'] = [] if resized is img else [resized]
+
+        pixels = to_compute_pixels(resized, dtype)
+        allocations['conversion'] = [pixels]
+        record.add_arrays(pixels=pixels)
+
+    logger.info("Allocations par étape : %s",
+                ", ".join(f"{stage}={len(arrays)} ({sum(a.nbytes for a in arrays) / 1e6:.1f} Mo)"
+                          for stage, arrays in allocations.items()))
+    return pixels, None
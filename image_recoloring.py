@@ -0,0 +1,249 @@
+import struct
+import zlib
+
+import numpy as np
+
+# Nombre de lignes de l'image traitées à la fois (recoloration, quantification, encodage)
+BLOCK_ROWS = 64
+
+# Nombre maximal de couches conservées par pixel dans le format creux (voir TopKWeights)
+TOPK_LAYERS = 4
+
+# Taille des morceaux envoyés lorsqu'une image est encodée d'un bloc (WebP)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def quantize_weights(mix_weights, block_rows=BLOCK_ROWS):
+    """
+    Convertit les poids de mélange (H, W, N) dans [0, 1] en uint8 (0-255).
+
+    La conversion se fait par blocs de lignes pour ne jamais allouer de copie
+    flottante de la taille du tenseur complet.
+    """
+    quantized = np.empty(mix_weights.shape, dtype=np.uint8)
+    for start in range(0, mix_weights.shape[0], block_rows):
+        block = np.clip(mix_weights[start:start + block_rows], 0, 1) * 255
+        np.rint(block, out=block)
+        quantized[start:start + block_rows] = block
+    return quantized
+
+
+def topk_weights(weights, k=TOPK_LAYERS):
+    """
+    Ne garde, pour chaque pixel d'un bloc, que les k couches de plus fort poids.
+
+    Les poids conservés sont renormalisés puis quantifiés en uint8 de somme exactement
+    255 (l'arrondi est reporté sur le plus fort poids) : la reconstruction reste une
+    combinaison convexe des couleurs de la palette.
+
+    Paramètres:
+      - weights: poids de mélange (..., N) dans [0, 1] (flottants) ou [0, 255] (uint8)
+      - k: nombre de couches conservées par pixel (au plus N)
+
+    Retourne:
+      - (indices (..., k) uint8 des couches, par poids décroissant, poids (..., k) uint8)
+    """
+    weights = np.asarray(weights, dtype=np.float32)
+    k = min(k, weights.shape[-1])
+    indices = np.argsort(-weights, axis=-1, kind='stable')[..., :k]
+    values = np.clip(np.take_along_axis(weights, indices, axis=-1), 0, None)
+
+    total = values.sum(axis=-1, keepdims=True)
+    # Un pixel sans aucun poids (cas dégénéré) est attribué entièrement à sa première couche
+    empty = total == 0
+    values[..., :1] += empty
+    values *= 255 / (total + empty)
+    np.rint(values, out=values)
+    values[..., 0] += 255 - values.sum(axis=-1)
+    return indices.astype(np.uint8), values.astype(np.uint8)
+
+
+class TopKWeights:
+    """
+    Poids de mélange creux : pour chaque pixel, les k couches de plus fort poids,
+    sous forme de paires (indice de couche, poids uint8).
+
+    Chaque pixel ne dépend que des sommets d'un tétraèdre de la palette : au-delà de
+    quatre couleurs, la plupart de ses poids sont nuls. Le format occupe 2k octets
+    par pixel, quelle que soit la taille de la palette. Découpé par lignes
+    (weights[start:stop]), il rend des poids denses uint8 : il s'utilise comme le
+    tenseur de quantize_weights (recolor_blocks, recolor_stream...).
+    """
+
+    def __init__(self, indices, values, n_layers):
+        self.indices = indices
+        self.values = values
+        self.n_layers = n_layers
+
+    @classmethod
+    def from_dense(cls, weights, k=TOPK_LAYERS, block_rows=BLOCK_ROWS):
+        """
+        Convertit des poids denses (H, W, N), flottants dans [0, 1] ou uint8, bloc de lignes par bloc.
+        """
+        # Les poids conservés étant renormalisés, leur échelle d'origine n'importe pas
+        height, width, n_layers = weights.shape
+        k = min(k, n_layers)
+        indices = np.empty((height, width, k), dtype=np.uint8)
+        values = np.empty((height, width, k), dtype=np.uint8)
+        for start in range(0, height, block_rows):
+            indices[start:start + block_rows], values[start:start + block_rows] = \
+                topk_weights(weights[start:start + block_rows], k)
+        return cls(indices, values, n_layers)
+
+    @property
+    def shape(self):
+        return self.indices.shape[:2] + (self.n_layers,)
+
+    @property
+    def nbytes(self):
+        return self.indices.nbytes + self.values.nbytes
+
+    def __getitem__(self, rows):
+        # Poids denses (lignes, W, N) en uint8 d'une tranche de lignes
+        indices, values = self.indices[rows], self.values[rows]
+        dense = np.zeros(indices.shape[:2] + (self.n_layers,), dtype=np.uint8)
+        np.put_along_axis(dense, indices.astype(np.intp), values, axis=-1)
+        return dense
+
+    def dense(self):
+        # Poids denses complets (H, W, N) en uint8
+        return self[:]
+
+
+def compact_weights(mix_weights, k=TOPK_LAYERS):
+    """
+    Quantifie des poids de mélange (H, W, N) dans le format le plus compact : TopKWeights (2k
+    octets par pixel) au-delà de 2k couches, poids denses uint8 (N octets par pixel, sans perte
+    de couches) sinon.
+    """
+    if mix_weights.shape[-1] > 2 * k:
+        return TopKWeights.from_dense(mix_weights, k)
+    return quantize_weights(mix_weights)
+
+
+def recolor_blocks(weights, palette, block_rows=BLOCK_ROWS):
+    """
+    Recolore une image décomposée avec une nouvelle palette, bloc de lignes par bloc.
+
+    Paramètres:
+      - weights: poids de mélange (H, W, N) en uint8, ou TopKWeights
+      - palette: couleurs (N, 3) RGB dans [0, 255], dans l'ordre des couches
+      - block_rows: nombre de lignes par bloc
+
+    Retourne:
+      - Un générateur de blocs (lignes, W, 3) en uint8 RGB
+    """
+    # Les poids sont dans [0, 255] : on divise la palette par 255 une seule fois
+    palette = np.asarray(palette, dtype=np.float32) / 255
+    for start in range(0, weights.shape[0], block_rows):
+        block = np.matmul(weights[start:start + block_rows], palette, dtype=np.float32)
+        np.rint(block, out=block)
+        np.clip(block, 0, 255, out=block)
+        yield block.astype(np.uint8)
+
+
+def recolor_image(weights, palette, block_rows=BLOCK_ROWS):
+    # Image recolorée complète (H, W, 3) en uint8 RGB.
+    return np.concatenate(list(recolor_blocks(weights, palette, block_rows)), axis=0)
+
+
+def recolored_rmse(weights, palette, image, block_rows=BLOCK_ROWS):
+    """
+    Erreur (RMSE, en niveaux 0-255) de l'image effectivement rendue à partir de poids
+    quantifiés (uint8 ou TopKWeights), par rapport à l'image originale.
+
+    Paramètres:
+      - weights: poids de mélange (H, W, N) en uint8, ou TopKWeights
+      - palette: couleurs (N, 3) RGB dans [0, 1]
+      - image: image originale (H, W, 3) dans [0, 1]
+    """
+    total = 0.0
+    palette = np.rint(np.asarray(palette) * 255)
+    for start, block in zip(range(0, image.shape[0], block_rows), recolor_blocks(weights, palette, block_rows)):
+        err = block - image[start:start + block_rows] * 255
+        total += np.square(err).sum()
+    return float(np.sqrt(total / (image.shape[0] * image.shape[1])))
+
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+
+def encode_png_stream(blocks, width, height, compression=6):
+    """
+    Encode en PNG (RGB 8 bits) une image fournie par blocs de lignes, au fil de l'eau.
+
+    Chaque bloc est filtré (filtre « Sub ») et compressé dès sa réception : ni
+    l'image complète ni le fichier complet ne sont conservés en mémoire.
+
+    Paramètres:
+      - blocks: itérable de blocs (lignes, width, 3) en uint8 RGB
+      - width, height: dimensions de l'image
+      - compression: niveau de compression zlib (0-9)
+
+    Retourne:
+      - Un générateur d'octets formant le fichier PNG
+    """
+    yield PNG_SIGNATURE
+    yield _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    compressor = zlib.compressobj(compression)
+    for block in blocks:
+        pixels = block.reshape(block.shape[0], -1)
+        rows = np.empty((pixels.shape[0], pixels.shape[1] + 1), dtype=np.uint8)
+        # Filtre Sub : chaque octet moins l'octet du pixel précédent (modulo 256)
+        rows[:, 0] = 1
+        rows[:, 1:4] = pixels[:, :3]
+        np.subtract(pixels[:, 3:], pixels[:, :-3], out=rows[:, 4:])
+        data = compressor.compress(rows.tobytes())
+        if data:
+            yield _png_chunk(b'IDAT', data)
+
+    yield _png_chunk(b'IDAT', compressor.flush())
+    yield _png_chunk(b'IEND', b'')
+
+
+def encode_webp_stream(blocks, quality=90):
+    """
+    Encode en WebP une image fournie par blocs de lignes.
+
+    L'encodeur WebP d'OpenCV a besoin de l'image complète (3 octets par pixel) ;
+    seul le fichier encodé est ensuite envoyé par morceaux.
+    """
+    import cv2
+
+    image = np.concatenate(list(blocks), axis=0)
+    ok, encoded = cv2.imencode('.webp', cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_WEBP_QUALITY, quality])
+    if not ok:
+        raise ValueError("Échec de l'encodage WebP")
+    encoded = encoded.tobytes()
+    for start in range(0, len(encoded), STREAM_CHUNK_SIZE):
+        yield encoded[start:start + STREAM_CHUNK_SIZE]
+
+
+# Formats d'export : (type MIME, encodeur)
+EXPORT_FORMATS = {
+    'png': ('image/png', lambda blocks, width, height: encode_png_stream(blocks, width, height)),
+    'webp': ('image/webp', lambda blocks, width, height: encode_webp_stream(blocks)),
+}
+
+
+def recolor_stream(weights, palette, image_format='png'):
+    """
+    Recolore une image décomposée et l'encode au fil de l'eau.
+
+    Paramètres:
+      - weights: poids de mélange (H, W, N) en uint8 (voir quantize_weights), ou TopKWeights
+      - palette: couleurs (N, 3) RGB dans [0, 255]
+      - image_format: 'png' ou 'webp'
+
+    Retourne:
+      - (type MIME, générateur d'octets du fichier encodé)
+    """
+    if image_format not in EXPORT_FORMATS:
+        raise ValueError(f"Format d'export inconnu : {image_format}")
+    height, width = weights.shape[:2]
+    mimetype, encoder = EXPORT_FORMATS[image_format]
+    return mimetype, encoder(recolor_blocks(weights, palette), width, height)
@@ -0,0 +1,413 @@
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes (durées en secondes, tailles en octets)
+DURATION_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(2 ** p for p in range(10, 36, 2))  # de 1 Ko à 32 Go
+
+# Nombre de profils de requêtes conservés en mémoire
+RECENT_PROFILES = 100
+
+# Intervalle d'échantillonnage (en secondes) de la RSS pendant les étapes et les requêtes en cours
+RSS_SAMPLE_INTERVAL = 0.01
+
+_local = threading.local()
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+recent_profiles = deque(maxlen=RECENT_PROFILES)
+
+
+def peak_rss():
+    """
+    Retourne le pic de mémoire résidente (RSS) du processus depuis son lancement, en octets.
+
+    Ce pic ne redescend jamais : il ne mesure qu'un processus à usage unique (cas du
+    banc d'essai). Pour une étape ou une requête, voir RssWindow.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en kilo-octets sous Linux et en octets sous macOS
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def current_rss():
+    """
+    Retourne la mémoire résidente (RSS) actuelle du processus, en octets
+    (le pic RSS si /proc n'est pas disponible).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return peak_rss()
+
+
+class RssWindow:
+    """
+    Mesure de la RSS pendant un bloc de code : valeur à l'ouverture et pic atteint jusqu'à
+    la fermeture (voir open_rss_window et close_rss_window).
+
+    Le pic est échantillonné par un thread commun à toutes les fenêtres ouvertes du processus,
+    toutes les RSS_SAMPLE_INTERVAL secondes, ainsi qu'à l'ouverture et à la fermeture. Avec
+    plusieurs requêtes simultanées dans le même processus, le pic d'une fenêtre inclut la
+    mémoire des autres ; l'augmentation (delta) reste la meilleure estimation de sa part.
+
+    Attributs:
+      - start: RSS à l'ouverture, en octets
+      - peak: pic de RSS pendant la fenêtre, en octets
+    """
+
+    def __init__(self):
+        self.start = current_rss()
+        self.peak = self.start
+
+    def update(self, rss):
+        if rss > self.peak:
+            self.peak = rss
+
+    @property
+    def delta(self):
+        # Mémoire ajoutée au plus fort de la fenêtre par rapport à son ouverture
+        return self.peak - self.start
+
+
+_rss_condition = threading.Condition()
+_rss_windows = set()
+_rss_sampler = None
+
+
+def _reset_rss_sampler():
+    # Après un fork, le thread d'échantillonnage du parent n'existe pas dans l'enfant
+    global _rss_condition, _rss_windows, _rss_sampler
+    _rss_condition = threading.Condition()
+    _rss_windows = set()
+    _rss_sampler = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_rss_sampler)
+
+
+def _sample_rss():
+    while True:
+        with _rss_condition:
+            while not _rss_windows:
+                _rss_condition.wait()
+            windows = list(_rss_windows)
+        rss = current_rss()
+        for window in windows:
+            window.update(rss)
+        time.sleep(RSS_SAMPLE_INTERVAL)
+
+
+def open_rss_window():
+    """
+    Ouvre une fenêtre de mesure de la RSS (démarre le thread d'échantillonnage au besoin).
+    """
+    global _rss_sampler
+    window = RssWindow()
+    with _rss_condition:
+        if _rss_sampler is None:
+            _rss_sampler = threading.Thread(target=_sample_rss, name='rss-sampler', daemon=True)
+            _rss_sampler.start()
+        _rss_windows.add(window)
+        _rss_condition.notify()
+    return window
+
+
+def close_rss_window(window):
+    """
+    Ferme une fenêtre de mesure de la RSS, après un dernier échantillon.
+    """
+    window.update(current_rss())
+    with _rss_condition:
+        _rss_windows.discard(window)
+    return window
+
+
+class Histogram:
+    """
+    Histogramme cumulatif au format Prometheus (bornes fixes, somme et nombre d'observations).
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def observe(metric, labels, value, buckets=DURATION_BUCKETS):
+    """
+    Ajoute une observation à l'histogramme (metric, labels), créé au besoin.
+
+    Paramètres:
+      - metric: nom de la métrique (ex: "stage_duration_seconds")
+      - labels: tuple de paires (nom, valeur) identifiant la série
+      - value: valeur observée
+      - buckets: bornes utilisées si l'histogramme n'existe pas encore
+    """
+    with _lock:
+        key = (metric, labels)
+        if key not in _histograms:
+            _histograms[key] = Histogram(buckets)
+        _histograms[key].observe(value)
+
+
+def increment(metric, labels, value=1):
+    """
+    Incrémente le compteur (metric, labels), créé au besoin (exporté sous le nom <metric>_total).
+
+    Paramètres:
+      - metric: nom de la métrique (ex: "admission_refused")
+      - labels: tuple de paires (nom, valeur) identifiant la série
+      - value: valeur ajoutée
+    """
+    with _lock:
+        key = (metric, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def array_nbytes(value):
+    """
+    Taille en octets d'un tableau (ou d'une matrice creuse), 0 si inconnue.
+    """
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if hasattr(value, 'data') and hasattr(value.data, 'nbytes'):
+        return int(value.data.nbytes)
+    return 0
+
+
+class StageRecord:
+    """
+    Mesures d'une exécution d'étape : durée, pic RSS et augmentation de la RSS pendant
+    l'étape (voir RssWindow), taille des tableaux manipulés et compteurs libres
+    (nombre de sommets, de faces...).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.peak_rss = 0
+        self.rss_delta = 0
+        self.arrays = {}
+        self.counts = {}
+
+    def add_arrays(self, **arrays):
+        # On ne conserve que les tailles, jamais les tableaux eux-mêmes
+        for key, value in arrays.items():
+            self.arrays[key] = array_nbytes(value)
+
+    def add_counts(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + int(value)
+
+
+class RequestProfile:
+    """
+    Agrège les étapes exécutées pendant une requête (upload, harmonisation...).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.seconds = 0.0
+        self.peak_rss = 0
+        self.rss_delta = 0
+        # Des étapes peuvent être enregistrées depuis plusieurs threads de calcul (voir in_profile)
+        self._lock = threading.Lock()
+
+    def record(self, stage_record):
+        with self._lock:
+            self._record(stage_record)
+
+    def _record(self, stage_record):
+        entry = self.stages.setdefault(stage_record.name, {'count': 0, 'seconds': 0.0, 'peak_rss': 0,
+                                                           'rss_delta': 0, 'arrays': {}, 'counts': {}})
+        entry['count'] += 1
+        entry['seconds'] += stage_record.seconds
+        entry['peak_rss'] = max(entry['peak_rss'], stage_record.peak_rss)
+        entry['rss_delta'] = max(entry['rss_delta'], stage_record.rss_delta)
+        for key, nbytes in stage_record.arrays.items():
+            entry['arrays'][key] = max(entry['arrays'].get(key, 0), nbytes)
+        for key, value in stage_record.counts.items():
+            entry['counts'][key] = entry['counts'].get(key, 0) + value
+
+    def to_dict(self):
+        return {'request': self.name, 'seconds': self.seconds, 'peak_rss': self.peak_rss, 'rss_delta': self.rss_delta,
+                'stages': self.stages}
+
+
+def current_profile():
+    """
+    Retourne le profil de la requête en cours dans ce thread (ou None).
+    """
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def request_profile(name):
+    """
+    Ouvre un profil de requête : toutes les étapes exécutées dans le bloc, dans
+    ce thread, y sont agrégées. À la sortie, on alimente les histogrammes de
+    requête et on conserve le profil dans recent_profiles. Le pic RSS et son
+    augmentation sont mesurés pendant la requête seulement (voir RssWindow).
+    """
+    previous = current_profile()
+    profile = RequestProfile(name)
+    _local.profile = profile
+    window = open_rss_window()
+    t0 = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.seconds = time.perf_counter() - t0
+        close_rss_window(window)
+        profile.peak_rss = window.peak
+        profile.rss_delta = window.delta
+        _local.profile = previous
+
+        labels = (('request', name),)
+        observe('request_duration_seconds', labels, profile.seconds)
+        observe('request_peak_rss_bytes', labels, profile.peak_rss, BYTES_BUCKETS)
+        observe('request_rss_delta_bytes', labels, profile.rss_delta, BYTES_BUCKETS)
+        recent_profiles.append(profile.to_dict())
+        logger.info("Profil %s : %.2f s, pic RSS %.1f Mo (+%.1f Mo), %s", name, profile.seconds,
+                    profile.peak_rss / 1e6, profile.rss_delta / 1e6,
+                    ", ".join(f"{stage}={entry['seconds']:.3f}s×{entry['count']}" for stage, entry in profile.stages.items()))
+
+
+def in_profile(fn, profile=None):
+    """
+    Enveloppe fn pour qu'elle enregistre ses étapes dans un profil de requête,
+    quel que soit le thread qui l'exécute (pool de threads de calcul).
+
+    Paramètres:
+      - fn: fonction à envelopper
+      - profile: profil cible, par défaut celui du thread appelant
+
+    Retourne:
+      - La fonction enveloppée
+    """
+    profile = profile if profile is not None else current_profile()
+
+    def wrapper(*args, **kwargs):
+        previous = current_profile()
+        _local.profile = profile
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.profile = previous
+    return wrapper
+
+
+@contextmanager
+def stage(name, **arrays):
+    """
+    Mesure une étape de calcul (durée, pic et augmentation de la RSS pendant l'étape, taille des tableaux).
+
+    Utilisation :
+        with stage('initial_hull', points=points) as record:
+            hull = ConvexHull(points)
+            record.add_arrays(vertices=hull.vertices)
+
+    Les mesures alimentent les histogrammes globaux et, si une requête est en
+    cours (voir request_profile), le profil de cette requête.
+    """
+    record = StageRecord(name)
+    record.add_arrays(**arrays)
+    window = open_rss_window()
+    t0 = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - t0
+        close_rss_window(window)
+        record.peak_rss = window.peak
+        record.rss_delta = window.delta
+
+        labels = (('stage', name),)
+        observe('stage_duration_seconds', labels, record.seconds)
+        observe('stage_rss_delta_bytes', labels, record.rss_delta, BYTES_BUCKETS)
+        if record.arrays:
+            observe('stage_array_bytes', labels, sum(record.arrays.values()), BYTES_BUCKETS)
+
+        profile = current_profile()
+        if profile is not None:
+            profile.record(record)
+
+
+def _format_labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+def export_prometheus(extra_labels=()):
+    """
+    Exporte les histogrammes et les compteurs au format texte de Prometheus.
+
+    Paramètres:
+      - extra_labels: paires (nom, valeur) ajoutées à toutes les séries (ex: le port du serveur socket)
+
+    Retourne:
+      - Le texte à servir sur /metrics
+    """
+    with _lock:
+        snapshot = sorted(((metric, labels, hist.buckets, list(hist.counts), hist.sum, hist.count)
+                           for (metric, labels), hist in _histograms.items()))
+        counters = sorted(_counters.items())
+
+    lines = []
+    current_metric = None
+    for metric, labels, buckets, counts, total, count in snapshot:
+        name = f"harmony_{metric}"
+        if metric != current_metric:
+            lines.append(f"# TYPE {name} histogram")
+            current_metric = metric
+        series = tuple(extra_labels) + labels
+        for bound, bucket_count in zip(buckets, counts):
+            lines.append(f'{name}_bucket{{{_format_labels(series + (("le", repr(float(bound))),))}}} {bucket_count}')
+        lines.append(f'{name}_bucket{{{_format_labels(series + (("le", "+Inf"),))}}} {count}')
+        lines.append(f'{name}_sum{{{_format_labels(series)}}} {total}')
+        lines.append(f'{name}_count{{{_format_labels(series)}}} {count}')
+
+    current_metric = None
+    for (metric, labels), value in counters:
+        name = f"harmony_{metric}_total"
+        if metric != current_metric:
+            lines.append(f"# TYPE {name} counter")
+            current_metric = metric
+        lines.append(f'{name}{{{_format_labels(tuple(extra_labels) + labels)}}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def merge_prometheus(texts):
+    """
+    Fusionne plusieurs exports Prometheus (un par processus) en un seul texte
+    où chaque métrique n'est déclarée qu'une fois.
+    """
+    families = {}
+    for text in texts:
+        current = None
+        for line in text.splitlines():
+            if line.startswith('# TYPE '):
+                current = line.split()[2]
+                families.setdefault(current, [line])
+            elif line and current is not None:
+                families[current].append(line)
+    return "\n".join(line for lines in families.values() for line in lines) + "\n"
@@ -0,0 +1,327 @@
+"""
+Test de charge : clients Socket.IO simulés contre le serveur web et ses serveurs socket.
+
+Chaque client simulé se comporte comme static/js/main.js : il demande un serveur
+socket à /get_socket_id, s'y connecte, envoie une image (upload_image) puis, une
+fois toutes les couches reçues, demande l'harmonisation de sa palette (harmonize).
+Pour chaque requête, on mesure le temps jusqu'à l'enveloppe convexe simplifiée,
+jusqu'à la première couche (aperçu ou bande) et jusqu'à la dernière bande, ainsi
+que les erreurs. Le serveur (python main.py) est lancé pour chaque nombre de
+serveurs socket testé ; les courbes de débit sont données pour chaque nombre de
+clients simultanés.
+
+Les clients utilisent python-socketio (dépendance de Flask-SocketIO) avec ses
+dépendances client : pip install -r requirements-dev.txt.
+
+Exemples :
+    python loadtest.py --clients 1 2 4 8 --sockets 1 2 4
+    python loadtest.py --url http://127.0.0.1:5000 --clients 4 --uploads 5
+"""
+import argparse
+import base64
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from benchmark import download_gallery, gallery_image, image_size, synthetic_image
+
+CLIENTS = [1, 2, 4, 8]
+SOCKET_PROCESSES = [1, 2]
+SYNTHETIC_IMAGES = ['gradient', 'blobs']
+RESOLUTIONS = [0.05, 0.25]  # en mégapixels
+UPLOADS_PER_CLIENT = 3
+BASE_PORT = 5400
+OUTPUT_PATH = 'loadtest_results.json'
+
+# Délai maximal d'une requête (upload et harmonisation), en secondes
+REQUEST_TIMEOUT = 300
+
+# Délai maximal de démarrage du serveur, en secondes
+STARTUP_TIMEOUT = 120
+
+PERCENTILES = (50, 90, 99)
+TIMINGS = ('hull', 'first_layer', 'last_layer', 'harmonized')
+
+
+# -------------------------------
+# IMAGES
+# -------------------------------
+def encode_image(pixels):
+    # Image RGB dans [0, 1] encodée comme le navigateur l'envoie (data URL PNG)
+    import cv2
+
+    ok, png = cv2.imencode('.png', cv2.cvtColor(np.rint(pixels * 255).astype(np.uint8), cv2.COLOR_RGB2BGR))
+    return 'data:image/png;base64,' + base64.b64encode(png.tobytes()).decode('ascii')
+
+
+def image_mix(synthetic, gallery, resolutions):
+    """
+    Prépare les images envoyées par les clients : chaque image synthétique et de la
+    galerie, à chaque résolution.
+
+    Retourne:
+      - Une liste de (nom, data URL)
+    """
+    images = []
+    for megapixels in resolutions:
+        height, width = image_size(megapixels)
+        for name in synthetic:
+            images.append((f"{name}@{megapixels}MP", encode_image(synthetic_image(name, height, width))))
+        for img_id in download_gallery(gallery) if gallery else []:
+            images.append((f"{img_id}@{megapixels}MP", encode_image(gallery_image(img_id, height, width))))
+    return images
+
+
+# -------------------------------
+# CLIENT SIMULÉ
+# -------------------------------
+class SimulatedClient:
+    """
+    Client Socket.IO qui enchaîne des uploads et des harmonisations, et mesure
+    les temps de réponse de chacun.
+    """
+
+    def __init__(self, base_url, timeout=REQUEST_TIMEOUT):
+        import socketio
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.sio = socketio.Client(reconnection=False)
+        self.done = threading.Event()
+        self.sample = None
+        self.t0 = 0.0
+        self.palette = None
+
+        self.sio.on('convex_hull', self.on_convex_hull)
+        self.sio.on('layer_preview', self.on_first_layer)
+        self.sio.on('layer_tile', self.on_layer_tile)
+        self.sio.on('harmonized', self.on_harmonized)
+        self.sio.on('server_response', self.on_server_response)
+        self.sio.on('error', self.on_error)
+
+    def connect(self):
+        # Même répartition que le navigateur : le serveur web choisit le serveur socket
+        with urllib.request.urlopen(f"{self.base_url}/get_socket_id", timeout=10) as response:
+            data = json.load(response)
+        if data.get('socket_id'):
+            self.sio.connect(self.base_url, socketio_path=f"/{data['socket_id']}/socket.io", wait_timeout=10)
+        else:
+            host = self.base_url.rsplit(':', 1)[0] if self.base_url.count(':') > 1 else self.base_url
+            self.sio.connect(f"{host}:{data['socket_port']}", wait_timeout=10)
+
+    def elapsed(self):
+        return time.perf_counter() - self.t0
+
+    def on_convex_hull(self, data):
+        if data['type'] == 'simplified' and self.sample.get('hull') is None:
+            self.sample['hull'] = self.elapsed()
+            vertices = np.frombuffer(data['positions'], dtype=np.float32).reshape(-1, 3)
+            self.palette = np.rint(vertices * 255).astype(int).tolist()
+
+    def on_first_layer(self, data):
+        if self.sample.get('first_layer') is None:
+            self.sample['first_layer'] = self.elapsed()
+
+    def on_layer_tile(self, data):
+        self.on_first_layer(data)
+        if data['row'] + data['rows'] == data['height']:
+            self.sample['last_layer'] = self.elapsed()
+            self.done.set()
+
+    def on_harmonized(self, data):
+        self.sample['harmonized'] = self.elapsed()
+        self.done.set()
+
+    def on_server_response(self, data):
+        if data.get('error'):
+            self.fail(data['error'])
+        elif data.get('warning'):
+            self.sample['warning'] = data['warning']
+
+    def on_error(self, data):
+        self.fail(data.get('message', 'erreur'))
+
+    def fail(self, message):
+        self.sample['error'] = message
+        self.done.set()
+
+    def request(self, event, data):
+        # Envoie un événement et attend sa réponse (ou une erreur, ou le délai maximal)
+        self.done.clear()
+        self.sio.emit(event, data)
+        if not self.done.wait(self.timeout):
+            self.sample['error'] = f"délai dépassé ({event})"
+        return 'error' not in self.sample
+
+    def run(self, images, uploads, harmonize=True):
+        """
+        Enchaîne uploads requêtes sur des images tirées dans images.
+
+        Retourne:
+          - Une liste d'échantillons {'image', 'hull', 'first_layer', 'last_layer', 'harmonized', 'error'}
+        """
+        samples = []
+        try:
+            self.connect()
+        except Exception as e:
+            return [{'image': None, 'error': f"connexion impossible : {e}"}]
+        try:
+            for name, image_data in images[:uploads]:
+                self.sample = {'image': name}
+                self.palette = None
+                self.t0 = time.perf_counter()
+                if self.request('upload_image', {'image_data': image_data}) and harmonize and self.palette:
+                    self.request('harmonize', {'palette': self.palette})
+                samples.append(self.sample)
+        finally:
+            self.sio.disconnect()
+        return samples
+
+
+def run_clients(base_url, images, clients, uploads, harmonize=True, seed=0):
+    """
+    Lance clients clients simultanés, chacun avec sa propre suite d'images.
+
+    Retourne:
+      - (échantillons, durée totale en secondes)
+    """
+    rng = np.random.default_rng(seed)
+    results = [[] for _ in range(clients)]
+
+    def worker(index, client_images):
+        results[index] = SimulatedClient(base_url).run(client_images, uploads, harmonize)
+
+    threads = []
+    t0 = time.perf_counter()
+    for index in range(clients):
+        client_images = [images[i] for i in rng.integers(len(images), size=uploads)]
+        thread = threading.Thread(target=worker, args=(index, client_images), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return [sample for samples in results for sample in samples], time.perf_counter() - t0
+
+
+# -------------------------------
+# SERVEUR
+# -------------------------------
+def start_server(port, sockets):
+    """
+    Lance python main.py avec sockets serveurs socket et attend qu'ils répondent.
+
+    Retourne:
+      - Le processus du serveur web (chef de son groupe de processus)
+    """
+    server = subprocess.Popen([sys.executable, 'main.py', str(port), str(sockets)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.time() + STARTUP_TIMEOUT
+    pending = [f"http://127.0.0.1:{port}/get_socket_id"] + \
+              [f"http://127.0.0.1:{port + i}/metrics" for i in range(1, sockets + 1)]
+    while pending:
+        if server.poll() is not None or time.time() > deadline:
+            stop_server(server)
+            raise RuntimeError(f"Le serveur n'a pas démarré (port {port}, {sockets} serveurs socket)")
+        try:
+            urllib.request.urlopen(pending[0], timeout=2).close()
+            pending.pop(0)
+        except OSError:
+            time.sleep(0.5)
+    return server
+
+
+def stop_server(server):
+    # Le serveur web, le fork server et les serveurs socket partagent le même groupe de processus
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=10)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(server.pid, signal.SIGKILL)
+
+
+# -------------------------------
+# RAPPORT
+# -------------------------------
+def summarize(samples, seconds, clients, sockets):
+    """
+    Résume une série : percentiles des temps de réponse, erreurs et débit.
+    """
+    completed = [s for s in samples if 'error' not in s]
+    summary = {
+        'sockets': sockets,
+        'clients': clients,
+        'requests': len(samples),
+        'errors': len(samples) - len(completed),
+        'degraded': sum(1 for s in samples if 'warning' in s),
+        'seconds': seconds,
+        'throughput': len(completed) / seconds if seconds else 0.0,
+        'error_messages': sorted({s['error'] for s in samples if 'error' in s}),
+    }
+    for timing in TIMINGS:
+        values = [s[timing] for s in completed if s.get(timing) is not None]
+        summary[timing] = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES} if values else None
+    return summary
+
+
+def format_summary(summary):
+    def percentiles(timing):
+        values = summary[timing]
+        return "-" if values is None else "/".join(f"{values[f'p{p}']:.2f}" for p in PERCENTILES)
+
+    return (f"{summary['sockets'] or '-':>7} {summary['clients']:>7} {summary['throughput']:>9.2f} "
+            f"{summary['errors']:>7} {percentiles('hull'):>20} {percentiles('first_layer'):>20} "
+            f"{percentiles('last_layer'):>20} {percentiles('harmonized'):>20}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge des serveurs socket")
+    parser.add_argument('--clients', type=int, nargs='+', default=CLIENTS, help="nombres de clients simultanés")
+    parser.add_argument('--sockets', type=int, nargs='+', default=SOCKET_PROCESSES,
+                        help="nombres de serveurs socket (un lancement de main.py par valeur)")
+    parser.add_argument('--url', help="serveur web déjà lancé (ex: http://127.0.0.1:5000), --sockets est ignoré")
+    parser.add_argument('--port', type=int, default=BASE_PORT, help="port du serveur web lancé par le test")
+    parser.add_argument('--uploads', type=int, default=UPLOADS_PER_CLIENT, help="requêtes par client")
+    parser.add_argument('--synthetic', nargs='*', default=SYNTHETIC_IMAGES, help="images synthétiques envoyées")
+    parser.add_argument('--gallery', type=int, default=0, help="nombre d'images de la galerie (ids.json)")
+    parser.add_argument('--resolutions', type=float, nargs='+', default=RESOLUTIONS, help="résolutions en mégapixels")
+    parser.add_argument('--no-harmonize', action='store_true', help="n'envoie pas de requête d'harmonisation")
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    args = parser.parse_args(argv)
+
+    images = image_mix(args.synthetic, args.gallery, args.resolutions)
+    if not images:
+        parser.error("aucune image à envoyer")
+    print(f"{len(images)} images : {', '.join(name for name, _ in images)}")
+    print(f"{'sockets':>7} {'clients':>7} {'req/s':>9} {'erreurs':>7} "
+          + " ".join(f"{timing + ' p50/90/99':>20}" for timing in TIMINGS))
+
+    summaries = []
+    for sockets in ([None] if args.url else args.sockets):
+        server = None if args.url else start_server(args.port, sockets)
+        base_url = args.url or f"http://127.0.0.1:{args.port}"
+        try:
+            for clients in args.clients:
+                samples, seconds = run_clients(base_url, images, clients, args.uploads, not args.no_harmonize)
+                summary = summarize(samples, seconds, clients, sockets)
+                summaries.append(dict(summary, samples=samples))
+                print(format_summary(summary), flush=True)
+                for message in summary['error_messages']:
+                    print(f"  erreur : {message}")
+        finally:
+            if server is not None:
+                stop_server(server)
+
+    with open(args.output, 'w') as f:
+        json.dump({'images': [name for name, _ in images], 'results': summaries}, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
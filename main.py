@@ -1,37 +1,169 @@
 import json
+import importlib
 import multiprocessing
 import base64
+import os
 import sys
+import threading
 import datetime
+import time
+import urllib.request
 import uuid
 from flask import session
 
-import cv2
 import logging
-import numpy as np
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory
 from flask_socketio import SocketIO, emit
+from werkzeug.utils import secure_filename
 
-from image_decomposition import extract_rgbxy_weights
-from palette_simplification import simplify_convex_palette
-from palette_harmonization import harmonize_palette
+from admission import MAX_RUNNING_JOBS, AdmissionController, AdmissionRefused
+from feedback_store import FeedbackStore, is_valid_duel
+from instrumentation import (BYTES_BUCKETS, current_rss, export_prometheus, merge_prometheus, observe, request_profile,
+                             stage)
+from progress import ProgressSink
+from static_assets import Asset, StaticAssets
 
 REVERSE_PROXY = False
 DEBUG = False
 
+# Nombre maximal de pixels traités par image (None pour conserver la résolution d'origine)
+MAX_WORKING_PIXELS = None
+
+# Décompositions conservées par serveur socket pour changer de palette ou exporter : au-delà,
+# les plus anciennes sont oubliées (leurs clients doivent re-télécharger leur image)
+MAX_RETAINED_DECOMPOSITIONS = 8
+
+# Processus de calcul d'un lot lancé par l'API HTTP : la part des cœurs d'une tâche interactive
+BATCH_PROCESSES = max(1, (os.cpu_count() or 1) // MAX_RUNNING_JOBS)
+
+# Modules de calcul (NumPy, SciPy, OpenCV, cvxopt...) : seuls les serveurs socket les chargent,
+# et ils sont préchargés une seule fois dans le fork server dont les serveurs socket sont issus.
+WORKER_MODULES = ['numpy', 'scipy.spatial', 'scipy.sparse', 'cv2', 'cvxopt.solvers', 'geometry_kernels',
+                  'image_preprocessing', 'image_decomposition', 'image_recoloring', 'palette_simplification',
+                  'palette_harmonization', 'sequence_decomposition', 'batch_processing']
+
+
+def load_worker_modules():
+    # On importe les modules de calcul (instantané s'ils ont été préchargés par le fork server)
+    for module in WORKER_MODULES:
+        importlib.import_module(module)
+    # Les noyaux numba sont compilés (ou chargés du cache disque) avant la première requête
+    importlib.import_module('geometry_kernels').warm_up()
+
+
+def report_startup(process_type, label):
+    # On mesure le démarrage à froid d'un processus : temps CPU consommé depuis sa création
+    # (imports compris) jusqu'au lancement du serveur, et RSS à ce moment
+    seconds = time.process_time()
+    observe('startup_cpu_seconds', (('process', process_type),), seconds)
+    print(f"[{label}] Démarrage en {seconds:.2f} s CPU, RSS {current_rss() / 1e6:.0f} Mo")
+
+
+class SocketSink(ProgressSink):
+    """
+    Relaie les messages de progression des algorithmes au client Socket.IO de la requête en cours.
+    """
+
+    def convex_hull(self, hull_type, vertices, faces):
+        with stage('serialization'):
+            payload = hull_mesh_payload(vertices, faces)
+            emit('convex_hull', dict(payload, type=hull_type))
+        observe('hull_payload_bytes', (('type', hull_type),), len(payload['positions']) + len(payload['edges']),
+                BYTES_BUCKETS)
+
+    def log(self, message):
+        emit('server_log', {'data': message})
+
+    def error(self, message):
+        emit('server_response', {'error': message, 'reset': True})
+
+    def intermediate_image(self, image_data, image_type):
+        emit('intermediate_image', {'image_data': image_data, 'type': image_type})
+
+    def layer_preview(self, preview_weights, height, width):
+        # Aperçu basse résolution de toutes les couches, affiché en attendant les poids définitifs
+        with stage('serialization', preview_weights=preview_weights):
+            emit('layer_preview', dict(layers_payload(preview_weights), **{
+                'width': width,
+                'height': height,
+                'preview_width': preview_weights.shape[1],
+                'preview_height': preview_weights.shape[0]
+            }))
+
+    def layer_tile(self, row, tile_weights, height):
+        # Envoi des poids définitifs d'une bande de lignes, pour toutes les couches
+        with stage('serialization', tile_weights=tile_weights):
+            emit('layer_tile', dict(layers_payload(tile_weights), **{
+                'row': row,
+                'rows': tile_weights.shape[0],
+                'width': tile_weights.shape[1],
+                'height': height
+            }))
+
+
+def layers_payload(weights):
+    # Couches envoyées en binaire au lieu de N listes de flottants, au format de
+    # image_recoloring.compact_weights : poids uint8 denses (N octets par pixel, sans perte de couches)
+    # jusqu'à 2k couches, format creux au-delà (pour chaque pixel, k paires (indice de couche, poids uint8))
+    from image_recoloring import TOPK_LAYERS, quantize_weights, topk_weights
+
+    if weights.shape[-1] <= 2 * TOPK_LAYERS:
+        return {'n_layers': weights.shape[-1], 'weights': quantize_weights(weights).tobytes()}
+    indices, values = topk_weights(weights)
+    return {'n_layers': weights.shape[-1], 'k': indices.shape[-1], 'indices': indices.tobytes(),
+            'values': values.tobytes()}
+
+
+def hull_mesh_payload(vertices, faces):
+    # Enveloppe au format binaire (voir palette_simplification.hull_display_mesh) : positions float32
+    # et indices des arêtes, chargés tels quels dans une géométrie three.js, au lieu de listes JSON
+    from palette_simplification import hull_display_mesh
+
+    positions, edges = hull_display_mesh(vertices, faces)
+    return {'positions': positions.tobytes(), 'edges': edges.tobytes(), 'index_bytes': edges.itemsize,
+            'source_vertices': len(vertices), 'source_faces': len(faces)}
+
+
 # --- Serveur Socket (autant de serveurs que de ports) ---
-def run_socket_server(socket_port, socket_id):
+def run_socket_server(socket_port, socket_id, debug=False, reverse_proxy=False):
+    # Avec le fork server, les valeurs de DEBUG et REVERSE_PROXY fixées dans __main__
+    # ne sont pas héritées : elles sont passées en paramètres.
+    load_worker_modules()
+    from collections import OrderedDict
+
+    import numpy as np
+
+    from image_decomposition import build_rgbxy_geometry, extract_rgbxy_weights
+    from image_preprocessing import decode_image, normalize_input_image
+    from image_recoloring import compact_weights, encode_png_stream, recolor_stream
+    from palette_simplification import simplify_convex_palette
+    from palette_harmonization import harmonize_palette, harmonize_palettes
+    from sequence_decomposition import normalize_sequence, read_video_frames, recolor_sequence, shared_palette
+    from batch_processing import BatchJob, batch_options
+
+    # Décompositions conservées par client (identifiant de session Socket.IO), de la moins récemment utilisée
+    # à la plus récente
+    decompositions = OrderedDict()
+    # Lots lancés par l'API HTTP (identifiant → batch_processing.BatchJob)
+    batch_jobs = {}
+    # File bornée des tâches de calcul de ce serveur (voir admission.AdmissionController)
+    admission = AdmissionController()
+    # Préfixe des routes HTTP, identique à celui du chemin Socket.IO derrière le reverse proxy
+    route_prefix = f"/{socket_id}" if reverse_proxy else ""
+
     app = Flask(__name__)
 
     # On désactive les logs de werkzeug si on n'est pas en mode debug
-    if not DEBUG:
+    if not debug:
         log = logging.getLogger('werkzeug')
         log.setLevel(logging.ERROR)
+    else:
+        logging.basicConfig(level=logging.INFO)
 
     app.config['SECRET_KEY'] = 'WaL&vOxn#JDK0lJTi6n1FGRDdEEpu^fFQfCDMnRd@SB'
 
     # On ouvre le serveur avec un buffer de 10Mo pour éviter les erreurs de dépassement de mémoire
-    if REVERSE_PROXY:
+    if reverse_proxy:
         socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading", path=str(socket_id) + "/socket.io", max_http_buffer_size=1024 * 1024 * 6)
     else:
         socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading", max_http_buffer_size=1024 * 1024 * 6)
@@ -45,13 +177,23 @@ def run_socket_server(socket_port, socket_id):
     @socketio.on('disconnect')
     def handle_disconnect():
         print(f"[Socket {socket_port}] Client déconnecté")
+        decompositions.pop(request.sid, None)
 
 
     @socketio.on('upload_image')
     def handle_upload_image(data):
         """
         Attendu : data contient une clé "image_data" qui correspond à l'image encodée en base64.
+        Optionnel : "seed_palette", palette (array de RGB) d'une image proche dont la simplification repart.
         """
+        with request_profile('upload_image'):
+            try:
+                with admission.job(request.sid, 'upload_image') as quality:
+                    process_upload_image(data, quality)
+            except AdmissionRefused as e:
+                emit('server_response', {'error': str(e), 'reset': True})
+
+    def process_upload_image(data, quality):
         emit('thinking', {'thinking': True})
         img_data = data.get('image_data')
         if not img_data:
@@ -71,44 +213,206 @@ def run_socket_server(socket_port, socket_id):
             emit('error', {'message': "Erreur de décodage Base64"})
             return
 
-        # Conversion en tableau numpy puis décodage avec OpenCV
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if img is None:
-            emit('server_response', {'error': "Données image invalides", 'reset': True})
-            return
-
-        # On vérifie que l'image n'est pas en noir et blanc
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        gray_3ch = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
-        if np.array_equal(img, gray_3ch):
-            emit('server_response', {'error': "L'image doit être en couleur", 'reset': True})
+        # Décodage, vérification des couleurs et conversion en RGB normalisé
+        pixels, error = normalize_input_image(img_bytes, max_pixels=quality.limit_pixels(MAX_WORKING_PIXELS))
+        if pixels is None:
+            emit('server_response', {'error': error, 'reset': True})
             return
-
-        # Traitement : conversion en RGB et extraction des pixels normalisés
-        pixels = cv2.cvtColor(img, cv2.COLOR_BGR2RGB) / 255.0
+        if quality.reason:
+            emit('server_response', {'warning': quality.reason})
 
         if '/' not in socketio.server.manager.rooms or request.sid not in socketio.server.manager.rooms['/']:
             print(f"[Socket {socket_port}] Client déconnecté avant le traitement")
             return
 
         # Calcul de la palette simplifiée
-        palette = simplify_convex_palette(pixels, 6)
+        sink = SocketSink()
+        seed_palette = parse_seed_palette(sink, data.get('seed_palette'))
+        palette = simplify_convex_palette(pixels, 6, max_iterations=quality.max_iterations, sink=sink,
+                                          seed_palette=seed_palette)
         if palette is None:
             return
 
         vertices = palette['vertices']
-        faces = palette['faces']
-        emit('convex_hull', {'type': 'simplified', 'vertices': vertices.tolist(), 'faces': faces.tolist()})
+        sink.convex_hull('simplified', vertices, palette['faces'])
+        hierarchy = palette['hierarchy']
+        emit('palette_sizes', {'sizes': sorted(hierarchy), 'selected': len(vertices)})
 
         # On vérifie si le client est toujours connecté pour éviter de calculer dans le vide
         if '/' not in socketio.server.manager.rooms or request.sid not in socketio.server.manager.rooms['/']:
             print(f"[Socket {socket_port}] Client déconnecté avant le traitement")
             return
 
-        # On décompose l'image en couches pondérées selon la palette de couleurs
-        extract_rgbxy_weights(vertices, pixels)
+        # La géométrie RGBXY ne dépend pas de la palette : elle est conservée pour les changements de taille
+        geometry = build_rgbxy_geometry(pixels)
+        decompose(sink, vertices, geometry, hierarchy)
+
+    def parse_seed_palette(sink, seed_palette):
+        # Palette de départ envoyée par le client (couleurs (K, 3) dans [0, 255]) : si elle est invalide,
+        # on l'ignore et la simplification part de l'enveloppe de tous les pixels
+        if not seed_palette:
+            return None
+        try:
+            seed_palette = np.asarray(seed_palette, dtype=float)
+        except (TypeError, ValueError):
+            seed_palette = None
+        if (seed_palette is None or seed_palette.ndim != 2 or seed_palette.shape[1] != 3
+                or not np.isfinite(seed_palette).all()):
+            sink.log("Palette de départ invalide, simplification complète")
+            return None
+        return seed_palette / 255
+
+    def decompose(sink, vertices, geometry, hierarchy):
+        # On décompose l'image en couches pondérées selon la palette de couleurs (envoyées au fil du calcul) ;
+        # la géométrie suffit, l'image elle-même n'est pas conservée
+        mix_weights = extract_rgbxy_weights(vertices, None, sink=sink, geometry=geometry)
+        if mix_weights is None:
+            return
+
+        # On conserve la décomposition (poids uint8, creux si la palette est grande) pour l'export en pleine
+        # résolution, ainsi que la géométrie de l'image (réduite à la matrice barycentrique des pixels si elle
+        # a pu être gardée) et la hiérarchie de palettes pour changer de taille de palette
+        decomposition_id = str(uuid.uuid4())
+        decompositions[request.sid] = {
+            'id': decomposition_id,
+            'weights': compact_weights(mix_weights),
+            'palette': np.rint(vertices * 255).astype(int).tolist(),
+            'geometry': geometry,
+            'hierarchy': hierarchy
+        }
+        decompositions.move_to_end(request.sid)
+        while len(decompositions) > MAX_RETAINED_DECOMPOSITIONS:
+            decompositions.popitem(last=False)
+        emit('decomposition', {'id': decomposition_id, 'url': f"{route_prefix}/decompositions/{decomposition_id}/recolor"})
+        emit('thinking', {'thinking': False})
+
+    @socketio.on('set_palette_size')
+    def handle_set_palette_size(data):
+        """
+        Attendu : data contient une clé "size", nombre de couleurs de la palette parmi ceux annoncés
+        par l'événement "palette_sizes". Seuls les poids ASAP et le mélange des couches sont recalculés.
+        """
+        with request_profile('set_palette_size'):
+            try:
+                with admission.job(request.sid, 'set_palette_size'):
+                    process_set_palette_size(data)
+            except AdmissionRefused as e:
+                emit('server_response', {'error': str(e)})
+
+    def process_set_palette_size(data):
+        decomposition = decompositions.get(request.sid)
+        if decomposition is None:
+            emit('server_response', {'error': "Aucune image décomposée, veuillez re-télécharger une image.", 'reset': True})
+            return
+        try:
+            palette = decomposition['hierarchy'].get(int(data.get('size')))
+        except (TypeError, ValueError):
+            palette = None
+        if palette is None:
+            emit('error', {'message': 'Taille de palette indisponible'})
+            return
+
+        emit('thinking', {'thinking': True})
+        sink = SocketSink()
+        sink.convex_hull('simplified', palette['vertices'], palette['faces'])
+        decompose(sink, palette['vertices'], decomposition['geometry'], decomposition['hierarchy'])
+
+    @socketio.on('edit_palette')
+    def handle_edit_palette(data):
+        """
+        Attendu : data contient une clé "palette", nouvelle palette de décomposition (array de RGB dans [0, 1],
+        une couleur par couche, dans l'ordre des couches). La géométrie RGBXY de l'image est réutilisée : seuls
+        les poids ASAP des sommets de son enveloppe sont recalculés, suivis d'un produit de matrice creuse.
+        """
+        with request_profile('edit_palette'):
+            try:
+                with admission.job(request.sid, 'edit_palette'):
+                    process_edit_palette(data)
+            except AdmissionRefused as e:
+                emit('server_response', {'error': str(e)})
+
+    def process_edit_palette(data):
+        decomposition = decompositions.get(request.sid)
+        if decomposition is None:
+            emit('server_response', {'error': "Aucune image décomposée, veuillez re-télécharger une image.", 'reset': True})
+            return
+        try:
+            vertices = np.clip(np.asarray(data.get('palette'), dtype=float).reshape(-1, 3), 0, 1)
+        except (TypeError, ValueError):
+            emit('error', {'message': 'Palette invalide'})
+            return
+        if len(vertices) != decomposition['weights'].shape[-1]:
+            emit('error', {'message': 'La palette doit contenir une couleur par couche'})
+            return
+
+        emit('thinking', {'thinking': True})
+        decompose(SocketSink(), vertices, decomposition['geometry'], decomposition['hierarchy'])
+
+    @socketio.on('upload_sequence')
+    def handle_upload_sequence(data):
+        """
+        Attendu : data contient soit une clé "video_data" (vidéo encodée en base64), soit une clé "images"
+        (liste d'images encodées en base64) formant une séquence.
+        Optionnel : "palette", nouvelles couleurs (array de RGB) appliquées à toutes les images, dans l'ordre
+        de la palette commune ; "seed_palette", palette de départ de la simplification.
+        """
+        with request_profile('upload_sequence'):
+            try:
+                with admission.job(request.sid, 'upload_sequence') as quality:
+                    process_upload_sequence(data, quality)
+            except AdmissionRefused as e:
+                emit('server_response', {'error': str(e), 'reset': True})
+
+    def process_upload_sequence(data, quality):
+        emit('thinking', {'thinking': True})
+        try:
+            if data.get('video_data'):
+                frames = read_video_frames(base64.b64decode(data['video_data'].split(',', 1)[-1]))
+            else:
+                frames = [decode_image(base64.b64decode(image.split(',', 1)[-1])) for image in data.get('images') or []]
+        except Exception:
+            emit('error', {'message': "Données de séquence invalides"})
+            return
+        if any(frame is None for frame in frames):
+            emit('error', {'message': "Données image invalides"})
+            return
+
+        frames, error = normalize_sequence(frames, max_pixels=quality.limit_pixels(MAX_WORKING_PIXELS))
+        if frames is None:
+            emit('server_response', {'error': error, 'reset': True})
+            return
+        if quality.reason:
+            emit('server_response', {'warning': quality.reason})
+
+        # Une seule palette pour toute la séquence
+        sink = SocketSink()
+        seed_palette = parse_seed_palette(sink, data.get('seed_palette'))
+        palette = shared_palette(frames, 6, max_iterations=quality.max_iterations, sink=sink,
+                                 seed_palette=seed_palette)
+        if palette is None:
+            return
+        vertices = palette['vertices']
+        sink.convex_hull('simplified', vertices, palette['faces'])
+
+        target_palette = data.get('palette')
+        if target_palette is not None and len(target_palette) != len(vertices):
+            emit('error', {'message': 'La palette doit contenir une couleur par couche'})
+            return
+
+        # Les images sont décomposées en parallèle et envoyées dans l'ordre, dès qu'elles sont prêtes
+        for index, image, decomposed in recolor_sequence(frames, vertices, target_palette, sink=sink):
+            if '/' not in socketio.server.manager.rooms or request.sid not in socketio.server.manager.rooms['/']:
+                print(f"[Socket {socket_port}] Client déconnecté pendant le traitement de la séquence")
+                return
+            if not decomposed:
+                sink.log(f"La décomposition de l'image {index} a échoué, elle est renvoyée inchangée")
+            with stage('serialization', image=image):
+                png = b''.join(encode_png_stream([image], image.shape[1], image.shape[0]))
+                emit('sequence_frame', {
+                    'index': index,
+                    'count': len(frames),
+                    'image_data': 'data:image/png;base64,' + base64.b64encode(png).decode('ascii')
+                })
         emit('thinking', {'thinking': False})
 
     @socketio.on("harmonize")
@@ -123,11 +427,130 @@ def run_socket_server(socket_port, socket_id):
             return
 
         # On harmonise la palette
-        harmonized = harmonize_palette(palette)
-        emit('harmonized', harmonized)
+        with request_profile('harmonize'):
+            with stage('harmonization'):
+                harmonized = harmonize_palette(palette)
+            with stage('serialization'):
+                emit('harmonized', harmonized)
         emit('thinking', {'thinking': False})
 
+    @socketio.on("harmonize_batch")
+    def handle_harmonize_batch(data):
+        """
+        Attendu : data contient une clé "palettes" qui correspond à une liste de palettes à harmoniser (arrays de RGB).
+        Les résultats sont renvoyés dans le même ordre que les palettes.
+        """
+        palettes = data.get('palettes')
+        if not palettes:
+            emit('error', {'message': 'Aucune palette fournie'})
+            return
+
+        with request_profile('harmonize_batch'):
+            with stage('harmonization'):
+                harmonized = harmonize_palettes(palettes)
+            with stage('serialization'):
+                emit('harmonized_batch', {'results': harmonized})
+
+    @app.route(f'{route_prefix}/decompositions/<decomposition_id>/recolor.<image_format>')
+    def recolor(decomposition_id, image_format):
+        """
+        Renvoie l'image recolorée en pleine résolution, encodée au fil de l'eau.
+        Paramètre optionnel : palette (JSON, liste de couleurs RGB dans [0, 255] dans l'ordre des couches).
+        """
+        decomposition = next((d for d in list(decompositions.values()) if d['id'] == decomposition_id), None)
+        if decomposition is None:
+            return jsonify({'success': False, 'message': 'Décomposition introuvable'}), 404
+
+        try:
+            palette = json.loads(request.args['palette']) if 'palette' in request.args else decomposition['palette']
+            palette = np.asarray(palette, dtype=float).reshape(-1, 3)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Palette invalide'}), 400
+        if len(palette) != decomposition['weights'].shape[-1]:
+            return jsonify({'success': False, 'message': 'La palette doit contenir une couleur par couche'}), 400
+
+        try:
+            mimetype, stream = recolor_stream(decomposition['weights'], palette, image_format)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        headers = {'Content-Disposition': f'attachment; filename=harmonized.{image_format}'}
+        return Response(stream, mimetype=mimetype, headers=headers)
+
+    @app.route(f'{route_prefix}/batch', methods=['POST'])
+    def create_batch():
+        """
+        Lance la décomposition d'un lot d'images envoyées en multipart (champ "images", un fichier par image).
+        Options (champs du formulaire, voir batch_processing.batch_options) : palette_size, harmonies (noms séparés
+        par des virgules), layers (0 ou 1), format ('png' ou 'webp').
+        Le lot est calculé en arrière-plan (202) ; avec ?wait=1, la réponse n'est envoyée qu'une fois le lot terminé.
+        """
+        images = [image for image in request.files.getlist('images') if image.filename]
+        if not images:
+            return jsonify({'success': False, 'message': 'Aucune image fournie'}), 400
+        try:
+            options = batch_options(request.form)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        job = BatchJob(str(uuid.uuid4()), dict(options, processes=BATCH_PROCESSES))
+        for index, image in enumerate(images):
+            job.add_image(secure_filename(image.filename) or f"image_{index}", image)
+        batch_jobs[job.id] = job
+
+        def run_job():
+            # Le lot passe par le contrôle d'admission comme une tâche interactive, et sa qualité dépend de la charge
+            try:
+                with admission.job(job.id, 'batch') as quality:
+                    job.options.update(max_pixels=quality.limit_pixels(MAX_WORKING_PIXELS),
+                                       max_iterations=quality.max_iterations)
+                    job.run()
+            except AdmissionRefused as e:
+                job.fail(str(e))
+
+        threading.Thread(target=run_job, daemon=True).start()
+        if request.args.get('wait') == '1':
+            job.finished.wait()
+            return jsonify(batch_status(job))
+        return jsonify(batch_status(job)), 202
+
+    def batch_status(job):
+        status = job.status()
+        for result in status['results']:
+            result['urls'] = [f"{route_prefix}/batch/{job.id}/files/{result['name']}/{path}"
+                              for path in result.get('files', [])]
+        return status
+
+    @app.route(f'{route_prefix}/batch/<job_id>', methods=['GET', 'DELETE'])
+    def batch(job_id):
+        """
+        GET : état et avancement du lot, palette et URL des fichiers de chaque image traitée.
+        DELETE : supprime le lot et ses fichiers (une fois terminé).
+        """
+        job = batch_jobs.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Lot introuvable'}), 404
+        if request.method == 'GET':
+            return jsonify(batch_status(job))
+        if not job.finished.is_set():
+            return jsonify({'success': False, 'message': 'Lot en cours de calcul'}), 409
+        batch_jobs.pop(job_id, None)
+        job.delete()
+        return jsonify({'success': True})
+
+    @app.route(f'{route_prefix}/batch/<job_id>/files/<path:filename>')
+    def batch_file(job_id, filename):
+        job = batch_jobs.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Lot introuvable'}), 404
+        return send_from_directory(os.path.abspath(job.outputs), filename)
+
+    @app.route('/metrics')
+    def metrics():
+        # Histogrammes de ce processus, agrégés par le serveur web sur son propre /metrics
+        return Response(export_prometheus(extra_labels=(('socket', socket_port),)), mimetype='text/plain')
+
     print(f"Démarrage du serveur socket sur le port {socket_port}")
+    report_startup('socket', f"Socket {socket_port}")
     socketio.run(app, port=socket_port, debug=False, allow_unsafe_werkzeug=True)
 
 
@@ -149,29 +572,44 @@ def get_next_socket_id():
 
 
 def run_web_server():
-    app = Flask(__name__)
+    # Les fichiers statiques sont servis par StaticAssets (compression, ETag, cache) et non par Flask
+    app = Flask(__name__, static_folder=None)
     app.config['SECRET_KEY'] = 'secret!'
-    img_ids = json.load(open('./ids.json'))
+    feedback_store = FeedbackStore()
 
     if not DEBUG:
         log = logging.getLogger('werkzeug')
         log.setLevel(logging.ERROR)
 
+    # Les pages et la liste des images ne changent pas pendant la vie du serveur : elles sont
+    # rendues et compressées une seule fois, au démarrage
+    assets = StaticAssets()
+    app.jinja_env.globals['asset_url'] = assets.url
+    with app.app_context():
+        pages = {name: Asset(render_template(name).encode('utf-8'), 'text/html')
+                 for name in ('index.html', 'app.html', 'feedback.html')}
+    with open('./ids.json', 'rb') as f:
+        img_ids = Asset(json.dumps(json.load(f), separators=(',', ':')).encode('utf-8'), 'application/json')
+
+    @app.route('/static/<path:filename>')
+    def static_file(filename):
+        return assets.serve(filename)
+
     @app.route('/')
     def index():
-        return render_template('index.html')
+        return pages['index.html'].response()
 
     @app.route('/app')
     def harmonize():
-        return render_template('app.html')
+        return pages['app.html'].response()
 
     @app.route('/feedback')
     def form():
-        return render_template('feedback.html')
+        return pages['feedback.html'].response()
 
     @app.route('/img_ids')
     def get_img_ids():
-        return jsonify(img_ids)
+        return img_ids.response()
 
     @app.route('/form/feedback', methods=['POST'])
     def form_feedback():
@@ -186,6 +624,9 @@ def run_web_server():
         # On vérifie que toutes les données sont présentes
         if not img_id or not harmony1 or not harmony2 or not choice:
             return jsonify({'success': False, 'message': 'Données manquantes'}), 400
+        # L'harmonie choisie doit être l'une des deux harmonies (différentes) présentées
+        if not is_valid_duel(harmony1, harmony2, choice):
+            return jsonify({'success': False, 'message': 'Choix incohérent'}), 400
 
         # On attribue un ID utilisateur unique si ce n'est pas déjà fait
         if 'user_id' not in session:
@@ -194,15 +635,31 @@ def run_web_server():
         user_id = session['user_id']
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        # On enregistre dans le fichier CSV avec l'ID utilisateur
-        with open('feedback.csv', 'a') as f:
-            f.write(f"{timestamp},{user_id},{img_id},{harmony1},{harmony2},{choice}\n")
+        # On dépose le feedback dans la file d'écriture (écrit par lots par un thread dédié)
+        feedback_store.submit(timestamp, user_id, img_id, harmony1, harmony2, choice)
 
         return jsonify({'success': True}), 200
 
+    @app.route('/form/feedback/stats')
+    def feedback_stats():
+        # Taux de victoire par harmonie et par duel, tenus à jour à chaque écriture
+        return jsonify(feedback_store.stats())
+
+    @app.route('/metrics')
+    def metrics():
+        # On agrège les histogrammes de chaque serveur socket (chaque processus a les siens)
+        texts = []
+        for socket_port in socket_ports:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{socket_port}/metrics", timeout=2) as response:
+                    texts.append(response.read().decode('utf-8'))
+            except OSError:
+                print(f"[Web] Métriques indisponibles pour le serveur socket {socket_port}")
+        return Response(merge_prometheus(texts), mimetype='text/plain')
+
     @app.errorhandler(404)
     def page_not_found(e):
-        return render_template('index.html'), 404
+        return pages['index.html'].response(conditional=False), 404
 
     @app.route('/get_socket_id')
     def get_socket_id():
@@ -215,6 +672,7 @@ def run_web_server():
 
 
     print("Démarrage du serveur Web sur le port", load_balancer_port)
+    report_startup('web', "Web")
     app.run(port=load_balancer_port, debug=False)
 
 
@@ -223,11 +681,18 @@ if __name__ == '__main__':
     DEBUG = True
     REVERSE_PROXY = False
 
-    # On démarre les serveurs socket dans des processus séparés
+    # On démarre les serveurs socket dans des processus séparés, issus d'un fork server
+    # qui a déjà importé les modules de calcul (spawn si le fork server n'est pas disponible)
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['__main__'] + WORKER_MODULES)
+    else:
+        context = multiprocessing.get_context('spawn')
+
     processes = []
     print(socket_ports)
     for (i, port) in enumerate(socket_ports):
-        p = multiprocessing.Process(target=run_socket_server, args=(port, i + 1,))
+        p = context.Process(target=run_socket_server, args=(port, i + 1, DEBUG, REVERSE_PROXY))
         p.start()
         processes.append(p)
 
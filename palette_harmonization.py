@@ -1,7 +1,8 @@
 import math
+import threading
+from collections import OrderedDict
 
 import numpy as np
-from matplotlib import pyplot as plt
 
 
 # -------------------------------
@@ -149,6 +150,9 @@ def plot_palette_on_circle(palette, title="Palette harmonisée"):
     On convertit chaque couleur en LCh pour extraire la teinte (hue)
     et on trace un point sur un cercle à l'angle correspondant.
     """
+    # matplotlib n'est utile qu'au débogage : on ne le charge qu'ici
+    from matplotlib import pyplot as plt
+
     # Création d'une figure avec un axe polaire
     fig, ax = plt.subplots(subplot_kw={'projection': 'polar'}, figsize=(6, 6))
     ax.set_ylim(0, 1.5)
@@ -200,44 +204,127 @@ def template_double_split(alpha1, alpha2):
 # -------------------------------
 # FONCTIONS DE RECHERCHE DE PARAMÈTRES OPTIMAUX
 # -------------------------------
+# Domaine du second paramètre (α₂) des templates à 2 degrés de liberté
+ALPHA2_RANGE = (-30, 30)
+
+
+def template_structure(template_func, is2d):
+    """
+    Décompose un template en axes de la forme α₁ + décalage + pente·α₂.
+
+    Retourne:
+      - offsets: np.array (K,) des décalages des axes
+      - slopes: np.array (K,) des pentes des axes par rapport à α₂ (nulles en 1D)
+    """
+    if is2d:
+        offsets = np.array(template_func(0, 0), dtype=float)
+        slopes = (np.array(template_func(0, 1), dtype=float) - offsets + 180) % 360 - 180
+    else:
+        offsets = np.array(template_func(0), dtype=float)
+        slopes = np.zeros_like(offsets)
+    return offsets, slopes
+
+
+def template_distances(hues, weights, counts, axes):
+    """
+    Calcule la distance moyenne D = Σ L·C·d / n de palettes à des jeux d'axes.
+
+    Paramètres:
+      - hues: np.array (B, N) des teintes (palettes complétées par des zéros)
+      - weights: np.array (B, N) des poids L·C (nuls pour les couleurs de complétion)
+      - counts: np.array (B,) du nombre réel de couleurs de chaque palette
+      - axes: np.array (B, G, K) des teintes des axes de G jeux de paramètres par palette
+
+    Retourne:
+      - np.array (B, G) des distances
+    """
+    diff = np.abs(hues[:, None, :, None] - axes[:, :, None, :]) % 360
+    diff = np.minimum(diff, 360 - diff).min(axis=-1)
+    return (diff * weights[:, None, :]).sum(axis=-1) / counts[:, None]
+
+
+def candidate_params(hues, offsets, slopes, is2d):
+    """
+    Énumère les paramètres candidats à l'optimum d'un template.
+
+    Le coût Σ L·C·d est linéaire par morceaux en (α₁, α₂) : entre deux lignes où
+    une teinte tombe exactement sur un axe (α₁ + décalage + pente·α₂ = h), il est
+    concave, son minimum est donc atteint en un sommet de ces lignes. En 1D, ce
+    sont les angles h - décalage ; en 2D, les intersections de deux telles lignes
+    de pentes différentes et leurs intersections avec les bornes de α₂.
+
+    Paramètres:
+      - hues: np.array (B, N) des teintes
+      - offsets, slopes: structure du template (voir template_structure)
+      - is2d: True pour un template à 2 degrés de liberté
+
+    Retourne:
+      - np.array (B, M, 2) des candidats (α₁, α₂)
+    """
+    n_palettes = hues.shape[0]
+    # Ligne (couleur i, axe k) : α₁ = c - pente·α₂, avec c = h_i - décalage_k
+    c = (hues[:, :, None] - offsets[None, None, :]).reshape(n_palettes, -1)
+    line_slopes = np.tile(slopes, hues.shape[1])
+    if not is2d:
+        return np.stack((c, np.zeros_like(c)), axis=-1)
+
+    candidates = []
+    # Intersections avec les bornes de α₂
+    for alpha2 in ALPHA2_RANGE:
+        candidates.append(np.stack((c - line_slopes * alpha2, np.full_like(c, alpha2)), axis=-1))
+
+    # Intersections de deux lignes de pentes différentes : (s_p - s_q)·α₂ ≡ c_p - c_q (mod 360)
+    p, q = np.nonzero(np.triu(line_slopes[:, None] != line_slopes[None, :]))
+    dc = (c[:, p] - c[:, q] + 180) % 360 - 180
+    ds = line_slopes[p] - line_slopes[q]
+    for turns in (-1, 0, 1):
+        # Les solutions hors du domaine sont ramenées sur ses bornes (candidats valides, quoique inutiles)
+        alpha2 = np.clip((dc + 360 * turns) / ds, *ALPHA2_RANGE)
+        candidates.append(np.stack((c[:, p] - line_slopes[p] * alpha2, alpha2), axis=-1))
+    return np.concatenate(candidates, axis=1)
+
+
+def fit_template(hues, weights, counts, template_func, is2d):
+    """
+    Trouve les paramètres continus optimaux d'un template pour un lot de palettes.
+
+    Retourne:
+      - params: np.array (B, 2) des (α₁, α₂) optimaux (α₂ = 0 en 1D)
+      - D: np.array (B,) des distances moyennes correspondantes
+    """
+    offsets, slopes = template_structure(template_func, is2d)
+    candidates = candidate_params(hues, offsets, slopes, is2d)
+    axes = candidates[..., :1] + offsets + slopes * candidates[..., 1:]
+    D = template_distances(hues, weights, counts, axes)
+    best = np.argmin(D, axis=1)
+    params = candidates[np.arange(len(best)), best]
+    params[:, 0] %= 360
+    return params, D[np.arange(len(best)), best]
+
+
+def palette_arrays(lch_palettes):
+    # On met un lot de palettes LCh sous forme de tableaux (teintes, poids L·C, nombre de couleurs).
+    n_max = max(len(palette) for palette in lch_palettes)
+    hues = np.zeros((len(lch_palettes), n_max))
+    weights = np.zeros((len(lch_palettes), n_max))
+    counts = np.array([len(palette) for palette in lch_palettes], dtype=float)
+    for b, palette in enumerate(lch_palettes):
+        for n, (L, C, h) in enumerate(palette):
+            hues[b, n] = h
+            weights[b, n] = L * C
+    return hues, weights, counts
+
+
 def best_fit_template_1d(lch_palette, template_func):
     # On recherche l'angle optimal (α) pour un template à 1 degré de liberté.
-    best_alpha = 0
-    best_D = float('inf')
-    n = len(lch_palette)
-    for alpha in range(360):
-        axes = template_func(alpha)
-        total = 0.0
-        for (L, C, h) in lch_palette:
-            # On trouve l'écart minimal entre la teinte h et l'un des axes
-            d = min(angle_diff(h, ax) for ax in axes)
-            total += L * C * d
-        D = total / n
-        if D < best_D:
-            best_D = D
-            best_alpha = alpha
-    return (best_alpha, best_D)
+    params, D = fit_template(*palette_arrays([lch_palette]), template_func, False)
+    return (float(params[0, 0]), float(D[0]))
 
 
 def best_fit_template_2d(lch_palette, template_func):
     # On recherche les angles optimaux (α₁ et α₂) pour un template à 2 degrés de liberté.
-    best_alpha1 = 0
-    best_alpha2 = 0
-    best_D = float('inf')
-    n = len(lch_palette)
-    for alpha1 in range(360):
-        for alpha2 in range(-30, 30):  # α₂ de -15 à 15 degrés
-            axes = template_func(alpha1, alpha2)
-            total = 0.0
-            for (L, C, h) in lch_palette:
-                d = min(angle_diff(h, ax) for ax in axes)
-                total += L * C * d
-            D = total / n
-            if D < best_D:
-                best_D = D
-                best_alpha1 = alpha1
-                best_alpha2 = alpha2
-    return (best_alpha1, best_alpha2, best_D)
+    params, D = fit_template(*palette_arrays([lch_palette]), template_func, True)
+    return (float(params[0, 0]), float(params[0, 1]), float(D[0]))
 
 
 def harmonize_lch_palette(lch_palette, template_func, params):
@@ -257,75 +344,177 @@ def harmonize_lch_palette(lch_palette, template_func, params):
     return new_palette
 
 
+# -------------------------------
+# RECHERCHE VECTORISÉE ET MÉMOÏSATION DES AJUSTEMENTS
+# -------------------------------
+# Templates disponibles et indicateur de second degré de liberté (α₂).
+TEMPLATES = {
+    "monochromatic-harmony": (template_monochrome, False),
+    "complementary-harmony": (template_complementary, False),
+    "triadic-harmony": (template_triad, False),
+    "square-harmony": (template_square, False),
+    "analogous-harmony": (template_analogous, False),
+    "split-harmony": (template_single_split, True),
+    "double-split-harmony": (template_double_split, True)
+}
+
+# Pas de quantification (L, C, h) des palettes LCh utilisées comme clés du cache
+FIT_CACHE_QUANTIZATION = (0.5, 0.5, 0.5)
+# Nombre de palettes dont les ajustements sont conservés
+FIT_CACHE_SIZE = 1024
+# Nombre maximal d'éléments des tableaux intermédiaires lors d'une évaluation vectorisée
+MAX_BATCH_ELEMENTS = 2 ** 22
+
+_fit_cache = OrderedDict()
+_fit_cache_lock = threading.Lock()
+
+
+def fit_templates_batch(lch_palettes):
+    """
+    Recherche les paramètres optimaux de chaque template pour plusieurs palettes,
+    en évaluant tous les candidats de toutes les palettes en une passe vectorisée.
+
+    Paramètres:
+      - lch_palettes: liste de palettes LCh (listes de (L, C, h))
+
+    Retourne:
+      - Une liste (une entrée par palette) de dictionnaires {template: paramètres},
+        les paramètres étant α ou (α₁, α₂)
+    """
+    hues, weights, counts = palette_arrays(lch_palettes)
+    n_max = hues.shape[1]
+
+    fits = [{} for _ in lch_palettes]
+    for template_name, (template_func, is2d) in TEMPLATES.items():
+        # On découpe le lot pour borner la taille des tableaux intermédiaires (candidats × couleurs × axes)
+        n_axes = len(template_structure(template_func, is2d)[0])
+        n_candidates = 5 * (n_max * n_axes) ** 2 if is2d else n_max * n_axes
+        chunk = max(1, MAX_BATCH_ELEMENTS // (n_candidates * n_max * n_axes))
+        for start in range(0, len(lch_palettes), chunk):
+            params, _ = fit_template(hues[start:start + chunk], weights[start:start + chunk],
+                                     counts[start:start + chunk], template_func, is2d)
+            for b, best in enumerate(params, start=start):
+                fits[b][template_name] = (float(best[0]), float(best[1])) if is2d else float(best[0])
+    return fits
+
+
+def palette_cache_key(lch_palette):
+    # On quantifie la palette LCh : des palettes quasi identiques partagent la même clé.
+    qL, qC, qh = FIT_CACHE_QUANTIZATION
+    return tuple((round(L / qL), round(C / qC), round(h / qh) % round(360 / qh)) for (L, C, h) in lch_palette)
+
+
+def cached_template_fits(lch_palettes):
+    """
+    Retourne les ajustements de templates de chaque palette, en ne calculant
+    (en un seul lot) que ceux des palettes absentes du cache LRU.
+
+    Les ajustements sont calculés sur la palette quantifiée correspondant à la
+    clé, ce qui rend le contenu du cache indépendant de la palette qui l'a rempli.
+    """
+    keys = [palette_cache_key(palette) for palette in lch_palettes]
+    # Les ajustements trouvés sont copiés dès la recherche : un autre thread peut évincer
+    # leur clé du cache avant la fin de ce lot
+    found = {}
+    with _fit_cache_lock:
+        for key in dict.fromkeys(keys):
+            if key in _fit_cache:
+                _fit_cache.move_to_end(key)
+                found[key] = _fit_cache[key]
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+
+    if missing:
+        qL, qC, qh = FIT_CACHE_QUANTIZATION
+        quantized = [[(L * qL, C * qC, h * qh) for (L, C, h) in key] for key in missing]
+        found.update(zip(missing, fit_templates_batch(quantized)))
+        with _fit_cache_lock:
+            for key in missing:
+                _fit_cache[key] = found[key]
+                _fit_cache.move_to_end(key)
+            while len(_fit_cache) > FIT_CACHE_SIZE:
+                _fit_cache.popitem(last=False)
+    return [found[key] for key in keys]
+
+
+def template_distance(lch_palette, template_func, params):
+    # Distance moyenne D d'une palette à un template pour des paramètres donnés.
+    axes = template_func(*params) if isinstance(params, tuple) else template_func(params)
+    total = 0.0
+    for (L, C, h) in lch_palette:
+        total += L * C * min(angle_diff(h, ax) for ax in axes)
+    return total / len(lch_palette)
+
+
 # -------------------------------
 # FONCTION PRINCIPALE D'HARMONISATION
 # -------------------------------
+def harmonize_palettes(palettes, plot=False):
+    """
+    Harmonise plusieurs palettes en un seul lot (voir harmonize_palette).
+
+    Les ajustements de templates sont mémoïsés dans un cache LRU indexé par la
+    palette LCh quantifiée : une palette déjà vue (ou presque identique) ne
+    déclenche aucune recherche, et les palettes inconnues du lot sont ajustées
+    ensemble en une passe vectorisée.
+
+    Paramètres:
+      - palettes: liste de palettes (tableaux de couleurs RGB dans [0, 255])
+
+    Retourne:
+      - Une liste de résultats, un par palette, au format de harmonize_palette
+    """
+    # On normalise les palettes [255,255,255] → [1,1,1] puis on les convertit de RGB vers LCh.
+    lch_palettes = [[rgb_to_lch([r / 255, g / 255, b / 255]) for r, g, b in palette] for palette in palettes]
+
+    results = []
+    for lch_palette, fits in zip(lch_palettes, cached_template_fits(lch_palettes)):
+        # On plot la palette d'entrée
+        if plot:
+            plot_palette_on_circle(lch_palette)
+
+        result = {}
+        for template_name, (template_func, is2d) in TEMPLATES.items():
+            params = fits[template_name]
+            best_D = template_distance(lch_palette, template_func, params)
+
+            # On harmonise la palette en LCh.
+            harmonized_lch = harmonize_lch_palette(lch_palette, template_func, params)
+
+            # On plot la palette harmonisée
+            if plot:
+                plot_palette_on_circle(harmonized_lch, title=template_name)
+
+            # On reconvertit la palette harmonisée en RGB, puis on multiplie par 255 pour obtenir des valeurs [0,255]
+            new_palette = [lch_to_rgb(col) for col in harmonized_lch]
+            new_palette = [[round(r * 255), round(g * 255), round(b * 255)] for r, g, b in new_palette]
+
+            # Le taux d'optimalité est défini comme 1/(1 + distance moyenne).
+            rate = 1 / (1 + best_D)
+            result[template_name] = {"palette": new_palette, "rate": rate}
+        results.append(result)
+    return results
+
+
 def harmonize_palette(palette, plot=False):
     """
     Implémente la partie harmonisation 4.
 
     Paramètres:
-      - palette: tableau de tableaux de 3 floats (RGB dans [0,1])
+      - palette: tableau de tableaux de 3 floats (RGB dans [0, 255])
         représentant les couleurs d'une palette.
 
     Retourne:
       - Un dictionnaire où chaque clé est le type d'harmonisation (parmi
         "monochrome", "complementary", "triad", "square", "analogous",
         "single split" et "double split") et chaque valeur est un dictionnaire contenant :
-          - "palette" : la nouvelle palette harmonisée (en RGB dans [0,1])
+          - "palette" : la nouvelle palette harmonisée (en RGB dans [0, 255])
           - "rate"   : le taux d'optimalité, défini ici comme 1/(1 + distance moyenne)
 
     On convertit d'abord la palette de RGB vers LCh.
-    Pour les templates à 1 degré de liberté, on effectue une recherche brute
-    sur α ∈ [0, 360). Pour "single split" et "double split", on recherche sur
-    (α₁, α₂) avec α₁ ∈ [0,360) et α₂ ∈ [–15,15].
+    Pour les templates à 1 degré de liberté, on recherche l'optimum exact de
+    α ∈ [0, 360). Pour "single split" et "double split", on recherche sur
+    (α₁, α₂) avec α₁ ∈ [0,360) et α₂ ∈ [–30,30] (voir candidate_params).
     On harmonise ensuite la palette en forçant chaque couleur à adopter la teinte
     de l'axe le plus proche, puis on reconvertit en RGB.
     """
-    # On définit le dictionnaire des templates et un indicateur si le template est à 2D.
-    templates = {
-        "monochromatic-harmony": (template_monochrome, False),
-        "complementary-harmony": (template_complementary, False),
-        "triadic-harmony": (template_triad, False),
-        "square-harmony": (template_square, False),
-        "analogous-harmony": (template_analogous, False),
-        "split-harmony": (template_single_split, True),
-        "double-split-harmony": (template_double_split, True)
-    }
-
-    # On normalise la palette [255,255,255] → [1,1,1]
-    palette_float = [[r / 255, g / 255, b / 255] for r, g, b in palette]
-
-    # On convertit la palette d'entrée de RGB vers LCh.
-    lch_palette = [rgb_to_lch(col) for col in palette_float]
-
-    # On plot la palette d'entrée
-    if plot:
-        plot_palette_on_circle(lch_palette)
-
-    result = {}
-    # Pour chaque type d'harmonisation, on recherche les paramètres optimaux.
-    for template_name, (template_func, is2d) in templates.items():
-        if is2d:
-            best_alpha1, best_alpha2, best_D = best_fit_template_2d(lch_palette, template_func)
-            params = (best_alpha1, best_alpha2)
-        else:
-            best_alpha, best_D = best_fit_template_1d(lch_palette, template_func)
-            params = best_alpha
-        # On harmonise la palette en LCh.
-        harmonized_lch = harmonize_lch_palette(lch_palette, template_func, params)
-
-        # On plot la palette harmonisée
-        if plot:
-            plot_palette_on_circle(harmonized_lch, title=template_name)
-
-        # On reconvertit la palette harmonisée en RGB.
-        new_palette = [lch_to_rgb(col) for col in harmonized_lch]
-
-        # On multiplie par 255 pour obtenir des valeurs [0,255]
-        new_palette = [[round(r * 255), round(g * 255), round(b * 255)] for r, g, b in new_palette]
-
-        # Le taux d'optimalité est défini comme 1/(1 + distance moyenne).
-        rate = 1 / (1 + best_D)
-        result[template_name] = {"palette": new_palette, "rate": rate}
-    return result
+    return harmonize_palettes([palette], plot=plot)[0]
@@ -1,14 +1,114 @@
-import time
-import cvxopt
-import cvxopt.solvers
 import numpy as np
-from flask_socketio import emit
-from scipy.spatial import ConvexHull, Delaunay, cKDTree
+from scipy.spatial import ConvexHull, Delaunay, QhullError
+
+from geometry_kernels import face_planes, orient_faces, tetrahedron_volume_sum
+from image_decomposition import project_to_hull
+from instrumentation import stage
+from progress import NULL_SINK
+
+# RMSE maximale (pixels dans [0, 1]) entre les pixels et l'enveloppe simplifiée
+COVERAGE_TOLERANCE = 4 / 255
+
+# Nombre maximal de couleurs distinctes utilisées pour vérifier la couverture pendant la simplification
+COVERAGE_SAMPLE = 50000
+
+# RMSE maximale pour réutiliser telle quelle une palette de départ : la simplification s'arrête à la
+# première fusion qui dépasse COVERAGE_TOLERANCE, ses palettes sont donc en général un peu au-delà
+SEED_TOLERANCE = 2 * COVERAGE_TOLERANCE
+
+# Tailles de palette conservées dans la hiérarchie (voir simplify_convex_palette)
+HIERARCHY_MIN_VERTICES = 4
+HIERARCHY_MAX_VERTICES = 12
+
+# Nombre maximal de sommets des enveloppes envoyées au client pour l'affichage (voir hull_display_mesh)
+HULL_DISPLAY_MAX_VERTICES = 256
+
+
+class CoverageChecker:
+    """
+    Mesure la couverture d'un nuage de points par des enveloppes convexes successives :
+    RMSE de la distance des points à l'enveloppe (nulle à l'intérieur).
+
+    Les points sont dédupliqués (chaque couleur est pondérée par son nombre de
+    pixels) puis, au-delà de sample_size couleurs, échantillonnés. Sans
+    échantillonnage (sample_size=None), la mesure est exacte. En mode
+    incrémental, on retient pour chaque couleur couverte les sommets du simplexe
+    qui la contient : tant que ces sommets font partie de l'enveloppe suivante,
+    la couleur reste couverte. Après une fusion d'arête, seules les couleurs non
+    couvertes et celles des simplexes touchant un sommet supprimé sont donc
+    testées à nouveau.
+    """
+
+    def __init__(self, points, sample_size=COVERAGE_SAMPLE, incremental=True, seed=0):
+        points = points.reshape(-1, 3)
+        if sample_size is None:
+            colors, counts = np.unique(points, axis=0, return_counts=True)
+        else:
+            # Couleurs regroupées par valeur 8 bits (clé entière, bien plus rapide que np.unique sur des lignes)
+            levels = np.rint(np.clip(points, 0, 1) * 255).astype(np.int64)
+            keys = (levels[:, 0] << 16) | (levels[:, 1] << 8) | levels[:, 2]
+            _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+            colors = points[first]
+        if sample_size is not None and len(colors) > sample_size:
+            chosen = np.random.default_rng(seed).choice(len(colors), sample_size, replace=False)
+            colors, counts = colors[chosen], counts[chosen]
+        self.colors = colors
+        self.weights = counts.astype(float)
+        self.incremental = incremental
+
+        # Identifiants des sommets rencontrés (coordonnées -> indice) et, pour chaque couleur,
+        # sommets du simplexe qui la contient (-1 si la couleur n'est pas couverte)
+        self._vertex_ids = {}
+        self._simplex_vertices = np.full((len(colors), 4), -1)
+        self._sqr_distances = np.zeros(len(colors))
+        self._checked = False
+
+    def _ids(self, vertices):
+        return np.array([self._vertex_ids.setdefault(tuple(vertex), len(self._vertex_ids)) for vertex in vertices])
+
+    def rmse(self, hull_points):
+        """
+        RMSE de la distance des points à l'enveloppe convexe de hull_points.
+        """
+        hull_points = np.asarray(hull_points, dtype=float)
+        vertex_ids = self._ids(hull_points)
+
+        if self.incremental and self._checked:
+            alive = np.zeros(len(self._vertex_ids), dtype=bool)
+            alive[vertex_ids] = True
+            covered = (self._simplex_vertices >= 0).all(axis=1)
+            retest = ~covered | ~alive[self._simplex_vertices].all(axis=1)
+        else:
+            retest = np.ones(len(self.colors), dtype=bool)
+
+        colors = self.colors[retest]
+        # On construit une triangulation de Delaunay à partir des sommets de l'enveloppe
+        # pour déterminer quels points se trouvent à l'intérieur de celle-ci.
+        delaunay = Delaunay(hull_points)
+        simplices = delaunay.find_simplex(colors)
+        inside = simplices >= 0
+
+        simplex_vertices = np.full((len(colors), 4), -1)
+        simplex_vertices[inside] = vertex_ids[delaunay.simplices[simplices[inside]]]
+        sqr_distances = np.zeros(len(colors))
+        if not inside.all():
+            # Distance exacte à la surface de l'enveloppe (et non au sommet le plus proche)
+            _, sqr_distances[~inside] = project_to_hull(colors[~inside], ConvexHull(hull_points),
+                                                        return_distances=True)
+
+        self._simplex_vertices[retest] = simplex_vertices
+        self._sqr_distances[retest] = sqr_distances
+        self._checked = True
+
+        # On retourne la racine carrée de la moyenne (pondérée) des carrés des distances.
+        return np.sqrt(np.average(self._sqr_distances, weights=self.weights))
+
 
 def compute_rmse(points, hull_points):
     """
     Calcule l'erreur quadratique moyenne (RMSE) entre un nuage de points
-    et une enveloppe convexe donnée.
+    et une enveloppe convexe donnée, sur tous les points (mode exact, sans
+    échantillonnage, utile pour valider CoverageChecker).
 
     Paramètres:
       - points: np.array de forme (N, 3) (par exemple, des couleurs ou positions)
@@ -17,16 +117,7 @@ def compute_rmse(points, hull_points):
     Retourne:
       - La RMSE (float)
     """
-    # On construit une triangulation de Delaunay à partir des sommets de l'enveloppe
-    # pour déterminer quels points se trouvent à l'intérieur de celle-ci.
-    delaunay = Delaunay(hull_points)
-    inside = delaunay.find_simplex(points) >= 0
-    tree = cKDTree(hull_points)
-    min_distances, _ = tree.query(points)
-    min_distances[inside] = 0
-
-    # On retourne la racine carrée de la moyenne des carrés des distances minimales.
-    return np.sqrt(np.mean(min_distances ** 2))
+    return CoverageChecker(points, sample_size=None, incremental=False).rmse(hull_points)
 
 
 def convert_convex_hull_faces(hull):
@@ -46,18 +137,10 @@ def convert_convex_hull_faces(hull):
     # On ré-indexe les faces générées par ConvexHull.
     new_indices = -1 * np.ones(hull.points.shape[0], dtype=np.int32)
     new_indices[hull.vertices] = np.arange(len(hull.vertices))
-    faces = np.asarray([new_indices[face] for face in hull.simplices])
-
-    # On parcourt chaque face pour vérifier et ajuster son orientation.
-    for i in range(len(faces)):
-        face_coords = hull_vertices_coords[faces[i]]
-        expected_normal = hull.equations[i, :3]
-        # On calcule la normale à partir des trois premiers points de la face.
-        p0, p1, p2 = face_coords[0], face_coords[1], face_coords[2]
-        computed_normal = np.cross(p1 - p0, p2 - p0)
-        if np.dot(expected_normal, computed_normal) < 0:
-            # On inverse l'ordre de deux sommets pour corriger l'orientation.
-            faces[i][[0, 1]] = faces[i][[1, 0]]
+    faces = new_indices[hull.simplices]
+
+    # On inverse deux sommets des faces dont la normale est opposée à celle calculée par Qhull.
+    faces = orient_faces(hull_vertices_coords, faces, hull.equations[:, :3])
     return faces.tolist()
 
 
@@ -166,16 +249,12 @@ def compute_edge_collapse_candidate(edge, vertices, faces, vertex_face_dict, fac
     faces_v2 = vertex_face_dict[v2]
     combined_face_indices = list(set(faces_v1) | set(faces_v2))
 
-    related_triangles = []
     A_list = []
     b_list = []
     cost_vector = np.zeros(3)
 
     # On construit le problème linéaire à partir des faces adjacentes.
     for face_idx in combined_face_indices:
-        face_indices = faces[face_idx]
-        triangle = vertices[face_indices]
-        related_triangles.append(triangle)
         normal = face_normals[face_idx]
         if np.linalg.norm(normal) == 0:
             continue
@@ -193,19 +272,22 @@ def compute_edge_collapse_candidate(edge, vertices, faces, vertex_face_dict, fac
     b_vector = -np.array(b_list)
     c_vector = cost_vector
 
+    # cvxopt n'est chargé qu'à la première résolution de LP
+    import cvxopt.solvers
+
     cvxopt.solvers.options['show_progress'] = False
     cvxopt.solvers.options['glpk'] = dict(msg_lev='GLP_MSG_OFF')
-    res = cvxopt.solvers.lp(cvxopt.matrix(c_vector),
-                            cvxopt.matrix(A_matrix),
-                            cvxopt.matrix(b_vector),
-                            solver='glpk')
+    with stage('lp_solve'):
+        res = cvxopt.solvers.lp(cvxopt.matrix(c_vector),
+                                cvxopt.matrix(A_matrix),
+                                cvxopt.matrix(b_vector),
+                                solver='glpk')
 
     if res['status'] == 'optimal':
         new_vertex = np.array(res['x']).squeeze()
         # On calcule le volume ajouté en sommant les volumes des tétraèdres
         # formés par chacune des faces adjacentes et le nouveau sommet.
-        added_volume = sum(compute_tetrahedron_volume(triangle, new_vertex)
-                           for triangle in related_triangles)
+        added_volume = tetrahedron_volume_sum(vertices, faces[combined_face_indices], new_vertex)
         return new_vertex, added_volume
     else:
         # En cas d'échec du LP, on teste la compatibilité des normales.
@@ -214,88 +296,286 @@ def compute_edge_collapse_candidate(edge, vertices, faces, vertex_face_dict, fac
     return None
 
 
-def simplify_convex_palette(points, target_vertices=10, max_iterations=500):
+def collapse_best_edge(current_vertices, current_faces):
     """
-    Simplifie l'enveloppe convexe issue d'un nuage de points en fusionnant itérativement des arêtes
-    dont la fusion (via un LP) ajoute le moins de volume.
+    Effectue une itération de simplification : évalue la fusion de chaque arête
+    et applique celle qui ajoute le moins de volume.
+
+    Paramètres:
+      - current_vertices: np.array des sommets courants (N, 3)
+      - current_faces: np.array des faces courantes (M, 3)
+
+    Retourne:
+      - (sommets, faces) de la nouvelle enveloppe, ou None si aucune fusion n'est possible
     """
-    points = points.reshape(-1, 3)
-    initial_hull = ConvexHull(points)
-    current_vertices = points[initial_hull.vertices]
-    current_faces = np.array(convert_convex_hull_faces(initial_hull))
+    # Pré-calcul des voisins de faces pour chaque sommet
+    vertex_face_dict = {i: [] for i in range(len(current_vertices))}
+    for i, face in enumerate(current_faces):
+        for v in face:
+            vertex_face_dict[v].append(i)
+
+    # Pré-calcul des normales et offsets pour chaque face
+    face_normals, face_offsets = face_planes(current_vertices, current_faces)
+
+    edges = get_edges_from_faces(current_faces)
+    candidate_collapses = []
+
+    # On évalue chaque arête candidate pour une fusion.
+    for edge in edges:
+        candidate = compute_edge_collapse_candidate(edge, current_vertices, current_faces,
+                                                    vertex_face_dict, face_normals, face_offsets)
+        if candidate is not None:
+            new_vertex, added_volume = candidate
+            candidate_collapses.append((added_volume, edge, new_vertex))
+
+    if not candidate_collapses:
+        return None
+
+    # On sélectionne la fusion qui minimise le volume ajouté.
+    best_candidate = min(candidate_collapses, key=lambda x: x[0])
+    best_new_vertex = best_candidate[2]
+
+    # On ajoute le nouveau sommet et on recalcule l'enveloppe convexe.
+    updated_vertices = np.vstack((current_vertices, best_new_vertex.reshape(1, 3)))
+    new_hull = ConvexHull(updated_vertices)
+    return updated_vertices[new_hull.vertices], np.array(convert_convex_hull_faces(new_hull))
 
-    # On émet l'enveloppe convexe initiale via SocketIO pour visualisation.
-    emit('convex_hull', {'type': 'initial', 'vertices': current_vertices.tolist(), 'faces': current_faces.tolist()})
 
+def simplify_hull(points, current_vertices, current_faces, target_vertices, max_iterations, sink=NULL_SINK,
+                  exact_coverage=False, snapshots=None, check_coverage=True):
+    """
+    Simplifie une enveloppe convexe en fusionnant itérativement l'arête qui ajoute le moins de volume,
+    jusqu'au nombre de sommets visé ou jusqu'à ce que l'enveloppe ne couvre plus assez bien les points.
+
+    Paramètres:
+      - points: pixels (N, 3) dans [0, 1], utilisés pour vérifier la couverture
+      - current_vertices, current_faces: enveloppe de départ
+      - target_vertices: nombre de sommets visé
+      - max_iterations: nombre maximal de fusions
+      - sink: destination des messages de progression
+      - exact_coverage: vérifie la couverture sur tous les points, sans échantillonnage ni
+        mise à jour incrémentale (validation)
+      - snapshots: dictionnaire {nombre de sommets: {'vertices', 'faces'}} complété à chaque
+        taille atteinte (au plus HIERARCHY_MAX_VERTICES sommets), optionnel
+      - check_coverage: arrête la simplification quand l'enveloppe ne couvre plus les points
+
+    Retourne:
+      - (sommets, faces) de l'enveloppe simplifiée, ou None si une fusion échoue
+    """
+    record_snapshot(snapshots, current_vertices, current_faces)
+    # Construit à la première vérification de couverture, puis mis à jour à chaque fusion
+    coverage = None
     iteration = 0
-    t0 = time.time()
     while iteration < max_iterations and len(current_vertices) > target_vertices:
         previous_vertex_count = len(current_vertices)
 
-        # Pré-calcul des voisins de faces pour chaque sommet
-        vertex_face_dict = {i: [] for i in range(len(current_vertices))}
-        for i, face in enumerate(current_faces):
-            for v in face:
-                vertex_face_dict[v].append(i)
-
-        # Pré-calcul des normales et offsets pour chaque face
-        face_normals = []
-        face_offsets = []
-        for face in current_faces:
-            p0 = current_vertices[face[0]]
-            p1 = current_vertices[face[1]]
-            p2 = current_vertices[face[2]]
-            normal = np.cross(p1 - p0, p2 - p0)
-            norm_val = np.linalg.norm(normal)
-            if norm_val != 0:
-                normal = normal / norm_val
-            else:
-                normal = np.zeros(3)
-            face_normals.append(normal)
-            face_offsets.append(np.dot(normal, p0))
-        face_normals = np.array(face_normals)
-        face_offsets = np.array(face_offsets)
-
-        edges = get_edges_from_faces(current_faces)
-        candidate_collapses = []
-
-        # On évalue chaque arête candidate pour une fusion.
-        for edge in edges:
-            candidate = compute_edge_collapse_candidate(edge, current_vertices, current_faces,
-                                                        vertex_face_dict, face_normals, face_offsets)
-            if candidate is not None:
-                new_vertex, added_volume = candidate
-                candidate_collapses.append((added_volume, edge, new_vertex))
-
-        if not candidate_collapses:
-            emit('server_response', {'error': f"Aucune fusion possible à l'itération {iteration}", 'reset': True})
-            return None
-
-        # On sélectionne la fusion qui minimise le volume ajouté.
-        best_candidate = min(candidate_collapses, key=lambda x: x[0])
-        best_new_vertex = best_candidate[2]
+        with stage('simplify_iteration', vertices=current_vertices, faces=current_faces):
+            collapsed = collapse_best_edge(current_vertices, current_faces)
 
-        # On ajoute le nouveau sommet et on recalcule l'enveloppe convexe.
-        updated_vertices = np.vstack((current_vertices, best_new_vertex.reshape(1, 3)))
-        new_hull = ConvexHull(updated_vertices)
-        current_vertices = updated_vertices[new_hull.vertices]
-        current_faces = np.array(convert_convex_hull_faces(new_hull))
+        if collapsed is None:
+            sink.error(f"Aucune fusion possible à l'itération {iteration}")
+            return None
+        current_vertices, current_faces = collapsed
+        record_snapshot(snapshots, current_vertices, current_faces)
 
         iteration += 1
         if iteration % 10 == 0:
-            emit('server_log', {'data': f"Iteration {iteration}: {len(current_vertices)} sommets"})
+            sink.log(f"Iteration {iteration}: {len(current_vertices)} sommets")
 
         # On vérifie si le nombre de sommets n'évolue plus ou atteint un minimum (ex. 4 sommets).
         if len(current_vertices) == previous_vertex_count or len(current_vertices) == 4:
             break
 
         # Si le nombre de sommets est faible, on vérifie la qualité de la simplification via RMSE.
-        if len(current_vertices) <= 20:
+        if check_coverage and len(current_vertices) <= 20:
             test_vertices = np.clip(current_vertices, 0, 1)
-            rmse = compute_rmse(points, test_vertices)
-            if rmse > 4 / 255:
+            with stage('coverage_check', points=points):
+                if coverage is None:
+                    coverage = (CoverageChecker(points, sample_size=None, incremental=False) if exact_coverage
+                                else CoverageChecker(points))
+                rmse = coverage.rmse(test_vertices)
+            if rmse > COVERAGE_TOLERANCE:
                 break
 
+    return current_vertices, current_faces
+
+
+def record_snapshot(snapshots, vertices, faces):
+    # Palette d'une taille donnée : la première atteinte est gardée, c'est la plus proche de l'image
+    if snapshots is not None and len(vertices) <= HIERARCHY_MAX_VERTICES and len(vertices) not in snapshots:
+        snapshots[len(vertices)] = {'vertices': np.clip(vertices, 0, 1), 'faces': np.asarray(faces)}
+
+
+def seed_hull(points, seed_palette):
+    """
+    Construit l'enveloppe de départ d'une simplification à partir d'une palette existante
+    (résultat en cache, image précédente d'une séquence...).
+
+    Si la palette couvre déjà les points (RMSE inférieure à SEED_TOLERANCE), on la garde telle
+    quelle. Sinon, on l'étend aux seuls points qui en sortent : l'enveloppe obtenue ne contient que
+    les sommets de la palette et les extrémités des points non couverts, bien moins de sommets que
+    l'enveloppe de l'image entière.
+
+    Paramètres:
+      - points: pixels (N, 3) dans [0, 1]
+      - seed_palette: couleurs (K, 3) dans [0, 1]
+
+    Retourne:
+      - (sommets, faces, couverte), ou None si la palette est dégénérée (moins de 4 couleurs, couleurs coplanaires...)
+    """
+    seed_palette = np.clip(np.asarray(seed_palette, dtype=float).reshape(-1, 3), 0, 1)
+    try:
+        hull = ConvexHull(seed_palette)
+        delaunay = Delaunay(seed_palette[hull.vertices])
+    except (QhullError, ValueError):
+        return None
+    seed_vertices = seed_palette[hull.vertices]
+
+    with stage('seed_check', points=points):
+        outside = points[delaunay.find_simplex(points) < 0]
+        covered = compute_rmse(points, seed_vertices) <= SEED_TOLERANCE
+    if covered:
+        return seed_vertices, np.array(convert_convex_hull_faces(hull)), True
+
+    with stage('seed_expansion', points=outside) as record:
+        expanded_points = np.vstack((seed_vertices, outside))
+        hull = ConvexHull(expanded_points)
+        record.add_counts(vertices=len(hull.vertices))
+    return expanded_points[hull.vertices], np.array(convert_convex_hull_faces(hull)), False
+
+
+def simplify_convex_palette(points, target_vertices=10, max_iterations=500, sink=NULL_SINK, seed_palette=None,
+                            exact_coverage=False):
+    """
+    Simplifie l'enveloppe convexe issue d'un nuage de points en fusionnant itérativement des arêtes
+    dont la fusion (via un LP) ajoute le moins de volume.
+
+    Toutes les tailles de palette traversées pendant la simplification sont conservées : une fois la
+    palette visée obtenue, on poursuit les fusions (sans vérifier la couverture) jusqu'à
+    HIERARCHY_MIN_VERTICES sommets. Changer de nombre de couleurs ne demande donc pas de nouvelle
+    simplification.
+
+    Paramètres:
+      - points: pixels de l'image (H, W, 3) ou (N, 3) dans [0, 1]
+      - target_vertices: nombre de sommets visé
+      - max_iterations: nombre maximal de fusions
+      - sink: destination des messages de progression (voir progress.ProgressSink)
+      - seed_palette: palette (K, 3) dans [0, 1] d'une image proche, dont on part au lieu de
+        l'enveloppe de tous les pixels (voir seed_hull)
+      - exact_coverage: vérifie la couverture sur tous les pixels à chaque itération (validation)
+
+    Retourne:
+      - Un dictionnaire {'vertices', 'faces', 'hierarchy'} de l'enveloppe simplifiée, où hierarchy
+        associe à chaque nombre de sommets atteint (au plus HIERARCHY_MAX_VERTICES) l'enveloppe
+        {'vertices', 'faces'} correspondante, ou None en cas d'échec
+    """
+    points = points.reshape(-1, 3)
+    seeded = seed_hull(points, seed_palette) if seed_palette is not None else None
+    if seed_palette is not None and seeded is None:
+        sink.log("Palette de départ dégénérée, simplification complète")
+
+    snapshots = {}
+    if seeded is not None:
+        current_vertices, current_faces, covered = seeded
+        if covered:
+            # La palette de départ couvre déjà l'image : aucune simplification nécessaire
+            sink.convex_hull('initial', current_vertices, current_faces)
+            sink.log("La palette de départ couvre l'image, elle est réutilisée.")
+            record_snapshot(snapshots, current_vertices, current_faces)
+            descend_hierarchy(current_vertices, current_faces, snapshots)
+            return {'vertices': current_vertices, 'faces': current_faces, 'hierarchy': snapshots}
+    else:
+        with stage('initial_hull', points=points) as record:
+            initial_hull = ConvexHull(points)
+            current_vertices = points[initial_hull.vertices]
+            current_faces = np.array(convert_convex_hull_faces(initial_hull))
+            record.add_arrays(vertices=current_vertices, faces=current_faces)
+            record.add_counts(vertices=len(current_vertices), faces=len(current_faces))
+
+    # On transmet l'enveloppe convexe initiale pour visualisation.
+    sink.convex_hull('initial', current_vertices, current_faces)
+
+    with stage('simplification') as simplification_record:
+        simplified = simplify_hull(points, current_vertices, current_faces, target_vertices, max_iterations, sink,
+                                   exact_coverage, snapshots)
+    if simplified is None:
+        return None
+    current_vertices, current_faces = simplified
+
     current_vertices = np.clip(current_vertices, 0, 1)
-    emit("server_log", {"data": f"La simplification a pris {time.time() - t0:.2f} secondes."})
-    return {'vertices': current_vertices, 'faces': current_faces}
+    sink.log(f"La simplification a pris {simplification_record.seconds:.2f} secondes.")
+    descend_hierarchy(current_vertices, current_faces, snapshots)
+    return {'vertices': current_vertices, 'faces': current_faces, 'hierarchy': snapshots}
+
+
+def descend_hierarchy(vertices, faces, snapshots, max_iterations=100):
+    """
+    Complète la hiérarchie de palettes avec les tailles inférieures à la palette retenue,
+    en poursuivant les fusions jusqu'à HIERARCHY_MIN_VERTICES sommets.
+
+    Paramètres:
+      - vertices, faces: enveloppe retenue
+      - snapshots: hiérarchie {nombre de sommets: {'vertices', 'faces'}} à compléter
+      - max_iterations: nombre maximal de fusions
+    """
+    if len(vertices) <= HIERARCHY_MIN_VERTICES:
+        return
+    # Une fusion impossible ne fait qu'écourter la hiérarchie : la palette retenue reste valable
+    with stage('hierarchy') as record:
+        simplify_hull(None, vertices, faces, HIERARCHY_MIN_VERTICES, max_iterations, snapshots=snapshots,
+                      check_coverage=False)
+        record.add_counts(palettes=len(snapshots))
+
+
+def farthest_point_sample(points, count):
+    """
+    Choisit count points bien répartis : on part du point le plus éloigné du centre, puis on ajoute
+    à chaque étape le point le plus éloigné de ceux déjà choisis.
+
+    Paramètres:
+      - points: np.array de forme (N, 3)
+      - count: nombre de points à choisir (au plus N)
+
+    Retourne:
+      - Les indices des points choisis (count,)
+    """
+    chosen = np.empty(count, dtype=np.int64)
+    chosen[0] = np.argmax(((points - points.mean(axis=0)) ** 2).sum(-1))
+    sqr_distances = ((points - points[chosen[0]]) ** 2).sum(-1)
+    for i in range(1, count):
+        chosen[i] = np.argmax(sqr_distances)
+        sqr_distances = np.minimum(sqr_distances, ((points - points[chosen[i]]) ** 2).sum(-1))
+    return chosen
+
+
+def hull_display_mesh(vertices, faces, max_vertices=HULL_DISPLAY_MAX_VERTICES):
+    """
+    Prépare une enveloppe convexe pour l'affichage : sommets et arêtes, dans des types compacts.
+
+    Au-delà de max_vertices sommets (enveloppe initiale d'une image bruitée), l'enveloppe affichée
+    est celle d'un sous-ensemble de sommets bien répartis (voir farthest_point_sample) : elle reste
+    convexe et inscrite dans l'enveloppe d'origine. Cette réduction ne sert qu'à l'affichage, le
+    calcul de la palette utilise toujours l'enveloppe complète.
+
+    Paramètres:
+      - vertices: sommets (N, 3) dans [0, 1]
+      - faces: faces (M, 3)
+      - max_vertices: nombre maximal de sommets affichés
+
+    Retourne:
+      - (sommets (V, 3) float32, arêtes uniques (E, 2) uint16 ou uint32 selon V)
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    faces = np.asarray(faces)
+    if len(vertices) > max_vertices:
+        with stage('hull_decimation', vertices=vertices) as record:
+            hull = ConvexHull(vertices[farthest_point_sample(vertices, max_vertices)])
+            vertices = hull.points[hull.vertices]
+            faces = np.array(convert_convex_hull_faces(hull))
+            record.add_counts(vertices=len(vertices))
+
+    # Chaque arête est partagée par deux faces : on ne la garde qu'une fois
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    edges = np.unique(edges, axis=0)
+    index_type = np.uint16 if len(vertices) <= np.iinfo(np.uint16).max else np.uint32
+    return vertices.astype(np.float32), edges.astype(index_type)
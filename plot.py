@@ -1,12 +1,13 @@
 import base64
 import numpy as np
-import cv2
-import matplotlib.pyplot as plt
-from flask_socketio import emit
+
+from progress import NULL_SINK
 
 
 # --- Affichage du Convex Hull en 3D avec les couleurs ---
 def plot_convex_hull_3d(points, hull_points):
+    import matplotlib.pyplot as plt
+
     print("Affichage du Convex Hull en 3D...")
 
     fig = plt.figure(figsize=(12, 10))
@@ -31,6 +32,9 @@ def plot_convex_hull_3d(points, hull_points):
 
 # --- Affichage de la palette de couleurs ---
 def plot_palette(colors, fixed_width=400, fixed_height=80):
+    import cv2
+    import matplotlib.pyplot as plt
+
     print("Affichage de la palette de couleurs...")
 
     # On convertit la liste de couleurs en tableau NumPy
@@ -51,7 +55,9 @@ def plot_palette(colors, fixed_width=400, fixed_height=80):
     plt.show()
 
 
-def send_intermediate_image(image, image_type, fixed_width=None, fixed_height=None):
+def send_intermediate_image(image, image_type, fixed_width=None, fixed_height=None, sink=NULL_SINK):
+    import cv2
+
     # On clamp les valeurs entre 0 et 1
     image = image.astype(np.uint8)
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
@@ -63,4 +69,4 @@ def send_intermediate_image(image, image_type, fixed_width=None, fixed_height=No
     image_data_base64 = base64.b64encode(img_encoded).decode('utf-8')
 
     # On envoie l'image intermédiaire au client
-    emit('intermediate_image', {'image_data': image_data_base64, 'type': image_type})
+    sink.intermediate_image(image_data_base64, image_type)
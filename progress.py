@@ -0,0 +1,58 @@
+class ProgressSink:
+    """
+    Destination des messages de progression émis par les algorithmes
+    (enveloppe convexe intermédiaire, logs, erreurs).
+
+    Les algorithmes ne dépendent que de cette interface : la classe de base
+    ignore tous les messages, ce qui permet de les exécuter hors d'un contexte
+    Socket.IO (benchmarks, traitements par lots, pools de processus). La couche
+    socket fournit une implémentation qui relaie les messages au client.
+    """
+
+    def convex_hull(self, hull_type, vertices, faces):
+        # Enveloppe convexe à afficher ('initial' ou 'simplified')
+        pass
+
+    def log(self, message):
+        # Message d'information destiné à l'utilisateur
+        pass
+
+    def error(self, message):
+        # Erreur bloquante : le traitement en cours est abandonné
+        pass
+
+    def intermediate_image(self, image_data, image_type):
+        # Image intermédiaire encodée en base64 (débogage)
+        pass
+
+    def layer_preview(self, preview_weights, height, width):
+        # Aperçu des poids de mélange (h, w, N) d'une image de taille (height, width)
+        pass
+
+    def layer_tile(self, row, tile_weights, height):
+        # Poids de mélange définitifs (lignes, W, N) à partir de la ligne row, sur height lignes au total
+        pass
+
+
+# Sink par défaut des algorithmes : aucun message n'est transmis
+NULL_SINK = ProgressSink()
+
+
+class CollectingSink(ProgressSink):
+    """
+    Sink qui conserve les messages reçus, pour les traitements par lots.
+    """
+
+    def __init__(self):
+        self.hulls = []
+        self.logs = []
+        self.errors = []
+
+    def convex_hull(self, hull_type, vertices, faces):
+        self.hulls.append((hull_type, vertices, faces))
+
+    def log(self, message):
+        self.logs.append(message)
+
+    def error(self, message):
+        self.errors.append(message)
@@ -0,0 +1,216 @@
+import multiprocessing
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from scipy.spatial import ConvexHull, QhullError
+
+from image_decomposition import build_asap_lut, extract_rgbxy_weights
+from image_preprocessing import is_grayscale, resize_to_working_resolution, to_compute_pixels
+from image_recoloring import compact_weights, recolor_image
+from instrumentation import stage
+from palette_simplification import simplify_convex_palette
+from progress import NULL_SINK
+
+# Nombre maximal d'images lues dans une vidéo
+MAX_SEQUENCE_FRAMES = 120
+
+# Nombre de pixels tirés au hasard dans chaque image pour vérifier la couverture de la palette commune
+SAMPLES_PER_FRAME = 20000
+
+
+def read_video_frames(video_bytes, max_frames=MAX_SEQUENCE_FRAMES):
+    """
+    Décode les images d'une vidéo encodée.
+
+    OpenCV ne lit les vidéos que depuis un fichier : les octets sont écrits dans
+    un fichier temporaire, supprimé après lecture.
+
+    Paramètres:
+      - video_bytes: octets de la vidéo encodée
+      - max_frames: nombre maximal d'images lues
+
+    Retourne:
+      - Une liste d'images (H, W, 3) en BGR uint8 (vide si la vidéo est illisible)
+    """
+    fd, path = tempfile.mkstemp(suffix='.video')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(video_bytes)
+        capture = cv2.VideoCapture(path)
+        frames = []
+        while len(frames) < max_frames:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+        capture.release()
+        return frames
+    finally:
+        os.remove(path)
+
+
+def normalize_sequence(frames, max_pixels=None):
+    """
+    Prépare les images d'une séquence : réduction à la résolution de travail et
+    conversion en RGB normalisé dans [0, 1].
+
+    Paramètres:
+      - frames: liste d'images (H, W, 3) en BGR uint8
+      - max_pixels: nombre maximal de pixels de travail par image (None pour ne pas redimensionner)
+
+    Retourne:
+      - (liste de pixels, None), ou (None, message d'erreur) si la séquence est invalide
+    """
+    if not frames:
+        return None, "Aucune image dans la séquence"
+    if all(is_grayscale(frame) for frame in frames):
+        return None, "La séquence doit être en couleur"
+    with stage('normalization'):
+        return [to_compute_pixels(resize_to_working_resolution(frame, max_pixels)) for frame in frames], None
+
+
+def sequence_points(frames, samples_per_frame=SAMPLES_PER_FRAME, seed=0):
+    """
+    Rassemble les couleurs d'une séquence en un seul nuage de points.
+
+    L'enveloppe convexe de l'union des images est celle de l'union de leurs
+    enveloppes : on garde les sommets de l'enveloppe de chaque image (l'enveloppe
+    initiale est donc exacte) et un échantillon de pixels de chaque image pour
+    vérifier la couverture pendant la simplification. Les images dont les couleurs
+    n'ont pas d'enveloppe en 3D (image unie, fondu au noir, couleurs alignées ou
+    coplanaires) sont écartées de la palette.
+
+    Paramètres:
+      - frames: liste d'images (H, W, 3) en RGB dans [0, 1]
+      - samples_per_frame: nombre de pixels tirés par image
+      - seed: graine du tirage (résultats reproductibles)
+
+    Retourne:
+      - (np.array de forme (N, 3), indices des images écartées) ; le nuage est vide si
+        toutes les images sont écartées
+    """
+    rng = np.random.default_rng(seed)
+    points = []
+    degenerate = []
+    for index, frame in enumerate(frames):
+        pixels = frame.reshape(-1, 3)
+        try:
+            vertices = ConvexHull(pixels).vertices
+        except QhullError:
+            degenerate.append(index)
+            continue
+        points.append(pixels[vertices])
+        if len(pixels) > samples_per_frame:
+            pixels = pixels[rng.choice(len(pixels), samples_per_frame, replace=False)]
+        points.append(pixels)
+    return (np.vstack(points) if points else np.empty((0, 3))), degenerate
+
+
+def shared_palette(frames, target_vertices=6, max_iterations=500, sink=NULL_SINK, seed_palette=None):
+    """
+    Calcule une palette commune à toutes les images d'une séquence.
+
+    Une seule palette garantit des couches cohérentes d'une image à l'autre :
+    recolorer la séquence ne provoque pas de scintillement.
+
+    Paramètres:
+      - frames: liste d'images (H, W, 3) en RGB dans [0, 1]
+      - target_vertices: nombre de sommets visé
+      - max_iterations: nombre maximal de fusions
+      - sink: destination des messages de progression
+      - seed_palette: palette de départ (voir simplify_convex_palette)
+
+    Retourne:
+      - Un dictionnaire {'vertices', 'faces'}, ou None en cas d'échec
+    """
+    with stage('sequence_points') as record:
+        points, degenerate = sequence_points(frames)
+        record.add_arrays(points=points)
+    if len(degenerate) == len(frames):
+        sink.error("Aucune image de la séquence n'a assez de couleurs différentes")
+        return None
+    if degenerate:
+        sink.log(f"{len(degenerate)} image(s) sans assez de couleurs différentes écartée(s) de la palette : "
+                 f"{', '.join(map(str, degenerate))}")
+    return simplify_convex_palette(points, target_vertices, max_iterations, sink=sink, seed_palette=seed_palette)
+
+
+# Table de poids ASAP de la palette commune, transmise une seule fois à chaque processus du pool
+_worker_asap_lut = None
+
+
+def init_frame_worker(asap_lut):
+    global _worker_asap_lut
+    _worker_asap_lut = asap_lut
+
+
+def frame_weights(task):
+    # Tâche exécutée dans un processus du pool : poids d'une image quantifiés en uint8 (au format
+    # creux pour les grandes palettes) pour réduire le volume renvoyé au processus principal. Le pool occupe
+    # déjà tous les cœurs : chaque image est calculée par un seul thread.
+    index, pixels, palette = task
+    try:
+        mix_weights = extract_rgbxy_weights(palette, pixels, asap_lut=_worker_asap_lut, workers=1)
+    except QhullError:
+        # Image dont les pixels RGBXY n'ont pas d'enveloppe en 5D (image unie...) : elle est
+        # signalée comme échouée sans interrompre le reste de la séquence
+        return index, None
+    return index, None if mix_weights is None else compact_weights(mix_weights)
+
+
+def decompose_sequence(frames, palette, processes=None, sink=NULL_SINK):
+    """
+    Calcule les poids de mélange de chaque image d'une séquence, en parallèle,
+    avec une palette commune.
+
+    Les poids ASAP ne dépendant que de la couleur et de la palette, leur table
+    (voir build_asap_lut) est construite une seule fois pour toute la séquence.
+    Les images sont ensuite réparties sur un pool de processus ; les résultats
+    sont rendus dans l'ordre de la séquence, dès qu'ils sont disponibles.
+
+    Paramètres:
+      - frames: liste d'images (H, W, 3) en RGB dans [0, 1]
+      - palette: couleurs (N, 3) dans [0, 1]
+      - processes: nombre de processus (None pour un par cœur)
+      - sink: destination des messages de progression
+
+    Retourne:
+      - Un générateur de (indice, poids (voir compact_weights)), poids None si la décomposition a échoué
+    """
+    # Sans table (échec de construction), chaque image calcule ses poids ASAP directement
+    asap_lut = build_asap_lut(palette, sink=sink)
+
+    # Processus issus du fork server quand il existe : les modules de calcul y sont déjà chargés
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    processes = min(processes or os.cpu_count() or 1, len(frames))
+    with context.Pool(processes, initializer=init_frame_worker, initargs=(asap_lut,)) as pool:
+        tasks = ((index, frame, palette) for index, frame in enumerate(frames))
+        yield from pool.imap(frame_weights, tasks)
+
+
+def recolor_sequence(frames, palette, target_palette=None, processes=None, sink=NULL_SINK):
+    """
+    Décompose une séquence avec une palette commune et recolore chaque image.
+
+    Paramètres:
+      - frames: liste d'images (H, W, 3) en RGB dans [0, 1]
+      - palette: palette commune (N, 3) dans [0, 1]
+      - target_palette: nouvelles couleurs (N, 3) RGB dans [0, 255], dans l'ordre de la palette
+        (None pour reconstruire les images avec la palette commune)
+      - processes: nombre de processus de décomposition
+      - sink: destination des messages de progression
+
+    Retourne:
+      - Un générateur de (indice, image (H, W, 3) RGB uint8, décomposée), l'image étant renvoyée
+        inchangée (décomposée à False) si sa décomposition a échoué
+    """
+    if target_palette is None:
+        target_palette = np.rint(np.asarray(palette) * 255)
+    for index, weights in decompose_sequence(frames, palette, processes, sink):
+        if weights is None:
+            yield index, np.rint(frames[index] * 255).astype(np.uint8), False
+        else:
+            yield index, recolor_image(weights, target_palette), True
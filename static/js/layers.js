@@ -5,6 +5,8 @@ class LayerManager {
         this.width = 0;
         this.height = 0;
         this.layers = [];
+        this.palette = null;
+        this.exportUrl = null;
         this.layersContainer = document.getElementById('layers-container');
         this.downloadButton = document.getElementById('download-layers');
         this.harmonizedImage = document.getElementById('harmonized-image');
@@ -15,7 +17,12 @@ class LayerManager {
 
         this.harmonizedImage.addEventListener('click', () => {
             const a = document.createElement('a');
-            a.href = this.harmonizedImage.toDataURL('image/png');
+            // Si le serveur conserve la décomposition, il génère lui-même l'image en pleine résolution
+            if (this.exportUrl && this.palette) {
+                a.href = `${this.exportUrl}.png?palette=${encodeURIComponent(JSON.stringify(this.palette))}`;
+            } else {
+                a.href = this.harmonizedImage.toDataURL('image/png');
+            }
             a.download = 'harmonized.png';
             a.click();
             a.remove();
@@ -29,6 +36,27 @@ class LayerManager {
         this.width = 0;
         this.height = 0;
         this.layers = [];
+        this.palette = null;
+        this.exportUrl = null;
+    }
+
+    /**
+     * Supprime les couches affichées, avant leur recalcul avec une autre palette
+     */
+    clearLayers() {
+        this.layersContainer.querySelectorAll('canvas[id^="layer-"]').forEach(canvas => canvas.remove());
+        this.layers = [];
+        this.palette = null;
+        this.exportUrl = null;
+        this.downloadButton.classList.add('hidden');
+    }
+
+    /**
+     * Définit l'adresse d'export de l'image harmonisée générée par le serveur
+     * @param {string} url - L'adresse de recoloration de la décomposition (sans extension)
+     */
+    setExportUrl(url) {
+        this.exportUrl = url;
     }
 
     /**
@@ -110,10 +138,111 @@ class LayerManager {
         this.layers[data.id] = data.weights;
     }
 
+    /**
+     * Décode des couches reçues en binaire : poids uint8 denses (data.weights, N octets par pixel) pour les
+     * petites palettes, ou format creux (data.indices et data.values, k paires (indice de couche, poids uint8)
+     * par pixel) pour les grandes
+     * @param {Object} data - Les données reçues
+     * @param {number} data.n_layers - Le nombre de couches
+     * @param {ArrayBuffer} [data.weights] - Les poids denses (n_layers octets par pixel)
+     * @param {number} [data.k] - Le nombre de paires par pixel (format creux)
+     * @param {ArrayBuffer} [data.indices] - Les indices de couche (k octets par pixel)
+     * @param {ArrayBuffer} [data.values] - Les poids (k octets par pixel, somme de 255 par pixel)
+     * @param {number} pixelCount - Le nombre de pixels
+     * @returns {Float32Array[]} - Les poids de chaque couche, dans [0, 1]
+     */
+    decodeLayers(data, pixelCount) {
+        const layers = Array.from({length: data.n_layers}, () => new Float32Array(pixelCount));
+        if (data.weights) {
+            const weights = new Uint8Array(data.weights);
+            for (let pixel = 0, i = 0; pixel < pixelCount; pixel++) {
+                for (let layer = 0; layer < data.n_layers; layer++, i++) {
+                    layers[layer][pixel] = weights[i] / 255;
+                }
+            }
+            return layers;
+        }
+        const indices = new Uint8Array(data.indices);
+        const values = new Uint8Array(data.values);
+        for (let pixel = 0, i = 0; pixel < pixelCount; pixel++) {
+            for (let j = 0; j < data.k; j++, i++) {
+                layers[indices[i]][pixel] = values[i] / 255;
+            }
+        }
+        return layers;
+    }
+
+    /**
+     * Affiche un aperçu basse résolution des couches, étiré à la taille de l'image
+     * @param {Object} data - Les données de l'aperçu
+     * @param {number} data.width - La largeur de l'image
+     * @param {number} data.height - La hauteur de l'image
+     * @param {number} data.preview_width - La largeur de l'aperçu
+     * @param {number} data.preview_height - La hauteur de l'aperçu
+     * @param {ArrayBuffer} data.weights ou data.indices, data.values - Les poids de l'aperçu (voir decodeLayers)
+     * @param palette - La palette (tableau de couleurs)
+     */
+    showPreview(data, palette) {
+        if (document.getElementById('layers-title').classList.contains('hidden')) {
+            document.getElementById('layers-title').classList.remove('hidden');
+            this.layersContainer.classList.remove('hidden');
+        }
+
+        this.width = data.width;
+        this.height = data.height;
+        const preview = document.createElement('canvas');
+        preview.width = data.preview_width;
+        preview.height = data.preview_height;
+        const previewCtx = preview.getContext('2d');
+
+        const layers = this.decodeLayers(data, data.preview_width * data.preview_height);
+        layers.forEach((weights, id) => {
+            const canvas = this.createCanvasForLayer({id: id, width: data.width, height: data.height});
+            const ctx = canvas.getContext('2d');
+            previewCtx.putImageData(this.generateRGBAImageData(weights, data.preview_width, data.preview_height, palette[id]), 0, 0);
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
+            ctx.drawImage(preview, 0, 0, canvas.width, canvas.height);
+            this.layers[id] = new Float32Array(data.width * data.height);
+        });
+    }
+
+    /**
+     * Remplace une bande de lignes de chaque couche par ses poids définitifs
+     * @param {Object} data - Les données de la bande
+     * @param {number} data.row - La première ligne de la bande
+     * @param {number} data.rows - Le nombre de lignes de la bande
+     * @param {number} data.width - La largeur de l'image
+     * @param {number} data.height - La hauteur de l'image
+     * @param {ArrayBuffer} data.weights ou data.indices, data.values - Les poids de la bande (voir decodeLayers)
+     * @param palette - La palette (tableau de couleurs)
+     * @returns {boolean} - true si c'était la dernière bande de l'image
+     */
+    updateTile(data, palette) {
+        this.width = data.width;
+        this.height = data.height;
+
+        const layers = this.decodeLayers(data, data.width * data.rows);
+        layers.forEach((weights, id) => {
+            const canvas = this.createCanvasForLayer({id: id, width: data.width, height: data.height});
+            const imageData = this.generateRGBAImageData(weights, data.width, data.rows, palette[id]);
+            const ctx = canvas.getContext('2d');
+            ctx.putImageData(imageData, 0, data.row);
+
+            if (!this.layers[id] || this.layers[id].length !== data.width * data.height) {
+                this.layers[id] = new Float32Array(data.width * data.height);
+            }
+            this.layers[id].set(weights, data.row * data.width);
+        });
+
+        return data.row + data.rows === data.height;
+    }
+
     /**
      * Crée ou modifie le canvas représentant la somme des couches
      */
     updateSumLayer(simplifiedPalette) {
+        this.palette = simplifiedPalette;
+
         // Pour chaque couche, on multiplie les poids par la couleur de la palette
         const imageData = new ImageData(this.width, this.height);
         const data = imageData.data;
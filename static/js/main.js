@@ -2,12 +2,13 @@ import {io} from "socket.io";
 
 import {LayerManager} from './layers.js';
 import {PaletteManager} from './palettes.js';
-import {ThreeSceneManager} from './three.js';
+import {ThreeSceneManager, decodeHull} from './three.js';
 import {TerminalManager} from './terminal.js';
 import {TooltipsManager} from './tooltips.js';
 
 // Variables globales
 let socket;
+let socketBaseUrl = ''; // Adresse HTTP du serveur socket (vide derrière le reverse proxy)
 const tooltipsManager = new TooltipsManager();
 const paletteManager = new PaletteManager();
 const layerManager = new LayerManager();
@@ -16,6 +17,7 @@ const terminalManager = new TerminalManager(threeSceneManager);
 
 // Initialisation des managers et de la connexion Socket.IO
 threeSceneManager.init();
+threeSceneManager.onPaletteEdit = onPaletteEdit;
 initWebFeatures();
 tooltipsManager.init();
 
@@ -32,7 +34,8 @@ await fetch('/get_socket_id')
             socket = io.connect(windowName, {path: '/' + data.socket_id + '/socket.io/'});
             initSocket();
         } else {
-            socket = io.connect('http://' + windowName + ':' + data.socket_port, { path: '/socket.io/' });
+            socketBaseUrl = 'http://' + windowName + ':' + data.socket_port;
+            socket = io.connect(socketBaseUrl, { path: '/socket.io/' });
             initSocket();
         }
     })
@@ -58,6 +61,9 @@ function initSocket() {
             console.error('Erreur reçue du serveur :', msg.error);
             terminalManager.logMessage('Erreur reçue du serveur : ' + msg.error, 'error');
             if (msg.reset === true) reset();
+        } else if (msg.warning) {
+            // Qualité dégradée par le serveur (charge élevée) : on explique pourquoi à l'utilisateur
+            terminalManager.logMessage('Avertissement du serveur : ' + msg.warning, 'important');
         } else {
             console.log('Message du serveur :', msg.data);
         }
@@ -77,11 +83,16 @@ function initSocket() {
     });
 
     socket.on('convex_hull', (data) => {
-        terminalManager.logMessage(`Chargement des sommets de l'enveloppe convexe contenant ${data.vertices.length} sommets...`);
-        threeSceneManager.createConvexHullCircles(data.vertices, data.faces, data.type);
+        // Enveloppe au format binaire : sommets float32 et arêtes uniques, réduite côté serveur si elle est trop grande
+        const t0 = performance.now();
+        const hull = decodeHull(data);
+        threeSceneManager.createConvexHullCircles(hull.vertices, hull.edges, data.type);
+        const kilobytes = (data.positions.byteLength + data.edges.byteLength) / 1024;
+        const reduced = hull.vertices.length < data.source_vertices ? ` (réduite à ${hull.vertices.length} pour l'affichage)` : '';
+        terminalManager.logMessage(`Enveloppe convexe de ${data.source_vertices} sommets${reduced} : ${kilobytes.toFixed(1)} Ko, affichée en ${(performance.now() - t0).toFixed(0)} ms`);
 
         // On extrait la palette reçue et on crée les éléments HTML
-        paletteManager.create(data.type, data.vertices);
+        paletteManager.create(data.type, hull.vertices);
 
         // Si on a reçu l'enveloppe convexe simplifiée, on affiche le bouton de téléchargement
         if (data.type === 'simplified') {
@@ -89,26 +100,50 @@ function initSocket() {
         }
     });
 
-    socket.on('layer_weights', (data) => {
-        // data.width, data.height, data.id, data.weights (rgba array)
+    socket.on('layer_preview', (data) => {
+        // Aperçu basse résolution des couches, remplacé au fur et à mesure par les bandes définitives
+        layerManager.showPreview(data, paletteManager.getPalette());
+    });
+
+    socket.on('layer_tile', (data) => {
+        // data.row, data.rows, data.width, data.height et les poids de la bande (denses ou creux, voir LayerManager.decodeLayers)
         const simplifiedPalette = paletteManager.getPalette();
-        layerManager.updateLayer(data, simplifiedPalette);
-        threeSceneManager.addLayerWeights(data.weights, data.id);
+        const complete = layerManager.updateTile(data, simplifiedPalette);
 
-        // Si on a reçu toutes les couches, on affiche le bouton de téléchargement
-        if (data.id === simplifiedPalette.length - 1) {
+        // Si on a reçu toutes les bandes, on affiche le bouton de téléchargement
+        if (complete) {
+            layerManager.layers.forEach((weights, id) => threeSceneManager.addLayerWeights(weights, id));
             document.getElementById('download-layers').classList.remove('hidden');
             layerManager.updateSumLayer(simplifiedPalette);
             threeSceneManager.updatePointCloud();
 
             // On avertit l'utilisateur qu'il peut modifier les couleurs de la palette
-            terminalManager.logMessage("💡 Information, vous pouvez modifier les couleurs de la palette en déplaçant les points de l'enveloppe convexe.", 'important');
+            terminalManager.logMessage("💡 Information, vous pouvez modifier les couleurs de la palette en déplaçant les points de l'enveloppe convexe (avec Maj enfoncée, les couches sont recalculées pour la nouvelle palette).", 'important');
 
             // On réactive le bouton d'harmonisation
             document.getElementById('harmonize').disabled = false;
         }
     });
 
+    socket.on('palette_sizes', (data) => {
+        // Tailles de palette calculées en une seule simplification : on peut en changer sans renvoyer l'image
+        const select = document.getElementById('palette-size');
+        select.innerHTML = '';
+        data.sizes.forEach(size => {
+            const option = document.createElement('option');
+            option.value = size;
+            option.textContent = `${size} couleurs`;
+            option.selected = size === data.selected;
+            select.appendChild(option);
+        });
+        select.classList.toggle('hidden', data.sizes.length < 2);
+    });
+
+    socket.on('decomposition', (data) => {
+        // La décomposition est conservée sur le serveur : l'image harmonisée pleine résolution y est générée
+        layerManager.setExportUrl(socketBaseUrl + data.url);
+    });
+
     socket.on('harmonized', (data) => {
         // On réactive tous les boutons d'harmonie, on prévient l'utilisateur et on stocke les harmonies
         document.querySelectorAll('.harmony-button').forEach(button => button.disabled = false);
@@ -151,7 +186,7 @@ function initSocket() {
  */
 function reset() {
     // On vide les conteneurs HTML
-    const idsToEmpty = ["initial-palette", "selected-palette", "layers-container"];
+    const idsToEmpty = ["initial-palette", "selected-palette", "palette-size", "layers-container"];
     const doNotRemoveLast = ["layers-container"];
     idsToEmpty.forEach(id => {
         const container = document.getElementById(id);
@@ -166,7 +201,7 @@ function reset() {
     // On cache les éléments HTML
     const idsToHide = [
         "previews-title", "previews-container", "original-image", "harmonized-image",
-        "palettes-title", "initial-palette", "selected-palette", "download-palettes",
+        "palettes-title", "initial-palette", "selected-palette", "palette-size", "download-palettes",
         "layers-title", "layers-container", "download-layers", "rollback-palette"
     ];
     idsToHide.forEach(id => {
@@ -188,6 +223,16 @@ function reset() {
     layerManager.reset();
 }
 
+/**
+ * Demande au serveur de recalculer les couches avec une palette modifiée dans la vue 3D.
+ * @param {number[][]} vertices - Les sommets de la palette (RGB dans [0, 1]), dans l'ordre des couches.
+ */
+function onPaletteEdit(vertices) {
+    document.getElementById('harmonize').disabled = true;
+    socket.emit('edit_palette', {palette: vertices});
+    terminalManager.logMessage("Recalcul des couches avec la palette modifiée...");
+}
+
 /**
  * Gère l'upload d'une image par l'utilisateur.
  * @param {File} file - Fichier image à uploader.
@@ -294,6 +339,17 @@ function initWebFeatures() {
         }
     });
 
+    document.getElementById('palette-size').addEventListener('change', (e) => {
+        // Le serveur recalcule les couches avec la palette de cette taille, sans refaire la simplification
+        layerManager.clearLayers();
+        threeSceneManager.weights = [];
+        document.querySelectorAll('.harmony-button').forEach(button => button.disabled = true);
+        harmonizeButton.disabled = true;
+
+        socket.emit('set_palette_size', {size: parseInt(e.target.value)});
+        terminalManager.logMessage(`Recalcul des couches avec une palette de ${e.target.value} couleurs...`);
+    });
+
     harmonizeButton.addEventListener('click', () => {
         const simplifiedPalette = paletteManager.getOriginalSimplified();
         socket.emit('harmonize', {palette: simplifiedPalette});
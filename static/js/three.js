@@ -1,13 +1,37 @@
 import * as THREE from "three";
 import {OrbitControls} from "three/examples/jsm/controls/OrbitControls.min.js";
 import {LineGeometry} from "three/examples/jsm/lines/LineGeometry.min.js";
+import {LineSegmentsGeometry} from "three/examples/jsm/lines/LineSegmentsGeometry.min.js";
 import {LineMaterial} from "three/examples/jsm/lines/LineMaterial.min.js";
 import {Line2} from "three/examples/jsm/lines/Line2.min.js";
+import {LineSegments2} from "three/examples/jsm/lines/LineSegments2.min.js";
 import Stats from "stats";
 
 // Décalage pour centrer les coordonnées RGB
 const CENTER_OFFSET = 0.5;
 
+/**
+ * Décode une enveloppe convexe reçue du serveur au format binaire.
+ * @param {Object} data - L'enveloppe reçue
+ * @param {ArrayBuffer} data.positions - Les sommets (float32, 3 par sommet)
+ * @param {ArrayBuffer} data.edges - Les arêtes (2 indices par arête, sur data.index_bytes octets)
+ * @returns {{vertices: Array<Array<number>>, edges: Uint16Array|Uint32Array}}
+ */
+function decodeHull(data) {
+    const positions = new Float32Array(data.positions);
+    const edges = data.index_bytes === 2 ? new Uint16Array(data.edges) : new Uint32Array(data.edges);
+    const vertices = [];
+    for (let i = 0; i < positions.length; i += 3) {
+        vertices.push([positions[i], positions[i + 1], positions[i + 2]]);
+    }
+    return {vertices, edges};
+}
+
+// Copie d'une enveloppe : les sommets peuvent être déplacés, les arêtes ne changent jamais
+function copyHull(hull) {
+    return {vertices: hull.vertices.map(vertex => [...vertex]), edges: hull.edges};
+}
+
 class ThreeSceneManager {
     constructor(paletteManager, layerManager) {
         this.paletteManager = paletteManager;
@@ -28,6 +52,8 @@ class ThreeSceneManager {
         this.raycaster = new THREE.Raycaster();
         this.mouse = new THREE.Vector2();
         this.selectedPoint = null;
+        // Appelée avec les sommets de la palette quand un sommet est déplacé avec Maj enfoncée
+        this.onPaletteEdit = null;
 
         this.initPaletteButtons();
     }
@@ -58,6 +84,10 @@ class ThreeSceneManager {
                 this.scene.remove(this.overlayMesh[group]);
             }
         });
+        if (this.overlayMesh.edges) {
+            this.overlayMesh.edges.geometry.dispose();
+            this.overlayMesh.edges.material.dispose();
+        }
         this.overlayMesh = {};
     }
 
@@ -71,16 +101,21 @@ class ThreeSceneManager {
     }
 
     updateAllEdges() {
-        if (!this.convexHulls.simplified) return;
-        const {faces, vertices} = this.convexHulls.simplified;
-        this.overlayMesh.edges.children.forEach((line, i) => {
-            const faceIndex = Math.floor(i / 3); // Chaque face est un triangle
-            const vertexIndex = i % 3;
-            const face = faces[faceIndex];
-            const v1 = this.getCenteredVector(vertices[face[vertexIndex]]);
-            const v2 = this.getCenteredVector(vertices[face[(vertexIndex + 1) % face.length]]);
-            line.geometry.setPositions([v1.x, v1.y, v1.z, v2.x, v2.y, v2.z]);
-        });
+        if (!this.convexHulls.simplified || !this.overlayMesh.edges) return;
+        const {vertices, edges} = this.convexHulls.simplified;
+        this.overlayMesh.edges.geometry.setPositions(this.getEdgePositions(vertices, edges));
+    }
+
+    getEdgePositions(vertices, edges) {
+        // Extrémités centrées de chaque arête, à la suite (deux sommets par segment)
+        const positions = new Float32Array(edges.length * 3);
+        for (let i = 0; i < edges.length; i++) {
+            const vertex = vertices[edges[i]];
+            positions[3 * i] = vertex[0] - CENTER_OFFSET;
+            positions[3 * i + 1] = vertex[1] - CENTER_OFFSET;
+            positions[3 * i + 2] = vertex[2] - CENTER_OFFSET;
+        }
+        return positions;
     }
 
     // ========================
@@ -93,7 +128,7 @@ class ThreeSceneManager {
             if (this.convexHulls.initial) {
                 this.createConvexHullCircles(
                     this.convexHulls.initial.vertices,
-                    this.convexHulls.initial.faces,
+                    this.convexHulls.initial.edges,
                     "initial"
                 );
             }
@@ -104,7 +139,7 @@ class ThreeSceneManager {
             this.displayedPalette = "simplified";
             this.createConvexHullCircles(
                 this.convexHulls.simplified.vertices,
-                this.convexHulls.simplified.faces,
+                this.convexHulls.simplified.edges,
                 "simplified"
             );
         });
@@ -309,16 +344,16 @@ class ThreeSceneManager {
         this.scene.add(this.pointCloud);
     }
 
-    createConvexHullCircles(vertices, faces, type = null) {
+    createConvexHullCircles(vertices, edges, type = null) {
         if (!vertices || vertices.length === 0) return;
         if (type) this.displayedPalette = type;
 
         // Stockage de l'enveloppe selon le type
         if (type === "simplified") {
-            this.convexHulls.simplified = {vertices, faces};
-            this.original.convexHulls = JSON.parse(JSON.stringify({vertices, faces}));
+            this.convexHulls.simplified = {vertices, edges};
+            this.original.convexHulls = copyHull({vertices, edges});
         } else if (type === "initial") {
-            this.convexHulls.initial = {vertices, faces};
+            this.convexHulls.initial = {vertices, edges};
         }
 
         this.clearOverlayMesh();
@@ -326,7 +361,6 @@ class ThreeSceneManager {
         // Création des groupes d'overlay
         this.overlayMesh.circle = new THREE.Object3D();
         this.overlayMesh.rims = new THREE.Object3D();
-        this.overlayMesh.edges = new THREE.Object3D();
 
         const radius = 0.02;
         const radiusRim = radius * 1.2;
@@ -352,32 +386,11 @@ class ThreeSceneManager {
             this.overlayMesh.rims.add(rim);
         });
 
-        const edgeMaterial = new LineMaterial({
-            linewidth: 3,
-            color: 0xffffff,
-            vertexColors: true,
-        });
-
-        // Fonction locale pour ajouter une arête entre deux points
-        const addEdgeToScene = (v1, v2) => {
-            const geometry = new LineGeometry();
-            const flatPoints = [v1.x, v1.y, v1.z, v2.x, v2.y, v2.z];
-            geometry.setPositions(new Float32Array(flatPoints));
-            geometry.setColors(new Float32Array([1, 1, 1, 1, 1, 1]));
-            const line = new Line2(geometry, edgeMaterial);
-            this.overlayMesh.edges.add(line);
-        };
-
-        // On crée les arêtes à partir des faces
-        faces.forEach(face => {
-            for (let i = 0; i < face.length; i++) {
-                const currentIndex = face[i];
-                const nextIndex = face[(i + 1) % face.length];
-                const v1 = this.getCenteredVector(vertices[currentIndex]);
-                const v2 = this.getCenteredVector(vertices[nextIndex]);
-                addEdgeToScene(v1, v2);
-            }
-        });
+        // Toutes les arêtes forment une seule géométrie (un seul appel de rendu)
+        const edgeGeometry = new LineSegmentsGeometry();
+        edgeGeometry.setPositions(this.getEdgePositions(vertices, edges));
+        const edgeMaterial = new LineMaterial({linewidth: 3, color: 0xffffff});
+        this.overlayMesh.edges = new LineSegments2(edgeGeometry, edgeMaterial);
 
         // Ajout des groupes à la scène
         this.scene.add(this.overlayMesh.circle);
@@ -481,6 +494,10 @@ class ThreeSceneManager {
 
     onMouseUp(event) {
         event.preventDefault();
+        // Avec Maj, le sommet déplacé devient une couleur de la palette de décomposition : les couches sont recalculées
+        if (this.selectedPoint && event.shiftKey && this.onPaletteEdit) {
+            this.onPaletteEdit(this.convexHulls.simplified.vertices);
+        }
         this.selectedPoint = null;
         document.body.style.cursor = "auto";
         this.controls.enabled = true;
@@ -499,7 +516,7 @@ class ThreeSceneManager {
         if (this.convexHulls.initial) {
             this.createConvexHullCircles(
                 this.convexHulls.initial.vertices,
-                this.convexHulls.initial.faces,
+                this.convexHulls.initial.edges,
                 "initial"
             );
         }
@@ -536,7 +553,7 @@ class ThreeSceneManager {
         this.paletteChanged = false;
 
         // Restauration de l'enveloppe simplifiée à partir des données originales
-        this.convexHulls.simplified = JSON.parse(JSON.stringify(this.original.convexHulls));
+        this.convexHulls.simplified = copyHull(this.original.convexHulls);
 
         if (palette) {
             let vertices = this.paletteManager.getPalette();
@@ -550,7 +567,7 @@ class ThreeSceneManager {
         if (this.convexHulls.simplified) {
             this.createConvexHullCircles(
                 this.convexHulls.simplified.vertices,
-                this.convexHulls.simplified.faces
+                this.convexHulls.simplified.edges
             );
         }
 
@@ -571,4 +588,4 @@ class ThreeSceneManager {
     }
 }
 
-export {ThreeSceneManager};
\ No newline at end of file
+export {ThreeSceneManager, decodeHull};
\ No newline at end of file
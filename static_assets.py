@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import Response, abort, request
+
+logger = logging.getLogger(__name__)
+
+# Dossier des fichiers statiques et préfixe de leurs URL
+STATIC_ROOT = 'static'
+STATIC_URL = '/static/'
+
+# Durée de cache des fichiers demandés avec leur empreinte (?v=...) : leur contenu ne changera jamais
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Les autres réponses sont conservées par le navigateur mais revalidées (ETag) à chaque utilisation
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Types compressés (les images webp/png sont déjà compressées) et gain minimal pour garder une version compressée
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/manifest+json',
+                      'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon', 'font/ttf', 'font/otf')
+MIN_COMPRESSION_RATIO = 0.9
+
+# Niveaux de compression : au-delà de 9, brotli est près de 20 fois plus lent (7 s pour colors.js)
+# pour moins de 7 % d'octets en moins
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Références relatives à d'autres fichiers statiques : imports des modules JS et url() des feuilles de style
+JS_IMPORT_PATTERN = re.compile(r"""((?:\bfrom|\bimport)\s*\(?\s*)(['"])(\.{1,2}/[^'"?#]+)\2""")
+CSS_URL_PATTERN = re.compile(r"""(url\(\s*)(['"]?)([^'")?#:]+)\2(\s*\))""")
+
+mimetypes.add_type('text/javascript', '.js')
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+mimetypes.add_type('font/ttf', '.ttf')
+
+try:
+    # Dépendance optionnelle : sans le paquet brotli, seules les versions gzip sont préparées
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Asset:
+    """
+    Réponse préparée une fois pour toutes : contenu, empreinte et versions compressées.
+
+    Attributs:
+      - digest: empreinte du contenu (sert d'ETag et de paramètre de version des URL)
+      - mimetype: type MIME de la réponse
+      - encodings: {codage: octets}, "identity" toujours présent, "br" et "gzip" si la compression est utile
+    """
+
+    def __init__(self, data, mimetype):
+        self.digest = hashlib.sha256(data).hexdigest()[:16]
+        self.mimetype = mimetype
+        self.encodings = {'identity': data}
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            compressed = {'gzip': gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(data, quality=BROTLI_QUALITY)
+            for encoding, body in compressed.items():
+                if len(body) < len(data) * MIN_COMPRESSION_RATIO:
+                    self.encodings[encoding] = body
+
+    def etag(self, encoding):
+        # Une ETag par représentation : la version compressée n'est pas identique octet pour octet
+        return self.digest if encoding == 'identity' else f"{self.digest}-{encoding}"
+
+    def response(self, immutable=False, conditional=True):
+        """
+        Construit la réponse à la requête en cours : 304 si le client a déjà cette version
+        (If-None-Match), sinon la version la plus compacte acceptée par le client (Accept-Encoding).
+
+        Paramètres:
+          - immutable: la réponse peut être conservée sans revalidation (URL contenant l'empreinte)
+          - conditional: répond 304 quand c'est possible (False pour une page d'erreur)
+        """
+        cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        for encoding in self.encodings:
+            if conditional and request.if_none_match.contains_weak(self.etag(encoding)):
+                response = Response(status=304)
+                break
+        else:
+            encoding = min((encoding for encoding in self.encodings
+                            if encoding == 'identity' or request.accept_encodings[encoding]),
+                           key=lambda encoding: len(self.encodings[encoding]))
+            response = Response(self.encodings[encoding], mimetype=self.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etag(encoding))
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+
+class StaticAssets:
+    """
+    Fichiers statiques chargés et compressés au démarrage du serveur Web.
+
+    Chaque fichier est servi avec son ETag (empreinte du contenu). Les URL produites par url()
+    contiennent cette empreinte (?v=...) : les réponses à ces URL sont mises en cache sans
+    revalidation, et une nouvelle version d'un fichier change son URL. Les imports relatifs des
+    modules JS et les url() des feuilles de style sont réécrits de la même façon, si bien qu'une
+    page ne charge aucun fichier périmé. Les fichiers modifiés après le démarrage ne sont pas
+    rechargés.
+    """
+
+    def __init__(self, root=STATIC_ROOT, url_prefix=STATIC_URL):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.assets = {}
+        paths = sorted(os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/')
+                       for directory, _, names in os.walk(root) for name in names)
+        for path in paths:
+            self._load(path, loading=set())
+
+        total = sum(len(asset.encodings['identity']) for asset in self.assets.values())
+        sent = sum(min(len(body) for body in asset.encodings.values()) for asset in self.assets.values())
+        logger.info("%d fichiers statiques préparés : %.1f Mo, %.1f Mo compressés", len(self.assets), total / 1e6,
+                    sent / 1e6)
+
+    def _load(self, path, loading):
+        # Les fichiers référencés sont chargés avant le fichier qui les référence : son contenu réécrit
+        # (et donc son empreinte) dépend de leurs empreintes
+        if path in self.assets:
+            return self.assets[path]
+        loading.add(path)
+        with open(os.path.join(self.root, path), 'rb') as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        def versioned(match):
+            prefix, quote, target, *suffix = match.groups()
+            resolved = posixpath.normpath(posixpath.join(posixpath.dirname(path), target))
+            if resolved in loading or not os.path.isfile(os.path.join(self.root, resolved)):
+                return match.group(0)
+            digest = self._load(resolved, loading).digest
+            return f"{prefix}{quote}{target}?v={digest}{quote}{''.join(suffix)}"
+
+        if mimetype == 'text/javascript':
+            data = JS_IMPORT_PATTERN.sub(versioned, data.decode('utf-8')).encode('utf-8')
+        elif mimetype == 'text/css':
+            data = CSS_URL_PATTERN.sub(versioned, data.decode('utf-8')).encode('utf-8')
+
+        loading.discard(path)
+        self.assets[path] = Asset(data, mimetype)
+        return self.assets[path]
+
+    def url(self, path):
+        """
+        Retourne l'URL d'un fichier statique, versionnée par son empreinte (utilisable dans les templates).
+        """
+        asset = self.assets.get(path)
+        return f"{self.url_prefix}{path}" + (f"?v={asset.digest}" if asset is not None else '')
+
+    def serve(self, path):
+        """
+        Répond à une requête de fichier statique (404 si le fichier n'existait pas au démarrage).
+        """
+        asset = self.assets.get(path)
+        if asset is None:
+            abort(404)
+        return asset.response(immutable=request.args.get('v') == asset.digest)